@@ -0,0 +1,12 @@
+import pytest
+
+
+@pytest.fixture(autouse=True, scope='session')
+def test_settings():
+    """Те же настройки, что у manage.py test (core.testing)."""
+    from django.test.utils import override_settings
+
+    from core.testing import TEST_SETTINGS
+
+    with override_settings(**TEST_SETTINGS):
+        yield
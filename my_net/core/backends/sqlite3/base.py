@@ -0,0 +1,15 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite, в котором транзакции сразу берут блокировку записи.
+
+    Обычный BEGIN откладывает блокировку до первой записи. Если за это
+    время базу изменил другой процесс, SQLite не ждёт busy_timeout, а
+    сразу отвечает «database is locked»: снимок транзакции уже
+    устарел. BEGIN IMMEDIATE ждёт своей очереди в начале транзакции.
+    Чтения вне transaction.atomic() это не затрагивает.
+    """
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,194 @@
+import re
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import profiling
+
+TEMPLATE_PREFIX = 'template.cache.'
+STATS_PREFIX = 'cache_stats:'
+PREFIXES_KEY = STATS_PREFIX + 'prefixes'
+EVENTS = ('hits', 'misses', 'evictions')
+# Ключ вытесненной записи бэкенды не сообщают
+ANY_PREFIX = '*'
+
+_MISSING = object()
+
+
+def key_prefix(key):
+    """Группа ключа: имя фрагмента шаблона или начало ключа до ':'."""
+    if key.startswith(TEMPLATE_PREFIX):
+        return key[len(TEMPLATE_PREFIX):].split('.', 1)[0]
+    return re.split(r'[:.]', key, 1)[0]
+
+
+class InstrumentedCache(BaseCache):
+    """Обёртка над любым бэкендом кэша со счётчиками по префиксам ключей.
+
+    ``OPTIONS['INNER']`` — имя другой записи в ``CACHES`` с настоящим
+    бэкендом (так её видит и ``createcachetable``). Попадания, промахи
+    и вытеснения копятся в памяти процесса и раз в
+    ``STATS_FLUSH_INTERVAL`` секунд прибавляются к общим счётчикам
+    в самом кэше, поэтому видны всем процессам.
+
+    Счётчики приблизительные: у кэша в БД и в файлах ``incr`` — это
+    чтение и запись без блокировки, и одновременные сбросы из разных
+    процессов теряют прибавки друг друга. Атомарен ``incr`` только
+    у memcached и Redis.
+    """
+
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        inner = options.pop('INNER')
+        self.flush_interval = options.pop('STATS_FLUSH_INTERVAL', 10)
+        super().__init__({**params, 'OPTIONS': options})
+        self.inner = caches[inner]
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        self._watch_culls()
+
+    @property
+    def approximate(self):
+        """Общие счётчики могут терять прибавки (incr без блокировки)."""
+        return (
+            hasattr(self.inner, '_table')
+            or hasattr(self.inner, '_list_cache_files')
+        )
+
+    def _record(self, key, event, amount=1):
+        profiling.count_cache(event, amount)
+        with self._lock:
+            self._counts[key_prefix(key), event] += amount
+            due = time.monotonic() - self._flushed_at > self.flush_interval
+        if due:
+            self.flush_stats()
+
+    def _evicted(self, amount):
+        if amount > 0:
+            self._record(ANY_PREFIX, 'evictions', amount)
+
+    def _watch_culls(self):
+        cull = getattr(self.inner, '_cull', None)
+        if cull is None:
+            # memcached и Redis вытесняют записи на сервере
+            return
+        if hasattr(self.inner, '_table'):
+            def counting_cull(db, cursor, now):
+                cull(db, cursor, now)
+                # Последний запрос _cull — DELETE вытесненных ключей,
+                # если до вытеснения дошло, иначе SELECT COUNT(*)
+                if cursor.description is None:
+                    self._evicted(cursor.rowcount)
+        elif hasattr(self.inner, '_list_cache_files'):
+            inner = self.inner
+
+            def counting_cull():
+                before = len(inner._list_cache_files())
+                if before < inner._max_entries:
+                    # _cull и сам вернулся бы, не перечисляя файлы снова
+                    return
+                cull()
+                self._evicted(before - len(inner._list_cache_files()))
+        else:
+            def counting_cull():
+                before = len(self.inner._cache)
+                cull()
+                self._evicted(before - len(self.inner._cache))
+        self.inner._cull = counting_cull
+
+    def flush_stats(self):
+        # Сбрасывает тот запрос, который застал конец интервала: это
+        # несколько записей в кэш на каждую пару (префикс, событие)
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._flushed_at = time.monotonic()
+        if not counts:
+            return
+        prefixes = set(self.inner.get(PREFIXES_KEY, []))
+        for (prefix, event), amount in counts.items():
+            prefixes.add(prefix)
+            key = f'{STATS_PREFIX}{prefix}:{event}'
+            self.inner.add(key, 0, timeout=None)
+            try:
+                self.inner.incr(key, amount)
+            except ValueError:
+                self.inner.set(key, amount, timeout=None)
+        self.inner.set(PREFIXES_KEY, sorted(prefixes), timeout=None)
+
+    def stats(self):
+        """{префикс: {'hits': …, 'misses': …, 'evictions': …}}"""
+        self.flush_stats()
+        prefixes = self.inner.get(PREFIXES_KEY, [])
+        keys = {
+            f'{STATS_PREFIX}{prefix}:{event}': (prefix, event)
+            for prefix in prefixes
+            for event in EVENTS
+        }
+        values = self.inner.get_many(list(keys))
+        result = {prefix: dict.fromkeys(EVENTS, 0) for prefix in prefixes}
+        for key, (prefix, event) in keys.items():
+            result[prefix][event] = values.get(key, 0)
+        return result
+
+    def reset_stats(self):
+        with self._lock:
+            self._counts.clear()
+        prefixes = self.inner.get(PREFIXES_KEY, [])
+        self.inner.delete_many([
+            f'{STATS_PREFIX}{prefix}:{event}'
+            for prefix in prefixes
+            for event in EVENTS
+        ] + [PREFIXES_KEY])
+
+    def get(self, key, default=None, version=None):
+        value = self.inner.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._record(key, 'misses')
+            return default
+        self._record(key, 'hits')
+        return value
+
+    def get_many(self, keys, version=None):
+        found = self.inner.get_many(keys, version=version)
+        for key in keys:
+            self._record(key, 'hits' if key in found else 'misses')
+        return found
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.add(key, value, timeout, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.set(key, value, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.set_many(data, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        return self.inner.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        return self.inner.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self.inner.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self.inner.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.inner.decr(key, delta, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+        return self.inner.clear()
+
+    def close(self, **kwargs):
+        return self.inner.close(**kwargs)
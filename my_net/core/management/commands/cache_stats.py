@@ -0,0 +1,38 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Показывает попадания, промахи и вытеснения кэша '
+            'по префиксам ключей (приблизительно: у кэша в БД и в файлах '
+            'одновременные сбросы счётчиков теряют прибавки)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счётчики после вывода'
+        )
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, 'stats'):
+            raise CommandError(
+                'Кэш по умолчанию не core.cache.InstrumentedCache')
+        stats = cache.stats()
+        self.stdout.write(
+            f'{"префикс":<24}{"попадания":>12}{"промахи":>12}'
+            f'{"доля":>8}{"вытеснения":>12}'
+        )
+        for prefix, counts in sorted(stats.items()):
+            total = counts['hits'] + counts['misses']
+            ratio = f'{counts["hits"] / total:.0%}' if total else '-'
+            self.stdout.write(
+                f'{prefix:<24}{counts["hits"]:>12}{counts["misses"]:>12}'
+                f'{ratio:>8}{counts["evictions"]:>12}'
+            )
+        if cache.approximate:
+            self.stdout.write(self.style.WARNING(
+                'Счётчики приблизительные: incr этого бэкенда не атомарен'
+            ))
+        if options['reset']:
+            cache.reset_stats()
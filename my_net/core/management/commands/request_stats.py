@@ -0,0 +1,59 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from core import profiling
+
+PERCENTILES = (50, 95, 99)
+
+
+class Command(BaseCommand):
+    help = ('Перцентили времени, SQL, шаблонов и кэша по именам URL '
+            'из выборки запросов core.profiling')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Сколько самых затратных view показать'
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Очистить выборку после вывода'
+        )
+
+    def handle(self, *args, **options):
+        views = defaultdict(list)
+        for record in profiling.samples():
+            views[record['view']].append(record)
+        # Сверху — где суммарно уходит больше всего времени
+        ranked = sorted(
+            views.items(),
+            key=lambda item: -sum(row['total_ms'] for row in item[1])
+        )
+        self.stdout.write(
+            f'{"view":<28}{"запросов":>10}'
+            + ''.join(f'{f"p{rank}, мс":>12}' for rank in PERCENTILES)
+            + f'{"SQL":>8}{"SQL, мс":>10}{"шаблоны, мс":>13}{"кэш":>7}'
+        )
+        for name, rows in ranked[:options['limit']]:
+            count = len(rows)
+            totals = [row['total_ms'] for row in rows]
+            hits = sum(row['cache_hits'] for row in rows)
+            lookups = hits + sum(row['cache_misses'] for row in rows)
+            ratio = f'{hits / lookups:.0%}' if lookups else '-'
+            self.stdout.write(
+                f'{name:<28}{count:>10}'
+                + ''.join(
+                    f'{profiling.percentile(totals, rank):>12.1f}'
+                    for rank in PERCENTILES
+                )
+                + f'{sum(row["queries"] for row in rows) / count:>8.1f}'
+                + f'{sum(row["db_ms"] for row in rows) / count:>10.1f}'
+                + f'{sum(row["template_ms"] for row in rows) / count:>13.1f}'
+                + f'{ratio:>7}'
+            )
+        if options['reset']:
+            profiling.clear()
@@ -0,0 +1,183 @@
+import json
+import logging
+import math
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.template.backends.django import Template
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+BUFFER_PREFIX = 'request_profile:'
+CURSOR_KEY = BUFFER_PREFIX + 'cursor'
+READ_CHUNK = 500
+
+_local = threading.local()
+
+
+def percentile(values, rank):
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(rank / 100 * len(ordered)) - 1, 0)]
+
+
+class Profile:
+    """Замеры одного запроса; пока он идёт, доступен через current()."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache = {'hits': 0, 'misses': 0}
+
+    def query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+def current():
+    return getattr(_local, 'profile', None)
+
+
+def count_cache(event, amount=1):
+    """Вызывается из core.cache.InstrumentedCache на каждое обращение."""
+    profile = current()
+    if profile is not None and event in profile.cache:
+        profile.cache[event] += amount
+
+
+_render = Template.render
+
+
+def _timed_render(self, context=None, request=None):
+    profile = current()
+    if profile is None:
+        return _render(self, context, request)
+    # Шаблон, отрисованный внутри другого (render_to_string в теге),
+    # уже входит во время внешнего
+    profile.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _render(self, context, request)
+    finally:
+        profile.template_depth -= 1
+        if not profile.template_depth:
+            profile.template_time += time.perf_counter() - started
+
+
+def install():
+    """Подключает замер отрисовки шаблонов (CoreConfig.ready)."""
+    Template.render = _timed_render
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # Ответ отдан до разбора URL, например из кэша страниц
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return '-'
+    return match.view_name
+
+
+def store(record):
+    """Кладёт запись в кольцевой буфер PROFILING_BUFFER_SIZE в кэше.
+
+    Буфер общий для всех процессов: номер ячейки даёт счётчик в кэше,
+    старые записи затираются новыми. ``incr`` кэша в БД не атомарен,
+    поэтому одновременные запросы могут получить одну ячейку и затереть
+    запись друг друга: буфер — выборка, а не журнал всех запросов.
+    """
+    cache.add(CURSOR_KEY, 0, timeout=None)
+    try:
+        position = cache.incr(CURSOR_KEY)
+    except ValueError:
+        return
+    slot = position % settings.PROFILING_BUFFER_SIZE
+    cache.set(f'{BUFFER_PREFIX}{slot}', record, timeout=None)
+
+
+def samples():
+    """Все записи буфера."""
+    keys = [
+        f'{BUFFER_PREFIX}{slot}'
+        for slot in range(settings.PROFILING_BUFFER_SIZE)
+    ]
+    records = []
+    for start in range(0, len(keys), READ_CHUNK):
+        records.extend(cache.get_many(keys[start:start + READ_CHUNK]).values())
+    return records
+
+
+def clear():
+    keys = [
+        f'{BUFFER_PREFIX}{slot}'
+        for slot in range(settings.PROFILING_BUFFER_SIZE)
+    ]
+    for start in range(0, len(keys), READ_CHUNK):
+        cache.delete_many(keys[start:start + READ_CHUNK])
+    cache.delete(CURSOR_KEY)
+
+
+class ProfilingMiddleware:
+    """Время запроса, SQL, шаблонов и обращения к кэшу по каждому view.
+
+    Стоит первым, поэтому видит и ответы кэша страниц. Запросы
+    считаются обёрткой execute_wrapper на всех соединениях, шаблоны —
+    вокруг Template.render бэкенда Django, кэш — счётчиками
+    InstrumentedCache. Доля PROFILING_SAMPLE_RATE запросов попадает
+    в буфер для ``manage.py request_stats``, запросы дольше
+    PROFILING_SLOW_MS — в журнал ``core.profiling`` строкой JSON.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = Profile()
+        _local.profile = profile
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(profile.query)
+                    )
+                started = time.perf_counter()
+                response = self.get_response(request)
+                total = time.perf_counter() - started
+        finally:
+            _local.profile = None
+        slow = total * 1000 >= settings.PROFILING_SLOW_MS
+        sampled = random.random() < settings.PROFILING_SAMPLE_RATE
+        if not (slow or sampled):
+            return response
+        record = {
+            'view': view_name(request),
+            'method': request.method,
+            'status': response.status_code,
+            'at': round(time.time(), 3),
+            'total_ms': round(total * 1000, 3),
+            'db_ms': round(profile.db_time * 1000, 3),
+            'queries': profile.queries,
+            'template_ms': round(profile.template_time * 1000, 3),
+            'cache_hits': profile.cache['hits'],
+            'cache_misses': profile.cache['misses'],
+        }
+        if sampled:
+            store(record)
+        if slow:
+            record['path'] = request.get_full_path()
+            logger.warning(json.dumps(record, ensure_ascii=False))
+        return response
@@ -0,0 +1,122 @@
+"""Чтение лент с реплик базы и запись в основную (DATABASE_REPLICAS)."""
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+PIN_KEY = '_db_pinned_until'
+# Реплики читают только данные приложений; кэш в БД и сессии живут
+# в основной базе и не закрепляют запрос за ней
+REPLICATED_APPS = ('auth', 'posts')
+
+_local = threading.local()
+
+
+def current():
+    """Реплика, которую читает текущий запрос, или None."""
+    return getattr(_local, 'replica', None)
+
+
+def read_from_primary():
+    """Остаток запроса читает основную базу."""
+    _local.replica = None
+
+
+def read_fresh(changed_at):
+    """Основная база, если данные менялись моложе REPLICA_PIN_SECONDS.
+
+    Так на реплику не попадают ленты, которые она могла ещё не
+    догнать: их ETag и страницы в кэше строятся по новой версии.
+    """
+    window = timedelta(seconds=settings.REPLICA_PIN_SECONDS)
+    if current() is not None and timezone.now() - changed_at < window:
+        read_from_primary()
+
+
+def copy_sqlite():
+    """Поддельная репликация: копия основного файла SQLite в реплики."""
+    source = connections['default']
+    source.ensure_connection()
+    for alias in settings.DATABASE_REPLICAS:
+        target = connections[alias]
+        target.ensure_connection()
+        source.connection.backup(target.connection)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in REPLICATED_APPS:
+            return None
+        # Не None: иначе Django прочитает связи объекта из той базы,
+        # откуда пришёл он сам, даже после read_from_primary()
+        return current() or 'default'
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in REPLICATED_APPS:
+            return None
+        # Запрос, который пишет, дальше читает свои же данные
+        _local.replica = None
+        _local.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы: связи между ними законны
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def _has_session(request):
+    # Сессию, которой не было, метка не заводит: иначе аноним получит
+    # cookie и уйдёт мимо кэша страниц
+    session = getattr(request, 'session', None)
+    return session is not None and (
+        session.session_key is not None or session.modified
+    )
+
+
+class ReplicaMiddleware:
+    """Выбирает базу для чтения и закрепляет пишущие сессии.
+
+    Стоит после сессий: метка закрепления хранится в сессии.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.replica = None
+        _local.wrote = False
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = _local.wrote
+            _local.replica = None
+        if wrote and settings.DATABASE_REPLICAS:
+            if _has_session(request):
+                request.session[PIN_KEY] = (
+                    time.time() + settings.REPLICA_PIN_SECONDS
+                )
+            if settings.REPLICATION_HOOK:
+                import_string(settings.REPLICATION_HOOK)()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or request.method not in ('GET', 'HEAD'):
+            return None
+        if request.resolver_match.view_name not in settings.REPLICA_VIEWS:
+            return None
+        session = getattr(request, 'session', {})
+        if session.get(PIN_KEY, 0) > time.time():
+            return None
+        _local.replica = random.choice(replicas)
+        return None
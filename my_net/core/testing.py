@@ -0,0 +1,25 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# Под тестами фоновой работы процесса нет: очередь миниатюр и буфер
+# комментариев разбирают сами тесты, иначе потоки писали бы в уже
+# удалённый временный MEDIA_ROOT, а выборка профилировщика меняла бы
+# число запросов
+TEST_SETTINGS = {
+    'THUMBNAIL_WORKERS': 0,
+    'PROFILING_SAMPLE_RATE': 0,
+    'COMMENT_BUFFER_INTERVAL': 0,
+}
+
+
+class TestRunner(DiscoverRunner):
+    """manage.py test с настройками TEST_SETTINGS."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = override_settings(**TEST_SETTINGS)
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,95 @@
+# core/tests/test_cache.py
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..cache import key_prefix
+
+INSTRUMENTED_LOCMEM = {
+    'default': {
+        'BACKEND': 'core.cache.InstrumentedCache',
+        'OPTIONS': {'INNER': 'shared', 'STATS_FLUSH_INTERVAL': 3600},
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'instrumented-test',
+        'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2},
+    },
+}
+
+
+@override_settings(CACHES=INSTRUMENTED_LOCMEM)
+class InstrumentedCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        cache.reset_stats()
+
+    def test_key_prefix(self):
+        """Префикс ключа: имя фрагмента или начало ключа"""
+        keys = {
+            'template.cache.index_page.d41d8cd98f': 'index_page',
+            'feed_version:group:1': 'feed_version',
+            'plain': 'plain',
+        }
+        for key, prefix in keys.items():
+            with self.subTest(key=key):
+                self.assertEqual(key_prefix(key), prefix)
+
+    def test_hits_misses_and_evictions(self):
+        """Счётчики копятся по префиксам и видны через stats()"""
+        cache.set('feed_version:global', 'a')
+        cache.get('feed_version:global')
+        cache.get('feed_version:missing')
+        cache.get_many(['feed_version:global', 'other:key'])
+        for i in range(10):
+            cache.set(f'filler:{i}', i)
+        stats = cache.stats()
+        self.assertEqual(stats['feed_version']['hits'], 2)
+        self.assertEqual(stats['feed_version']['misses'], 1)
+        self.assertEqual(stats['other']['misses'], 1)
+        self.assertGreater(stats['*']['evictions'], 0)
+
+    def test_cache_stats_command(self):
+        """Команда выводит таблицу и умеет обнулять счётчики"""
+        cache.get('follow_page:missing')
+        out = StringIO()
+        call_command('cache_stats', reset=True, stdout=out)
+        self.assertIn('follow_page', out.getvalue())
+        self.assertNotIn('приблизительные', out.getvalue())
+        self.assertEqual(cache.stats(), {})
+
+
+class FileCacheEvictionTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings = override_settings(CACHES={
+            **INSTRUMENTED_LOCMEM,
+            'shared': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': directory,
+                'OPTIONS': {'MAX_ENTRIES': 10},
+            },
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_file_evictions(self):
+        """Вытеснения файлового бэкенда считаются по числу файлов"""
+        for i in range(40):
+            cache.set(f'filler:{i}', i)
+        files = len(caches['shared']._list_cache_files())
+        evictions = cache.stats()['*']['evictions']
+        self.assertGreater(evictions, 0)
+        self.assertEqual(evictions, 40 - files)
+
+    def test_file_counts_approximate(self):
+        """Команда предупреждает, что счётчики в файлах приблизительные"""
+        out = StringIO()
+        call_command('cache_stats', stdout=out)
+        self.assertIn('Счётчики приблизительные', out.getvalue())
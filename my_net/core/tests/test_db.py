@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+
+class SqlitePragmasTests(TestCase):
+    def test_pragmas_applied(self):
+        """Каждое соединение получает прагмы SQLITE_PRAGMAS"""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(
+                cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA synchronous')
+            # NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class ConcurrentWritesTests(SimpleTestCase):
+    """Нагрузка на файл SQLite в отдельном процессе, как в работе."""
+
+    def manage(self, *args, env):
+        return subprocess.run(
+            [sys.executable, 'manage.py', *args],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            timeout=300
+        )
+
+    def test_no_locked_database(self):
+        """Параллельные add_comment и post_create проходят без ошибок"""
+        with tempfile.TemporaryDirectory() as directory:
+            env = {
+                **os.environ,
+                'MY_NET_DB': 'sqlite',
+                'MY_NET_DB_NAME': os.path.join(directory, 'stress.sqlite3'),
+                'MY_NET_CACHE': 'locmem',
+            }
+            migrate = self.manage('migrate', env=env)
+            self.assertEqual(migrate.returncode, 0, migrate.stdout)
+            stress = self.manage(
+                'stress_writes', '--threads', '6', '--writes', '20', env=env)
+            self.assertEqual(stress.returncode, 0, stress.stdout)
+            self.assertIn('ошибок: 0', stress.stdout)
@@ -0,0 +1,68 @@
+import json
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import profiling
+from .test_cache import INSTRUMENTED_LOCMEM
+
+User = get_user_model()
+
+PROFILED = {
+    'CACHES': INSTRUMENTED_LOCMEM,
+    'PROFILING_SAMPLE_RATE': 1,
+    'PROFILING_BUFFER_SIZE': 3,
+    'PROFILING_SLOW_MS': 10 ** 6,
+}
+
+
+@override_settings(**PROFILED)
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_sampled_requests(self):
+        """В выборку попадают время, SQL, шаблоны и обращения к кэшу"""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        miss, hit = sorted(profiling.samples(), key=lambda row: row['at'])
+        self.assertEqual(miss['view'], 'posts:index')
+        self.assertEqual(miss['status'], 200)
+        self.assertGreater(miss['queries'], 0)
+        self.assertGreater(miss['template_ms'], 0)
+        self.assertGreater(miss['cache_misses'], 0)
+        self.assertGreaterEqual(miss['total_ms'], miss['db_ms'])
+        # Второй ответ целиком из кэша страниц: без шаблонов
+        self.assertEqual(hit['view'], 'posts:index')
+        self.assertEqual(hit['template_ms'], 0)
+        self.assertGreater(hit['cache_hits'], 0)
+
+    def test_ring_buffer(self):
+        """Буфер хранит последние PROFILING_BUFFER_SIZE запросов"""
+        for _ in range(5):
+            self.client.get(reverse('about:author'))
+        self.assertEqual(len(profiling.samples()), 3)
+
+    @override_settings(PROFILING_SAMPLE_RATE=0, PROFILING_SLOW_MS=0)
+    def test_slow_log(self):
+        """Медленный запрос пишется в журнал строкой JSON с адресом"""
+        with self.assertLogs('core.profiling', 'WARNING') as logs:
+            self.client.get(reverse('posts:index') + '?page=2')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], '/?page=2')
+        self.assertEqual(profiling.samples(), [])
+
+    def test_request_stats_command(self):
+        """Команда сводит перцентили по именам URL"""
+        user = User.objects.create_user(username='KumKumov')
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:profile', args=[user.username]))
+        out = StringIO()
+        call_command('request_stats', reset=True, stdout=out)
+        self.assertIn('posts:index', out.getvalue())
+        self.assertIn('posts:profile', out.getvalue())
+        self.assertEqual(profiling.samples(), [])
@@ -26,11 +26,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'posts.page_cache.AnonymousPageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 #    'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -58,13 +61,83 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'my_net.wsgi.application'
 
+# База данных. По умолчанию — файл SQLite: транзакции в нём начинаются
+# с BEGIN IMMEDIATE (core.backends.sqlite3), а каждое соединение
+# получает прагмы SQLITE_PRAGMAS (core.db): WAL, чтобы чтения не ждали
+# записи, и busy_timeout, чтобы писатели ждали очереди, а не падали
+# с «database is locked». MY_NET_DB=postgres переключает на PostgreSQL
+# с параметрами из MY_NET_DB_*; за PgBouncer в режиме transaction
+# укажите MY_NET_DB_POOLER=pgbouncer. Соединения живут
+# MY_NET_DB_CONN_MAX_AGE секунд и переиспользуются между запросами.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    # Отрицательное значение — размер кэша страниц в КиБ
+    'cache_size': -64000,
+}
+DATABASE_PROFILES = {
+    'sqlite': {
+        'ENGINE': 'core.backends.sqlite3',
+        'NAME': os.environ.get(
+            'MY_NET_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')
+        ),
+        'CONN_MAX_AGE': int(os.environ.get('MY_NET_DB_CONN_MAX_AGE', 60)),
+    },
+    'postgres': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('MY_NET_DB_NAME', 'my_net'),
+        'USER': os.environ.get('MY_NET_DB_USER', 'my_net'),
+        'PASSWORD': os.environ.get('MY_NET_DB_PASSWORD', ''),
+        'HOST': os.environ.get('MY_NET_DB_HOST', '127.0.0.1'),
+        'PORT': os.environ.get('MY_NET_DB_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('MY_NET_DB_CONN_MAX_AGE', 60)),
+        # PgBouncer в режиме transaction отдаёт соединение другому
+        # клиенту после каждой транзакции: серверные курсоры
+        # .iterator() и подготовленные запросы между ними не живут
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.environ.get('MY_NET_DB_POOLER') == 'pgbouncer'
+        ),
+        'OPTIONS': {'connect_timeout': 5},
+    },
+}
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    'default': DATABASE_PROFILES[os.environ.get('MY_NET_DB', 'sqlite')],
 }
 
+# Реплики для чтения лент (core.replicas): MY_NET_DB_REPLICAS — через
+# запятую файлы SQLite или хосты PostgreSQL. Локально файлы догоняют
+# основной хуком MY_NET_DB_REPLICATION_HOOK=core.replicas.copy_sqlite
+# после каждого пишущего запроса. После записи сессия
+# REPLICA_PIN_SECONDS секунд читает основную базу; столько же ленты,
+# изменённые недавно, читаются из неё для всех
+DATABASE_REPLICAS = []
+for number, location in enumerate(
+    filter(None, os.environ.get('MY_NET_DB_REPLICAS', '').split(',')),
+    start=1
+):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST' if 'postgresql' in DATABASES['default']['ENGINE'] else 'NAME':
+            location,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+REPLICA_VIEWS = (
+    'posts:index',
+    'posts:group',
+    'posts:groups',
+    'posts:trending',
+    'posts:profile',
+    'posts:follow_index',
+    'posts:post_detail',
+)
+REPLICA_PIN_SECONDS = 5
+REPLICATION_HOOK = os.environ.get('MY_NET_DB_REPLICATION_HOOK')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -101,15 +174,171 @@ LOGOUT_REDIRECT_URL = 'posts:index'
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
-POSTS_PER_PAGE = 2
+POSTS_PER_PAGE = 10
+GROUPS_PER_PAGE = 20
+# Комментарии записи выводятся ветками по страницам; ответы глубже
+# COMMENT_MAX_DEPTH встают рядом с родителем
+COMMENTS_PER_PAGE = 20
+COMMENT_MAX_DEPTH = 5
+# Буфер комментариев (posts.comment_buffer) для вирусных записей:
+# add_comment кладёт комментарий в память процесса, фоновый поток раз
+# в COMMENT_BUFFER_INTERVAL секунд пишет пачки до COMMENT_BUFFER_BATCH.
+# При падении процесса теряется не записанное за этот интервал.
+COMMENT_BUFFER = os.environ.get('MY_NET_COMMENT_BUFFER') == '1'
+COMMENT_BUFFER_INTERVAL = 0.5
+COMMENT_BUFFER_BATCH = 200
+# Пачка, которую не удалось записать столько раз, уходит в лог ошибок
+COMMENT_BUFFER_ATTEMPTS = 3
+
+# Лента «Популярное» (posts.trending): охват автора при публикации и
+# TRENDING_COMMENT_WEIGHT за комментарий, затухающие вдвое за
+# TRENDING_HALF_LIFE секунд. Затухание и чистку ниже TRENDING_MIN_SCORE
+# делает manage.py decay_trending, его стоит запускать из cron раз
+# в несколько минут
+TRENDING_HALF_LIFE = 6 * 60 * 60
+TRENDING_COMMENT_WEIGHT = 1.0
+TRENDING_REACH_WEIGHT = 1.0
+TRENDING_MIN_SCORE = 0.05
+TRENDING_SIZE = 30
+TRENDING_BATCH_SIZE = 1000
+TRENDING_CACHE_TIMEOUT = 60
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Общий для всех процессов кэш. По умолчанию — таблица в основной базе
+# (python manage.py createcachetable), внешние сервисы не нужны.
+# MY_NET_CACHE=memcached|redis переключает на внешний сервер по адресу
+# MY_NET_CACHE_LOCATION.
+CACHE_BACKENDS = {
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cache_table',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ.get('MY_NET_CACHE_LOCATION', '127.0.0.1:11211'),
+    },
+    'redis': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ.get('MY_NET_CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.InstrumentedCache',
+        'OPTIONS': {
+            'INNER': 'shared',
+            'STATS_FLUSH_INTERVAL': 10,
+        },
+    },
+    'shared': CACHE_BACKENDS[os.environ.get('MY_NET_CACHE', 'db')],
 }
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+
+# Лента подписок: авторы, у которых подписчиков больше лимита,
+# не раскладываются по лентам при публикации, а читаются на лету.
+# Когда подписчиков снова не больше лимита, их записи раскладывает
+# manage.py catch_up_timelines (cron).
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_BATCH_SIZE = 500
+
+# Миниатюры строит очередь в БД, а не шаблон во время запроса:
+# после сохранения записи их рисует пул потоков процесса, а то, что
+# он не успел, добирает manage.py thumbnail_worker
+THUMBNAIL_BACKEND = 'posts.thumbnails.QueuedThumbnailBackend'
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_BATCH_SIZE = 100
+
+# manage.py test выключает фоновую работу процесса (core.testing)
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# Варианты картинок для <picture>/srcset: ширины в пикселях, пропорции
+# кадра ленты и качество по форматам (AVIF и WebP — если их умеет Pillow)
+IMAGE_VARIANT_WIDTHS = (320, 640, 960)
+IMAGE_VARIANT_RATIO = (960, 339)
+IMAGE_VARIANT_QUALITY = {'AVIF': 50, 'WEBP': 75, 'JPEG': 80}
+
+# Картинки записей пишутся при загрузке во временный файл под
+# MEDIA_ROOT (posts.uploads): пределы проверяются по заголовку, а
+# пересохраняются только картинки с метаданными (EXIF и т. п.), чужих
+# форматов или длиннее IMAGE_UPLOAD_MAX_SIDE по длинной стороне
+FILE_UPLOAD_HANDLERS = [
+    'posts.uploads.BoundedImageUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+IMAGE_UPLOAD_FIELD = 'image'
+IMAGE_UPLOAD_MAX_BYTES = 10 * 2 ** 20
+IMAGE_UPLOAD_MAX_PIXELS = 40_000_000
+IMAGE_UPLOAD_MAX_SIDE = 2560
+IMAGE_UPLOAD_HEADER_BYTES = 64 * 2 ** 10
+IMAGE_UPLOAD_QUALITY = 85
+
+# Поиск /search/: 'auto' выбирает FTS5 на SQLite, если он есть, иначе
+# переносимый индекс ('inverted'). Ранг BM25 вдвое теряет вес за
+# SEARCH_HALF_LIFE секунд давности
+SEARCH_BACKEND = 'auto'
+SEARCH_HALF_LIFE = 60 * 60 * 24 * 30
+
+# Списки записей и комментариев в админке: строки считаются не дальше
+# предела, дальше — оценка планировщика; результат живёт в кэше
+ADMIN_COUNT_LIMIT = 10000
+ADMIN_COUNT_CACHE_TIMEOUT = 60 * 5
+
+# Ленты отвечают 304 по ETag из версий feed_cache; HTTP_CACHE_VERSION
+# поднимают, когда меняются шаблоны. Страницы анонимов обратный прокси
+# может хранить HTTP_CACHE_SHARED_MAX_AGE секунд
+HTTP_CACHE_VERSION = 1
+HTTP_CACHE_SHARED_MAX_AGE = 60
+
+# Страницы этих лент для анонимов целиком лежат в кэше и отдаются до
+# сессий и аутентификации (posts.page_cache). Перестраивает страницу
+# один запрос; остальные ждут его до PAGE_CACHE_LOCK_WAIT секунд или
+# получают копию, устаревшую не больше чем на PAGE_CACHE_MAX_STALE
+PAGE_CACHE_VIEWS = ('posts:index', 'posts:group', 'posts:profile')
+PAGE_CACHE_LOCK_TIMEOUT = 10
+PAGE_CACHE_LOCK_WAIT = 2
+PAGE_CACHE_MAX_STALE = 30
+
+# Фрагменты лент сбрасываются версиями при записи, а не по времени
+FEED_CACHE_TIMEOUT = 60 * 60 * 4
+
+# Профилирование запросов (core.profiling): доля запросов, которые
+# попадают в кольцевой буфер в кэше для manage.py request_stats, его
+# размер и порог, с которого запрос пишется в журнал медленных.
+PROFILING_SAMPLE_RATE = 0.05
+PROFILING_BUFFER_SIZE = 5000
+PROFILING_SLOW_MS = 500
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_requests': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'core.profiling': {
+            'handlers': ['slow_requests'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
@@ -14,10 +14,11 @@ urlpatterns = [
     path('about/', include('about.urls', namespace='about')),
 ]
 if settings.DEBUG:
-    import debug_toolbar
     urlpatterns += static(
         settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
     )
+if 'debug_toolbar' in settings.INSTALLED_APPS:
+    import debug_toolbar
     urlpatterns += (path('__debug__/', include(debug_toolbar.urls)),)
 
 handler403 = 'core.views.permission_denied'
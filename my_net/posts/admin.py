@@ -1,10 +1,145 @@
+import datetime
+import hashlib
+
+from django.conf import settings
 from django.contrib import admin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Max, Min, QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import Post, Group, Comment, Follow, ThumbnailJob
+
+
+def planner_estimate(queryset):
+    """Число строк таблицы по статистике планировщика или None.
+
+    PostgreSQL и MySQL держат его в каталоге, SQLite — в sqlite_stat1
+    после ANALYZE.
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    queries = {
+        'postgresql': (
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass'
+        ),
+        'mysql': (
+            'SELECT table_rows FROM information_schema.tables '
+            'WHERE table_schema = DATABASE() AND table_name = %s'
+        ),
+        'sqlite': 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+    }
+    if connection.vendor not in queries:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(queries[connection.vendor], [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None or row[0] is None:
+        return None
+    # В sqlite_stat1 первое число строки stat — размер таблицы
+    estimate = int(float(str(row[0]).split()[0]))
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор списка админки без точного COUNT(*) больших таблиц.
+
+    Строки считаются не дальше ADMIN_COUNT_LIMIT (COUNT по подзапросу
+    с LIMIT). Если предел достигнут, для всей таблицы берётся оценка
+    планировщика, а без неё — точный COUNT; с фильтром остаётся предел.
+    Результат кэшируется на ADMIN_COUNT_CACHE_TIMEOUT секунд.
+    """
+
+    def _cache_key(self):
+        sql, params = self.object_list.query.sql_with_params()
+        digest = hashlib.md5(repr((sql, params)).encode()).hexdigest()
+        return f'admin_count:{self.object_list.model._meta.label}:{digest}'
+
+    def _count(self):
+        limit = settings.ADMIN_COUNT_LIMIT
+        queryset = self.object_list.order_by()
+        count = queryset[:limit].count()
+        if count < limit or queryset.query.where:
+            return count
+        estimate = planner_estimate(queryset)
+        if estimate is None:
+            return queryset.count()
+        return max(estimate, limit)
+
+    @cached_property
+    def count(self):
+        key = self._cache_key()
+        count = cache.get(key)
+        if count is None:
+            count = self._count()
+            cache.set(key, count, settings.ADMIN_COUNT_CACHE_TIMEOUT)
+        return count
+
 
-from .models import Post, Group, Comment, Follow
+class DateRangeQuerySet(QuerySet):
+    """Выборка списка админки с дешёвым date_hierarchy.
+
+    Обычный dates() — DISTINCT по усечённым датам всех строк выборки.
+    Здесь периоды строятся между MIN и MAX, которые читаются с краёв
+    индекса по дате; пустые периоды тоже попадают в навигацию.
+    """
+
+    def dates(self, field_name, kind, order='ASC'):
+        if kind not in ('year', 'month', 'day'):
+            return super().dates(field_name, kind, order)
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        first, last = (
+            timezone.localtime(bounds[edge]).date()
+            if settings.USE_TZ else bounds[edge].date()
+            for edge in ('first', 'last')
+        )
+        periods = []
+        day = first
+        while day <= last:
+            if kind == 'day':
+                periods.append(day)
+                day += datetime.timedelta(days=1)
+            elif kind == 'month':
+                periods.append(day.replace(day=1))
+                day = (
+                    day.replace(day=1) + datetime.timedelta(days=32)
+                ).replace(day=1)
+            else:
+                periods.append(day.replace(month=1, day=1))
+                day = day.replace(year=day.year + 1, month=1, day=1)
+        return periods[::-1] if order == 'DESC' else periods
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список для таблиц на миллионы строк.
+
+    Оценочный счётчик вместо COUNT(*), без второго COUNT по всей
+    таблице, дешёвые периоды date_hierarchy. Фильтры по дате (и
+    list_filter, и date_hierarchy) Django строит диапазоном, который
+    читается по индексу даты.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return DateRangeQuerySet(
+            model=queryset.model,
+            query=queryset.query.chain(),
+            using=queryset._db,
+            hints=queryset._hints
+        )
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(LargeTableAdmin):
     list_display = (
         'pk',
         'text',
@@ -14,17 +149,35 @@ class PostAdmin(admin.ModelAdmin):
     )
     list_display_links = ('pk', 'text')
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('author',)
     search_fields = ('text',)
     list_filter = ('pub_date', 'group',)
+    date_hierarchy = 'pub_date'
     empty_value_display = '-пусто-'
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs
+        )
+        if db_field.name == 'group':
+            # Без этого каждая строка list_editable заново читает все
+            # группы: список выбора строится один раз на запрос
+            choices = getattr(request, '_group_choices', None)
+            if choices is None:
+                choices = request._group_choices = list(formfield.choices)
+            formfield.choices = choices
+        return formfield
+
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
     list_display = (
         'title',
         'slug',
-        'description'
+        'description',
+        'post_count',
+        'last_activity'
     )
     search_fields = ('title',)
     list_filter = ('slug',)
@@ -32,7 +185,7 @@ class GroupAdmin(admin.ModelAdmin):
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = (
         'pk',
         'text',
@@ -41,8 +194,12 @@ class CommentAdmin(admin.ModelAdmin):
         'post',
     )
     list_display_links = ('pk', 'text')
+    list_select_related = ('author', 'post')
+    raw_id_fields = ('post', 'parent')
+    autocomplete_fields = ('author',)
     search_fields = ('text',)
     list_filter = ('created',)
+    date_hierarchy = 'created'
     empty_value_display = '-пусто-'
 
 
@@ -53,3 +210,15 @@ class FollowAdmin(admin.ModelAdmin):
         'author',
     )
     list_display_links = ('user', 'author')
+
+
+@admin.register(ThumbnailJob)
+class ThumbnailJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'image',
+        'status',
+        'attempts',
+        'created',
+    )
+    list_filter = ('status',)
+    search_fields = ('image',)
@@ -0,0 +1,196 @@
+"""JSON-версия лент и страницы записи: тот же курсор, ETag и 304."""
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from . import feed_cache, timeline, variants
+from .conditional import conditional, make_etag
+from .models import Comment, Post, User
+from .pagination import CursorPaginator, ThreadPaginator
+from .stats import stats_for
+from .timeline import TimelinePaginator
+
+# Меняется вместе с форматом ответа, чтобы сбросить ETag у клиентов
+API_VERSION = 1
+
+
+def serialize_user(user):
+    return {
+        'username': user.username,
+        'full_name': user.get_full_name(),
+    }
+
+
+def serialize_image(post):
+    if not post.image:
+        return None
+    manifest = variants.loads(post.image_manifest)
+    sources = {}
+    if manifest is not None and manifest.get('source') == post.image.name:
+        sources = {
+            mime: [
+                [width, default_storage.url(name)]
+                for width, name in candidates
+            ]
+            for mime, candidates in manifest['sources'].items()
+        }
+    return {'url': post.image.url, 'variants': sources}
+
+
+def serialize_post(post):
+    group = None
+    if post.group_id is not None:
+        group = {'slug': post.group.slug, 'title': post.group.title}
+    return {
+        'id': post.id,
+        'text': post.text,
+        'pub_date': post.pub_date,
+        'author': serialize_user(post.author),
+        'group': group,
+        'image': serialize_image(post),
+    }
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.id,
+        'text': comment.text,
+        'created': comment.created,
+        'author': serialize_user(comment.author),
+        'parent': comment.parent_id,
+        'depth': comment.depth,
+    }
+
+
+def serialize_page(page, serialize):
+    return {
+        'results': [serialize(obj) for obj in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+def _feed_metadata(request, *scopes, viewer=''):
+    # Дата — время сброса версий, как у HTML-лент: удаление записи
+    # не откатывает Last-Modified назад
+    version = feed_cache.versions(*scopes)
+    etag = make_etag(API_VERSION, viewer, version, request.get_full_path())
+    return etag, feed_cache.modified(version)
+
+
+def _respond(data, private=False):
+    response = JsonResponse(data)
+    # Кэшировать можно, но каждый раз переспрашивая по ETag
+    patch_cache_control(response, no_cache=True, private=private)
+    if private:
+        patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def _feed(request, queryset, paginator_class=CursorPaginator):
+    page = paginator_class(
+        queryset, settings.POSTS_PER_PAGE
+    ).cursor_page(request.GET.get('cursor'))
+    return serialize_page(page, serialize_post)
+
+
+def index_metadata(request):
+    return _feed_metadata(request, feed_cache.GLOBAL)
+
+
+@conditional(index_metadata)
+def index(request):
+    return _respond(_feed(request, Post.objects.for_feed()))
+
+
+def group_metadata(request, slug):
+    group = feed_cache.group_by_slug(slug)
+    if group is None:
+        return None, None
+    return _feed_metadata(request, feed_cache.group(group.id))
+
+
+@conditional(group_metadata)
+def group_posts(request, slug):
+    group = feed_cache.group_by_slug(slug)
+    if group is None:
+        raise Http404
+    data = _feed(request, Post.objects.filter(group_id=group.id).for_feed())
+    data['group'] = {
+        'slug': group.slug,
+        'title': group.title,
+        'description': group.description,
+    }
+    return _respond(data)
+
+
+def profile_metadata(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'id', flat=True
+    ).first()
+    if author_id is None:
+        return None, None
+    return _feed_metadata(request, feed_cache.author(author_id))
+
+
+@conditional(profile_metadata)
+def profile(request, username):
+    author = get_object_or_404(
+        User.objects.select_related('stats'),
+        username=username
+    )
+    data = _feed(request, author.posts.for_feed())
+    data['author'] = {
+        **serialize_user(author),
+        'post_count': stats_for(author).post_count,
+    }
+    return _respond(data)
+
+
+def follow_metadata(request):
+    if not request.user.is_authenticated:
+        return None, None
+    hot_ids = list(
+        timeline.hot_authors(request.user).values_list('author', flat=True)
+    )
+    scopes = [
+        feed_cache.follower(request.user.id),
+        *map(feed_cache.author, hot_ids),
+    ]
+    return _feed_metadata(request, *scopes, viewer=request.user.id)
+
+
+@conditional(follow_metadata)
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'detail': 'Нужно войти'}, status=401)
+    return _respond(
+        _feed(request, request.user, TimelinePaginator), private=True
+    )
+
+
+def post_metadata(request, post_id):
+    author_id = Post.objects.filter(id=post_id).values_list(
+        'author_id', flat=True
+    ).first()
+    if author_id is None:
+        return None, None
+    return _feed_metadata(
+        request, feed_cache.author(author_id), feed_cache.comments(post_id)
+    )
+
+
+@conditional(post_metadata)
+def post_detail(request, post_id):
+    post = get_object_or_404(Post.objects.for_feed(), id=post_id)
+    comments = ThreadPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        settings.COMMENTS_PER_PAGE
+    ).cursor_page(request.GET.get('cursor'))
+    return _respond({
+        'post': serialize_post(post),
+        'post_count': stats_for(post.author).post_count,
+        'comments': serialize_page(comments, serialize_comment),
+    })
@@ -0,0 +1,342 @@
+"""Замеры основных страниц: задержка, число SQL-запросов, память."""
+import itertools
+import statistics
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from core.profiling import percentile
+
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+RESULT_VERSION = 1
+PERCENTILES = (50, 90, 99)
+# tracemalloc замедляет Python в разы: задержка меряется без него,
+# а пик памяти — отдельными запросами
+MEMORY_SAMPLES = 3
+QUERIES_HEADER = 'X-Benchmark-Queries'
+MEMORY_HEADER = 'X-Benchmark-Memory'
+# Разница меньше этих порогов — шум, а не регрессия
+MIN_LATENCY_DELTA = 1.0
+MIN_MEMORY_DELTA = 64
+
+
+class Scenario:
+    def __init__(self, name, url, method='GET', login=False, data=None):
+        self.name = name
+        self.url = url
+        self.method = method
+        self.login = login
+        self.data = data
+
+
+SCENARIOS = (
+    Scenario('index', lambda target: reverse('posts:index')),
+    Scenario('group_posts', lambda target: reverse(
+        'posts:group', args=[target.group.slug]
+    )),
+    Scenario('profile', lambda target: reverse(
+        'posts:profile', args=[target.author.username]
+    )),
+    Scenario('post_detail', lambda target: reverse(
+        'posts:post_detail', args=[target.post.id]
+    )),
+    Scenario(
+        'follow_index',
+        lambda target: reverse('posts:follow_index'),
+        login=True
+    ),
+    Scenario(
+        'add_comment',
+        lambda target: reverse('posts:add_comment', args=[target.post.id]),
+        method='POST',
+        login=True,
+        data=lambda target, number: {'text': f'Замер, комментарий {number}'}
+    ),
+    Scenario(
+        'post_create',
+        lambda target: reverse('posts:post_create'),
+        method='POST',
+        login=True,
+        data=lambda target, number: {
+            'text': f'Замер, запись {number}',
+            'group': target.group.id,
+        }
+    ),
+)
+SCENARIO_NAMES = tuple(scenario.name for scenario in SCENARIOS)
+
+
+class Target:
+    """Самые тяжёлые объекты набора: на них страницы медленнее всего."""
+
+    def __init__(self):
+        stats = AuthorStats.objects.select_related('user')
+        self.author = stats.order_by('-post_count').first().user
+        self.viewer = stats.order_by('-following_count').first().user
+        self.group = Group.objects.annotate(
+            total=Count('groups')
+        ).order_by('-total').first()
+        self.post = Post.objects.filter(
+            author=self.author
+        ).order_by('-pub_date').first()
+
+
+def dataset():
+    return {
+        'users': User.objects.count(),
+        'groups': Group.objects.count(),
+        'posts': Post.objects.count(),
+        'comments': Comment.objects.count(),
+        'follows': Follow.objects.count(),
+    }
+
+
+@contextmanager
+def probe(memory=False):
+    """Считает SQL-запросы и пик памяти Python внутри блока.
+
+    Запросы считаются на соединении текущего потока, поэтому для
+    WSGI-сервера probe работает в его потоке (см. ``instrument``).
+    """
+    result = {'queries': 0, 'memory': None}
+
+    def count(execute, sql, params, many, context):
+        result['queries'] += 1
+        return execute(sql, params, many, context)
+
+    with ExitStack() as stack:
+        stack.enter_context(connection.execute_wrapper(count))
+        if memory:
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            stack.callback(lambda: result.update(
+                memory=tracemalloc.get_traced_memory()[1] - start
+            ))
+        yield result
+
+
+def instrument(application):
+    """WSGI-приложение, отдающее замеры в заголовках ответа.
+
+    Ответ Django готов к возврату из приложения, поэтому start_response
+    вызывается после замера — уже с заголовками QUERIES_HEADER и
+    MEMORY_HEADER.
+    """
+    def wrapper(environ, start_response):
+        started = []
+
+        def defer(status, headers, exc_info=None):
+            started[:] = [status, list(headers), exc_info]
+
+        with probe(tracemalloc.is_tracing()) as result:
+            body = application(environ, defer)
+        status, headers, exc_info = started
+        headers += [
+            (QUERIES_HEADER, str(result['queries'])),
+            (MEMORY_HEADER, str(result['memory'] or 0)),
+        ]
+        start_response(status, headers, exc_info)
+        return body
+
+    return wrapper
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class ClientTransport:
+    """Тестовый клиент Django: весь стек middleware, но без сети."""
+
+    name = 'client'
+
+    def __init__(self, target, host):
+        self.anonymous = Client(HTTP_HOST=host)
+        self.user = Client(HTTP_HOST=host)
+        self.user.force_login(target.viewer)
+
+    def request(self, scenario, url, data, memory=False):
+        client = self.user if scenario.login else self.anonymous
+        started = time.perf_counter()
+        with probe(memory) as result:
+            if scenario.method == 'POST':
+                response = client.post(url, data)
+            else:
+                response = client.get(url)
+        elapsed = time.perf_counter() - started
+        return (
+            response.status_code, elapsed, result['queries'], result['memory']
+        )
+
+    def close(self):
+        pass
+
+
+class WsgiTransport:
+    """Локальный WSGI-сервер в потоке и запросы к нему по HTTP."""
+
+    name = 'wsgi'
+
+    def __init__(self, target, host):
+        self.host = host
+        self.server = make_server(
+            '127.0.0.1', 0, instrument(get_wsgi_application()),
+            handler_class=QuietHandler
+        )
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+        self.thread.start()
+        # Сессию и CSRF-токен берём у тестового клиента: сервер тот же
+        client = Client(HTTP_HOST=host)
+        client.force_login(target.viewer)
+        client.get(reverse('posts:post_create'))
+        self.csrf_token = client.cookies['csrftoken'].value
+        self.cookie = '; '.join(
+            f'{name}={morsel.value}' for name, morsel in client.cookies.items()
+        )
+
+    def request(self, scenario, url, data, memory=False):
+        headers = {'Host': self.host}
+        body = None
+        if scenario.login:
+            headers['Cookie'] = self.cookie
+        if scenario.method == 'POST':
+            body = urlencode({**data, 'csrfmiddlewaretoken': self.csrf_token})
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        started = time.perf_counter()
+        http = HTTPConnection(*self.server.server_address)
+        try:
+            http.request(scenario.method, url, body, headers)
+            response = http.getresponse()
+            response.read()
+        finally:
+            http.close()
+        elapsed = time.perf_counter() - started
+        return (
+            response.status,
+            elapsed,
+            int(response.getheader(QUERIES_HEADER, 0)),
+            int(response.getheader(MEMORY_HEADER, 0)) if memory else None
+        )
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+TRANSPORT_CLASSES = {
+    transport.name: transport for transport in (ClientTransport, WsgiTransport)
+}
+
+
+def measure(transport, scenario, target, requests, warmup):
+    url = scenario.url(target)
+    numbers = itertools.count()
+
+    def call(memory=False):
+        data = None
+        if scenario.data is not None:
+            data = scenario.data(target, next(numbers))
+        return transport.request(scenario, url, data, memory)
+
+    for _ in range(warmup):
+        call()
+    statuses = Counter()
+    latencies = []
+    queries = 0
+    for _ in range(requests):
+        status, elapsed, count, _ = call()
+        statuses[status] += 1
+        latencies.append(elapsed * 1000)
+        queries = max(queries, count)
+    tracemalloc.start()
+    try:
+        memory = max(call(memory=True)[3] for _ in range(MEMORY_SAMPLES))
+    finally:
+        tracemalloc.stop()
+    latency = {
+        f'p{rank}': round(percentile(latencies, rank), 3)
+        for rank in PERCENTILES
+    }
+    latency['mean'] = round(statistics.mean(latencies), 3)
+    return {
+        'statuses': {
+            str(status): total for status, total in sorted(statuses.items())
+        },
+        'latency_ms': latency,
+        'queries': queries,
+        'memory_kib': round(memory / 1024, 1),
+    }
+
+
+def run(names=SCENARIO_NAMES, transports=('client',), requests=50,
+        warmup=5, host='localhost'):
+    """Прогон выбранных сценариев; результат готов для json.dump."""
+    target = Target()
+    scenarios = [scenario for scenario in SCENARIOS if scenario.name in names]
+    results = {}
+    for name in transports:
+        transport = TRANSPORT_CLASSES[name](target, host)
+        try:
+            for scenario in scenarios:
+                results[f'{name}:{scenario.name}'] = measure(
+                    transport, scenario, target, requests, warmup
+                )
+        finally:
+            transport.close()
+    return {
+        'version': RESULT_VERSION,
+        'created': timezone.now().isoformat(),
+        'requests': requests,
+        'dataset': dataset(),
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """Регрессии относительно базового прогона, строками.
+
+    Задержка (p90) и память сравниваются с допуском ``tolerance``,
+    число запросов и коды ответов — точно.
+    """
+    regressions = []
+    for key, now in current['results'].items():
+        before = baseline['results'].get(key)
+        if before is None:
+            continue
+        if set(now['statuses']) != set(before['statuses']):
+            regressions.append(
+                f'{key}: коды ответов {", ".join(before["statuses"])} -> '
+                f'{", ".join(now["statuses"])}'
+            )
+        if now['queries'] > before['queries']:
+            regressions.append(
+                f'{key}: запросов {before["queries"]} -> {now["queries"]}'
+            )
+        for field, section, minimum, unit in (
+            ('p90', 'latency_ms', MIN_LATENCY_DELTA, 'мс'),
+            ('memory_kib', None, MIN_MEMORY_DELTA, 'КиБ'),
+        ):
+            old = before[section][field] if section else before[field]
+            new = now[section][field] if section else now[field]
+            if new > old * (1 + tolerance) and new - old > minimum:
+                regressions.append(
+                    f'{key}: {field} {old} -> {new} {unit}'
+                )
+    return regressions
@@ -0,0 +1,234 @@
+"""Буфер комментариев: приём в память процесса, запись пачками."""
+import atexit
+import logging
+import threading
+import uuid
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import feed_cache, search, trending
+from .models import COMMENT_ROOT, COMMENT_SEGMENT, Comment, Post, User
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = 'pending_comments'
+# Неподтверждённый комментарий старше этого, скорее всего, потерян
+# вместе с процессом: из сессии он уходит
+PENDING_TTL = timedelta(minutes=1)
+
+_buffer = deque()
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_wake = threading.Event()
+_writer = None
+
+
+def submit(request, comment):
+    """Принимает проверенный комментарий без записи в базу.
+
+    ``comment.parent`` уже выбран reply_parent и загружен с путём.
+    """
+    with _lock:
+        comment.created = timezone.now()
+        _buffer.append(comment)
+        size = len(_buffer)
+    request.session[SESSION_KEY] = request.session.get(SESSION_KEY, []) + [{
+        'post': comment.post_id,
+        'parent': comment.parent_id,
+        'depth': comment.parent.depth + 1 if comment.parent else 0,
+        'text': comment.text,
+        'created': comment.created.isoformat(),
+    }]
+    if not settings.COMMENT_BUFFER_INTERVAL:
+        # Без фонового потока буфер разбирает flush(): тесты, команды
+        return
+    _start_writer()
+    if size >= settings.COMMENT_BUFFER_BATCH:
+        _wake.set()
+
+
+def _start_writer():
+    global _writer
+    with _lock:
+        if _writer is not None:
+            return
+        _writer = threading.Thread(
+            target=_write_forever, name='comment-buffer', daemon=True
+        )
+        _writer.start()
+
+
+def _write_forever():
+    while True:
+        _wake.wait(settings.COMMENT_BUFFER_INTERVAL)
+        _wake.clear()
+        try:
+            while flush() >= settings.COMMENT_BUFFER_BATCH:
+                pass
+        except Exception:
+            logger.exception('Буфер комментариев: запись отложена')
+        finally:
+            connection.close()
+
+
+def flush():
+    """Пишет одну пачку буфера, возвращает число принятых в ней.
+
+    Если запись не удалась, пачка возвращается в начало буфера; после
+    COMMENT_BUFFER_ATTEMPTS неудач она уходит в лог ошибок, чтобы
+    не держать комментарии за ней.
+    """
+    with _flush_lock:
+        with _lock:
+            size = min(len(_buffer), settings.COMMENT_BUFFER_BATCH)
+            batch = [_buffer.popleft() for _ in range(size)]
+        if not batch:
+            return 0
+        try:
+            written = write(batch)
+        except Exception:
+            _requeue(batch)
+            raise
+    search.index(*map(search.comment_document, written))
+    feed_cache.bump(*{
+        feed_cache.comments(comment.post_id) for comment in written
+    })
+    trending.add_comments(comment.post_id for comment in written)
+    return len(batch)
+
+
+def _requeue(batch):
+    retry = []
+    for comment in batch:
+        comment.buffer_attempts = getattr(comment, 'buffer_attempts', 0) + 1
+        if comment.buffer_attempts < settings.COMMENT_BUFFER_ATTEMPTS:
+            retry.append(comment)
+        else:
+            logger.error(
+                'Буфер комментариев: комментарий отброшен после %s '
+                'попыток: %r',
+                comment.buffer_attempts,
+                {
+                    'post': comment.post_id,
+                    'author': comment.author_id,
+                    'parent': comment.parent_id,
+                    'created': comment.created.isoformat(),
+                    'text': comment.text,
+                }
+            )
+    with _lock:
+        _buffer.extendleft(reversed(retry))
+
+
+def flush_all():
+    while flush():
+        pass
+
+
+# При обычной остановке буфер дописывается; падение процесса теряет
+# не больше COMMENT_BUFFER_INTERVAL секунд приёма
+atexit.register(flush_all)
+
+
+def write(comments):
+    """Вставляет комментарии с путями в ветках одной транзакцией.
+
+    Путь включает id, поэтому строки вставляются с временными путями,
+    а настоящие пути пишутся вторым UPDATE по id из базы — вместе
+    с датами приёма, которые при вставке заменяет auto_now_add.
+    Комментарии к записям и веткам и комментарии авторов, удалённых,
+    пока они ждали в буфере, пропадают, как пропали бы каскадом.
+    Сигналы post_save не шлются: их работу делает flush().
+    """
+    with transaction.atomic():
+        posts = set(Post.objects.filter(
+            id__in={comment.post_id for comment in comments}
+        ).values_list('id', flat=True))
+        parents = dict(Comment.objects.filter(
+            id__in={comment.parent_id for comment in comments} - {None}
+        ).values_list('id', 'path'))
+        authors = set(User.objects.filter(
+            id__in={comment.author_id for comment in comments}
+        ).values_list('id', flat=True))
+        comments = [
+            comment for comment in comments
+            if comment.post_id in posts
+            and comment.author_id in authors
+            and (comment.parent_id is None or comment.parent_id in parents)
+        ]
+        if not comments:
+            return comments
+        # Временный путь метит строки пачки, пока у них нет id
+        marker = uuid.uuid4().hex
+        for number, comment in enumerate(comments):
+            comment.path = f'{marker}-{number}'
+        accepted = [comment.created for comment in comments]
+        Comment.objects.bulk_create(comments)
+        for comment, created in zip(comments, accepted):
+            comment.created = created
+        if not connection.features.can_return_ids_from_bulk_insert:
+            ids = dict(Comment.objects.filter(
+                post_id__in={comment.post_id for comment in comments},
+                path__in=[comment.path for comment in comments]
+            ).values_list('path', 'id'))
+            for comment in comments:
+                comment.id = ids[comment.path]
+        for comment in comments:
+            comment.path = _path(comment, parents)
+        Comment.objects.bulk_update(comments, ['path', 'created'])
+    return comments
+
+
+def _path(comment, parents):
+    if comment.parent_id is None:
+        return f'{COMMENT_ROOT - comment.id:0{COMMENT_SEGMENT}d}'
+    return parents[comment.parent_id] + f'{comment.id:0{COMMENT_SEGMENT}d}'
+
+
+def pending(request, post):
+    """Свои комментарии к ``post``, которые ещё ждут в буфере.
+
+    Записанные и слишком старые уходят из сессии. Пока ждущих нет,
+    запросов к базе тоже нет.
+    """
+    entries = request.session.get(SESSION_KEY)
+    if not entries:
+        return []
+    dates = [parse_datetime(entry['created']) for entry in entries]
+    mine = [
+        date for entry, date in zip(entries, dates)
+        if entry['post'] == post.id
+    ]
+    written = set()
+    if mine:
+        written = set(Comment.objects.filter(
+            post=post, author=request.user, created__in=mine
+        ).values_list('created', flat=True))
+    expired = timezone.now() - PENDING_TTL
+    keep = [
+        (entry, date) for entry, date in zip(entries, dates)
+        if date > expired
+        and not (entry['post'] == post.id and date in written)
+    ]
+    if len(keep) != len(entries):
+        request.session[SESSION_KEY] = [entry for entry, _ in keep]
+    comments = []
+    # Новые сверху, как новые ветки в списке
+    for entry, date in reversed(keep):
+        if entry['post'] != post.id:
+            continue
+        comment = Comment(
+            post=post,
+            author=request.user,
+            parent_id=entry['parent'],
+            text=entry['text'],
+            created=date
+        )
+        comment.pending_depth = entry['depth']
+        comments.append(comment)
+    return comments
@@ -0,0 +1,79 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers
+)
+from django.utils.http import http_date, quote_etag
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def make_etag(*parts):
+    """Сильный ETag из частей: версий лент, курсора, формата ответа."""
+    raw = '|'.join(str(part) for part in parts)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def conditional(metadata):
+    """Отвечает 304 по ETag и Last-Modified, не вызывая view.
+
+    ``metadata(request, *args, **kwargs)`` возвращает пару
+    (etag, last_modified) из дешёвых данных — версий feed_cache и
+    времени их сброса — или (None, None), если ответить заранее
+    нельзя (например, объекта нет и view вернёт 404). Заголовки
+    ставятся и на полный ответ, чтобы клиент мог переспросить.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in SAFE_METHODS:
+                return view(request, *args, **kwargs)
+            etag, last_modified = metadata(request, *args, **kwargs)
+            if etag is not None:
+                etag = quote_etag(etag)
+            if last_modified is not None:
+                last_modified = int(last_modified.timestamp())
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                return response
+            if etag is not None and not response.has_header('ETag'):
+                response['ETag'] = etag
+            if (
+                last_modified is not None
+                and not response.has_header('Last-Modified')
+            ):
+                response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def viewer_cache_control(view):
+    """Cache-Control страниц, которые зависят только от входа.
+
+    Страницу анонима может хранить общий кэш (обратный прокси) до
+    HTTP_CACHE_SHARED_MAX_AGE секунд, браузер — переспрашивает.
+    Страница вошедшего пользователя — только в его браузере и тоже с
+    переспросом по ETag. Vary: Cookie разводит одних с другими.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if response.status_code not in (200, 304):
+            return response
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(
+                response, public=True, max_age=0,
+                s_maxage=settings.HTTP_CACHE_SHARED_MAX_AGE
+            )
+        patch_vary_headers(response, ('Cookie',))
+        return response
+    return wrapper
@@ -0,0 +1,130 @@
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import timeline
+from .models import Follow, Group, Post
+
+GLOBAL = ('global',)
+GROUP_KEY = 'group_by_slug:'
+# Поля группы, которые нужны её ленте
+GROUP_FIELDS = ('title', 'slug', 'description')
+
+
+def group(group_id):
+    return ('group', group_id)
+
+
+def author(author_id):
+    return ('author', author_id)
+
+
+def follower(user_id):
+    return ('follower', user_id)
+
+
+def comments(post_id):
+    return ('comments', post_id)
+
+
+def _key(scope):
+    return 'feed_version:' + ':'.join(str(part) for part in scope)
+
+
+def _fresh():
+    # Новое значение никогда не совпадает со старым, даже если ключ
+    # версии был вытеснен из кэша и создаётся заново
+    return format(time.time_ns(), 'x')
+
+
+def versions(*scopes):
+    """Строка версий для ключа фрагмента кэша."""
+    keys = [_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = {key: _fresh() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return '.'.join(found[key] for key in keys)
+
+
+def modified(version):
+    """Время последнего изменения лент по строке versions().
+
+    Токен версии — время сброса в наносекундах; вытесненный из кэша
+    ключ получает новое время, что только сдвигает дату вперёд.
+    """
+    newest = max(int(token, 16) for token in version.split('.'))
+    return datetime.fromtimestamp(newest / 10 ** 9, timezone.utc)
+
+
+def bump(*scopes):
+    """Делает недействительными все фрагменты с этими версиями."""
+    token = _fresh()
+    cache.set_many(
+        {_key(scope): token for scope in scopes},
+        timeout=None
+    )
+
+
+def context(*scopes):
+    return {
+        'feed_version': versions(*scopes),
+        'feed_cache_timeout': settings.FEED_CACHE_TIMEOUT,
+    }
+
+
+def group_by_slug(slug):
+    """Группа по slug из кэша или None.
+
+    Лента группы берёт из неё только id, заголовок и описание:
+    их меняет лишь правка группы, которая сбрасывает ключ
+    (forget_group), а счётчики группы сюда не попадают.
+    """
+    key = GROUP_KEY + slug
+    group = cache.get(key)
+    if group is None:
+        group = Group.objects.only(*GROUP_FIELDS).filter(slug=slug).first()
+        if group is not None:
+            cache.set(key, group, settings.FEED_CACHE_TIMEOUT)
+    return group
+
+
+def forget_group(*slugs):
+    cache.delete_many([GROUP_KEY + slug for slug in slugs if slug])
+
+
+def post_scopes(post, group_ids=()):
+    """Ленты, в которых видна запись."""
+    scopes = [GLOBAL, author(post.author_id)]
+    scopes += [
+        group(group_id)
+        for group_id in {post.group_id, *group_ids}
+        if group_id is not None
+    ]
+    if timeline.is_hot(post.author_id):
+        # Ленты подписчиков «горячего» автора зависят от его версии
+        return scopes
+    followers = Follow.objects.filter(
+        author=post.author_id
+    ).values_list('user_id', flat=True)
+    scopes += [follower(user_id) for user_id in followers.iterator()]
+    return scopes
+
+
+def group_post_scopes(group_id):
+    """Ленты, где записи группы показаны с её заголовком и slug."""
+    authors = Post.objects.filter(group=group_id).order_by().values(
+        'author'
+    ).distinct()
+    readers = Follow.objects.filter(author__in=authors).exclude(
+        # Подписчики «горячих» авторов читают их версию author()
+        timeline.hot_condition('author__stats__')
+    ).order_by().values_list('user_id', flat=True).distinct()
+    return [
+        GLOBAL,
+        *(author(row['author']) for row in authors),
+        *map(follower, readers.iterator()),
+    ]
@@ -1,6 +1,7 @@
 from django import forms
 
 from .models import Post, Comment
+from .uploads import RejectedImage
 
 
 class PostForm(forms.ModelForm):
@@ -8,6 +9,23 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image',)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Картинку, отклонённую при загрузке (posts.uploads), поле не
+        # видит: вместо общей ошибки Pillow покажем причину отказа
+        self.image_error = None
+        upload = self.files.get('image')
+        if isinstance(upload, RejectedImage):
+            self.image_error = upload.error
+            self.files = self.files.copy()
+            del self.files['image']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.image_error:
+            self.add_error('image', self.image_error)
+        return cleaned_data
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,106 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Меряет задержку, число SQL-запросов и память страниц лент, '
+            'записи, комментариев и публикации. Сценарии add_comment и '
+            'post_create пишут в базу: запускайте на копии (seed_posts)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--views',
+            nargs='+',
+            choices=benchmark.SCENARIO_NAMES,
+            default=benchmark.SCENARIO_NAMES,
+            help='Какие страницы мерить'
+        )
+        parser.add_argument(
+            '--transport',
+            nargs='+',
+            choices=benchmark.TRANSPORT_CLASSES,
+            default=['client'],
+            help='client — тестовый клиент, wsgi — локальный HTTP-сервер'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=50,
+            help='Сколько замеряемых запросов на страницу'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=5,
+            help='Сколько запросов сделать до замера'
+        )
+        parser.add_argument(
+            '--host',
+            default='localhost',
+            help='Заголовок Host; должен быть в ALLOWED_HOSTS'
+        )
+        parser.add_argument(
+            '--output',
+            help='Куда сохранить результат в JSON'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON прошлого прогона для сравнения'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Допустимый рост задержки и памяти, доля'
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+        result = benchmark.run(
+            names=options['views'],
+            transports=options['transport'],
+            requests=options['requests'],
+            warmup=options['warmup'],
+            host=options['host']
+        )
+        self.report(result)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+        if baseline is None:
+            return
+        regressions = benchmark.compare(
+            result, baseline, options['tolerance']
+        )
+        if regressions:
+            raise CommandError(
+                'Регрессии относительно базового прогона:\n'
+                + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def report(self, result):
+        columns = (
+            ['страница'] + [f'p{rank}' for rank in benchmark.PERCENTILES]
+            + ['запросов', 'КиБ', 'коды']
+        )
+        rows = [columns]
+        for key, row in result['results'].items():
+            rows.append(
+                [key]
+                + [str(row['latency_ms'][f'p{rank}'])
+                   for rank in benchmark.PERCENTILES]
+                + [str(row['queries']), str(row['memory_kib']),
+                   ','.join(row['statuses'])]
+            )
+        widths = [max(map(len, column)) for column in zip(*rows)]
+        for row in rows:
+            self.stdout.write('  '.join(
+                value.ljust(width) for value, width in zip(row, widths)
+            ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import AuthorStats
+
+
+class Command(BaseCommand):
+    help = ('Раскладывает по лентам записи авторов, опустившихся '
+            'до TIMELINE_FANOUT_LIMIT (запускать из cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Сколько записей раскладывать за проход '
+                 '(по умолчанию TIMELINE_BATCH_SIZE)'
+        )
+
+    def handle(self, *args, **options):
+        authors = AuthorStats.objects.filter(
+            timeline_pending=True
+        ).values_list('user_id', flat=True)
+        done = written = 0
+        for author in list(authors):
+            written += timeline.catch_up(author, options['batch_size'])
+            done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Авторов: {done}, строк лент: {written}'
+        ))
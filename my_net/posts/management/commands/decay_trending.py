@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = 'Затухание рейтингов ленты «Популярное» (запускать из cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Сколько строк обновлять одним UPDATE '
+                 '(по умолчанию TRENDING_BATCH_SIZE)'
+        )
+
+    def handle(self, *args, **options):
+        updated, removed = trending.decay(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено рейтингов: {updated}, удалено затухших: {removed}'
+        ))
@@ -0,0 +1,49 @@
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import thumbnails
+from posts.models import Post
+
+# Имя, которое уже выдало ContentAddressedStorage
+HASHED = re.compile(r'/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки, загруженные до ContentAddressedStorage, '
+            'под имена по содержимому и удаляет дубликаты')
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        legacy = (
+            Post.objects.exclude(image='')
+            .order_by('image')
+            .values_list('image', flat=True)
+            .distinct()
+        )
+        moved = missing = 0
+        names = [name for name in legacy.iterator() if not HASHED.search(name)]
+        for start in range(0, len(names), settings.THUMBNAIL_BATCH_SIZE):
+            batch = names[start:start + settings.THUMBNAIL_BATCH_SIZE]
+            renamed = []
+            for name in batch:
+                if not storage.exists(name):
+                    missing += 1
+                    continue
+                # Новое имя заблокировано, пока записи на него не сошлются
+                with transaction.atomic(), storage.open(name) as file:
+                    new_name = storage.save(name, file)
+                    manifest = thumbnails.shared_manifest(new_name)
+                    Post.objects.filter(image=name).update(
+                        image=new_name, image_manifest=manifest
+                    )
+                thumbnails.release(name)
+                if not manifest:
+                    renamed.append(new_name)
+                moved += 1
+            thumbnails.enqueue(renamed)
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено файлов: {moved}, не найдено: {missing}'
+        ))
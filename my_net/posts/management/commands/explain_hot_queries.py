@@ -0,0 +1,99 @@
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from posts import trending
+from posts.models import AuthorStats, Comment, Follow, Group, Post, User
+from posts.pagination import CursorPaginator, NEXT, ThreadPaginator
+from posts.timeline import TimelinePaginator
+
+# Полный проход по таблице или сортировка во временном дереве
+SQLITE_BAD = re.compile(r'\bSCAN (TABLE )?\w+( AS \w+)?$|USE TEMP B-TREE')
+POSTGRES_BAD = re.compile(r'Seq Scan|Sort')
+
+
+class Command(BaseCommand):
+    help = ('Выполняет EXPLAIN для запросов лент и падает, если запрос '
+            'читает таблицу целиком или сортирует без индекса')
+
+    def hot_queries(self):
+        """Запросы страниц в том виде, в каком их строят views."""
+        group_id = Group.objects.values_list('id', flat=True).first() or 0
+        user = User.objects.order_by('id').first() or User(id=0)
+        post_id = Post.objects.values_list('id', flat=True).first() or 0
+        cursor = (timezone.now(), 0)
+        per_page = settings.POSTS_PER_PAGE + 1
+
+        feeds = {
+            'index': CursorPaginator(Post.objects.for_feed(), per_page),
+            'group_posts': CursorPaginator(
+                Post.objects.for_feed().filter(group_id=group_id), per_page),
+            'profile': CursorPaginator(
+                Post.objects.for_feed().filter(author=user), per_page),
+        }
+        for name, paginator in feeds.items():
+            for values in (None, cursor):
+                yield name, paginator._window(
+                    paginator.object_list, paginator.key,
+                    values, NEXT, per_page
+                )
+
+        yield 'trending', trending.feed()
+
+        groups = CursorPaginator(
+            Group.objects.order_by('-post_count', '-id'),
+            settings.GROUPS_PER_PAGE + 1,
+            key=('post_count', 'id')
+        )
+        for values in (None, (0, 0)):
+            yield 'group_index', groups._window(
+                groups.object_list, groups.key, values, NEXT,
+                settings.GROUPS_PER_PAGE + 1
+            )
+
+        timeline = TimelinePaginator(user, per_page)
+        for values in (None, cursor):
+            yield 'follow_index', timeline._window(
+                timeline.object_list, ('pub_date', 'post_id'),
+                values, NEXT, per_page
+            )
+            yield 'follow_index', timeline._window(
+                Post.objects.for_feed().filter(author=user), timeline.key,
+                values, NEXT, per_page
+            )
+        yield 'follow_index', timeline.hot_authors
+
+        yield 'profile', Follow.objects.filter(user=user, author=user)
+        yield 'post_detail', Post.objects.for_feed().filter(id=post_id)
+        yield 'post_detail', AuthorStats.objects.filter(user=user)
+        comments = ThreadPaginator(
+            Comment.objects.filter(post_id=post_id).select_related('author'),
+            settings.COMMENTS_PER_PAGE + 1
+        )
+        for values in (None, ('0',)):
+            yield 'post_detail', comments._window(
+                comments.object_list, comments.key,
+                values, NEXT, comments.per_page
+            )
+
+    def handle(self, *args, **options):
+        bad = (
+            POSTGRES_BAD if connection.vendor == 'postgresql'
+            else SQLITE_BAD
+        )
+        failures = []
+        for name, queryset in self.hot_queries():
+            plan = queryset.explain()
+            self.stdout.write(f'{name}: {queryset.query}')
+            for line in plan.splitlines():
+                self.stdout.write(f'    {line}')
+                if bad.search(line.strip(' |-`')):
+                    failures.append(f'{name}: {line.strip()}')
+        if failures:
+            raise CommandError(
+                'Запросы без подходящего индекса:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Все запросы используют индексы'))
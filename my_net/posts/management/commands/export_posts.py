@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Выгружает записи в NDJSON или CSV потоком, не загружая '
+            'таблицу в память')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='-',
+            help='Файл для записей (можно .gz) или - для stdout'
+        )
+        parser.add_argument(
+            '--format',
+            choices=transfer.FORMATS,
+            help='Формат файла; по умолчанию — по расширению'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Сколько строк читать из базы за раз'
+        )
+        parser.add_argument(
+            '--images',
+            help='Каталог или архив .tar/.tar.gz для файлов картинок'
+        )
+
+    def handle(self, *args, **options):
+        fmt = transfer.detect_format(options['path'], options['format'])
+        images = None
+        if options['images']:
+            images = transfer.ImageSink(options['images'])
+        exported = 0
+        try:
+            with transfer.open_stream(
+                options['path'], 'w', self.stdout
+            ) as stream:
+                writer = transfer.RecordWriter(stream, fmt)
+                for record in transfer.export_records(options['chunk_size']):
+                    writer.write(record)
+                    if images is not None:
+                        images.add(record['image'])
+                    exported += 1
+        finally:
+            if images is not None:
+                images.close()
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено записей: {exported}'
+        ))
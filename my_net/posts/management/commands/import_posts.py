@@ -0,0 +1,168 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import thumbnails, transfer
+from posts.models import Group, Post, User
+
+
+class Command(BaseCommand):
+    help = ('Загружает записи из NDJSON или CSV пачками через '
+            'bulk_create; авторы и группы ищутся по username и slug')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл с записями (можно .gz) или - для stdin'
+        )
+        parser.add_argument(
+            '--format',
+            choices=transfer.FORMATS,
+            help='Формат файла; по умолчанию — по расширению'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько записей вставлять одним запросом'
+        )
+        parser.add_argument(
+            '--images',
+            help='Каталог или tar-архив с картинками из поля image'
+        )
+        parser.add_argument(
+            '--create-missing',
+            action='store_true',
+            help='Создавать неизвестных авторов и группы'
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.create_missing = options['create_missing']
+        self.images = None
+        if options['images']:
+            try:
+                self.images = transfer.ImageSource(options['images'])
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Картинки не прочитаны: {error}')
+        # Все авторы и группы держим в памяти: на каждую запись — поиск
+        # в словаре, а не запрос
+        self.users = dict(
+            User.objects.values_list('username', 'id').iterator()
+        )
+        self.groups = dict(
+            Group.objects.values_list('slug', 'id').iterator()
+        )
+        self.manifests = {}
+        self.imported = self.skipped = 0
+        after_id = transfer.last_post_id()
+        fmt = transfer.detect_format(options['path'], options['format'])
+        try:
+            self.load(options['path'], fmt)
+        finally:
+            # Пачки, записанные до ошибки, тоже доводятся до конца
+            transfer.finish_import(after_id, self.batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено записей: {self.imported}, пропущено: {self.skipped}'
+        ))
+
+    def load(self, path, fmt):
+        pending = []
+        with transfer.open_stream(path, 'r', sys.stdin) as stream:
+            for number, record in transfer.read_records(
+                stream, fmt, self.skip
+            ):
+                try:
+                    pending.append((number, self.parse(record)))
+                except (TypeError, ValueError) as error:
+                    self.skip(number, error)
+                    continue
+                if len(pending) >= self.batch_size:
+                    self.flush(pending)
+                    pending = []
+            self.flush(pending)
+
+    def skip(self, number, reason):
+        self.skipped += 1
+        self.stderr.write(f'Строка {number}: {reason}')
+
+    def parse(self, record):
+        if not isinstance(record, dict):
+            raise ValueError('ожидался объект')
+        fields = {}
+        for field in transfer.FIELDS:
+            value = record.get(field) or ''
+            if not isinstance(value, str):
+                raise ValueError(f'{field} должно быть строкой')
+            fields[field] = value
+        if not fields['text'].strip() or not fields['author']:
+            raise ValueError('нужны text и author')
+        fields['pub_date'] = transfer.parse_pub_date(fields['pub_date'])
+        return fields
+
+    def create(self, names, known, model, build, field):
+        missing = sorted(set(names) - known.keys() - {''})
+        if not missing or not self.create_missing:
+            return
+        model.objects.bulk_create(
+            map(build, missing), ignore_conflicts=True
+        )
+        known.update(
+            model.objects.filter(**{f'{field}__in': missing})
+            .values_list(field, 'id')
+        )
+
+    def new_user(self, username):
+        user = User(username=username)
+        user.set_unusable_password()
+        return user
+
+    def image_name(self, reference):
+        if not reference or self.images is None:
+            return '', ''
+        name = self.images.get(reference)
+        if name is None:
+            raise ValueError(f'нет картинки {reference}')
+        if name not in self.manifests:
+            self.manifests[name] = thumbnails.shared_manifest(name)
+        return name, self.manifests[name]
+
+    def flush(self, pending):
+        if not pending:
+            return
+        self.create(
+            (fields['author'] for _, fields in pending),
+            self.users, User, self.new_user, 'username'
+        )
+        self.create(
+            (fields['group'] for _, fields in pending),
+            self.groups, Group,
+            lambda slug: Group(slug=slug, title=slug), 'slug'
+        )
+        posts = []
+        for number, fields in pending:
+            author_id = self.users.get(fields['author'])
+            group_id = self.groups.get(fields['group'])
+            if author_id is None:
+                self.skip(number, f'нет автора {fields["author"]}')
+                continue
+            if fields['group'] and group_id is None:
+                self.skip(number, f'нет группы {fields["group"]}')
+                continue
+            try:
+                image, manifest = self.image_name(fields['image'])
+            except ValueError as error:
+                self.skip(number, error)
+                continue
+            posts.append(Post(
+                text=fields['text'],
+                pub_date=fields['pub_date'],
+                author_id=author_id,
+                group_id=group_id,
+                image=image,
+                image_manifest=manifest,
+            ))
+        # Размер INSERT выбирает сам Django: явный batch_size в 2.2 не
+        # ограничивается пределами СУБД (500 строк в SQLite)
+        transfer.bulk_create_dated(Post, posts, 'pub_date')
+        self.imported += len(posts)
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = 'Заново строит поисковый индекс записей и комментариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько документов индексировать за одну транзакцию'
+        )
+
+    def batches(self, queryset, batch_size):
+        last_id = 0
+        while True:
+            batch = list(
+                queryset.filter(id__gt=last_id).order_by('id')[:batch_size]
+            )
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1].id
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        index = search.backend()
+        index.clear()
+        total = 0
+        sources = (
+            (Post.objects.only('text', 'pub_date'), search.post_document),
+            (
+                Comment.objects.only('text', 'created', 'post'),
+                search.comment_document
+            ),
+        )
+        for queryset, document in sources:
+            for batch in self.batches(queryset, batch_size):
+                index.index_many(map(document, batch))
+                total += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано документов: {total} '
+            f'({type(index).__name__})'
+        ))
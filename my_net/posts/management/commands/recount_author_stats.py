@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Group, User
+from posts.stats import recount, recount_groups
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики авторов и групп пачками и чинит '
+        'расхождения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько авторов или групп пересчитывать за раз'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked, repaired = self.recount(User, recount, batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено авторов: {checked}, исправлено: {repaired}'
+        ))
+        checked, repaired = self.recount(Group, recount_groups, batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено групп: {checked}, исправлено: {repaired}'
+        ))
+
+    def recount(self, model, repair, batch_size):
+        last_id = 0
+        checked = repaired = 0
+        while True:
+            ids = list(
+                model.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return checked, repaired
+            repaired += repair(ids)
+            checked += len(ids)
+            last_id = ids[-1]
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from posts.seeding import SCALES, Seeder
+
+
+class Command(BaseCommand):
+    help = ('Наполняет базу синтетическими авторами, группами, '
+            'подписками, записями и комментариями для замеров')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            choices=SCALES,
+            default='10k',
+            help='Размер набора по числу записей'
+        )
+        parser.add_argument(
+            '--posts',
+            type=int,
+            help='Точное число записей вместо --scale'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк вставлять одним запросом'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Зерно генератора, чтобы повторить тот же набор'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='За сколько дней разбросаны даты записей'
+        )
+
+    def handle(self, *args, **options):
+        seeder = Seeder(
+            options['posts'] or SCALES[options['scale']],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            days=options['days']
+        )
+        counts = seeder.run()
+        self.stdout.write(self.style.SUCCESS(
+            'Создано: ' + ', '.join(
+                f'{name} {count}' for name, count in counts.items()
+            )
+        ))
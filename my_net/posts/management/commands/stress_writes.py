@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import Post, User
+
+STRESS_USERNAME = 'stress'
+
+
+class Command(BaseCommand):
+    help = ('Нагружает базу параллельными add_comment и post_create '
+            'через полный стек Django и считает ошибки вроде '
+            '«database is locked». Пишет в базу: запускайте на копии')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=8,
+            help='Сколько потоков пишут одновременно'
+        )
+        parser.add_argument(
+            '--writes',
+            type=int,
+            default=50,
+            help='Сколько запросов делает каждый поток'
+        )
+        parser.add_argument(
+            '--host',
+            default='localhost',
+            help='Заголовок Host; должен быть в ALLOWED_HOSTS'
+        )
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=STRESS_USERNAME)
+        post = Post.objects.filter(author=user).first() or (
+            Post.objects.create(author=user, text='Запись для нагрузки')
+        )
+        comment_url = reverse('posts:add_comment', args=[post.id])
+        create_url = reverse('posts:post_create')
+        results = Counter()
+        errors = Counter()
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['threads'])
+
+        def worker(number):
+            client = Client(HTTP_HOST=options['host'])
+            client.force_login(user)
+            barrier.wait()
+            for step in range(options['writes']):
+                url = comment_url if step % 2 else create_url
+                try:
+                    response = client.post(
+                        url, {'text': f'Нагрузка {number}-{step}'}
+                    )
+                    outcome = response.status_code
+                except DatabaseError as error:
+                    outcome = 'error'
+                    with lock:
+                        errors[str(error)] += 1
+                with lock:
+                    results[outcome] += 1
+            connections.close_all()
+
+        threads = [
+            threading.Thread(target=worker, args=(number,))
+            for number in range(options['threads'])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        total = sum(results.values())
+        failed = total - results[302]
+        self.stdout.write(
+            f'Запросов: {total} за {elapsed:.1f} с '
+            f'({total / elapsed:.0f}/с), ошибок: {failed}'
+        )
+        for message, count in errors.most_common():
+            self.stdout.write(f'  {count} × {message}')
+        if failed:
+            raise CommandError(f'Запись под нагрузкой не прошла: {failed}')
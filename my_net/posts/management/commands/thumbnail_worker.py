@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Выполняет задания очереди миниатюр'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Сколько миниатюр строить параллельно'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2,
+            help='Пауза в секундах, когда очередь пуста'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Разобрать очередь и выйти'
+        )
+
+    def handle(self, *args, **options):
+        recovered = thumbnails.recover_stale()
+        if recovered:
+            self.stdout.write(f'Возвращено в очередь: {recovered}')
+        total_done = total_failed = 0
+        while True:
+            close_old_connections()
+            done, failed = thumbnails.run_jobs(options['workers'])
+            total_done += done
+            total_failed += failed
+            if done or failed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {total_done}, с ошибкой: {total_failed}'
+        ))
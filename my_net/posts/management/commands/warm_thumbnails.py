@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post, ThumbnailJob
+
+
+class Command(BaseCommand):
+    help = ('Ставит в очередь картинки уже опубликованных записей и '
+            'строит их миниатюры параллельно')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Сколько миниатюр строить параллельно'
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Повторить задания, исчерпавшие попытки'
+        )
+        parser.add_argument(
+            '--enqueue-only',
+            action='store_true',
+            help='Только поставить в очередь, строить будет thumbnail_worker'
+        )
+
+    def handle(self, *args, **options):
+        last_id = 0
+        queued = 0
+        while True:
+            batch = list(
+                Post.objects.filter(id__gt=last_id)
+                .exclude(image='')
+                .order_by('id')
+                .values_list('id', 'image')[:settings.THUMBNAIL_BATCH_SIZE]
+            )
+            if not batch:
+                break
+            thumbnails.enqueue(name for _, name in batch)
+            queued += len(batch)
+            last_id = batch[-1][0]
+        if options['retry_failed']:
+            ThumbnailJob.objects.filter(status=ThumbnailJob.FAILED).update(
+                status=ThumbnailJob.PENDING, attempts=0
+            )
+        self.stdout.write(f'Записей с картинками: {queued}')
+        if options['enqueue_only']:
+            return
+        total_done = total_failed = 0
+        while True:
+            done, failed = thumbnails.run_jobs(options['workers'])
+            if not done and not failed:
+                break
+            total_done += done
+            total_failed += failed
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {total_done}, с ошибкой: {total_failed}'
+        ))
@@ -0,0 +1,74 @@
+# Generated by Django 2.2.16 on 2026-10-18 09:50
+
+from django.db import OperationalError, migrations, models
+import django.db.models.deletion
+
+FTS_TABLE = 'posts_search_fts'
+
+
+def create_fts(apps, schema_editor):
+    # Индекс FTS5 есть только у SQLite, и то не в каждой сборке;
+    # без него поиск работает по SearchPosting
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+                'body, post_id UNINDEXED, published UNINDEXED, '
+                "tokenize = 'unicode61 remove_diacritics 0')"
+            )
+        except OperationalError:
+            pass
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Запись'), ('comment', 'Комментарий')], max_length=7, verbose_name='Тип')),
+                ('object_id', models.PositiveIntegerField(verbose_name='Объект')),
+                ('published', models.DateTimeField(verbose_name='Дата публикации')),
+                ('length', models.PositiveIntegerField(verbose_name='Число слов')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Post', verbose_name='Запись')),
+            ],
+            options={
+                'verbose_name': 'Документ поиска',
+                'verbose_name_plural': 'Документы поиска',
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Основа')),
+                ('frequency', models.PositiveIntegerField(verbose_name='Вхождений')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='posts.SearchDocument', verbose_name='Документ')),
+            ],
+            options={
+                'verbose_name': 'Вхождение',
+                'verbose_name_plural': 'Вхождения',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchposting',
+            constraint=models.UniqueConstraint(fields=('term', 'document'), name='search_posting_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='searchdocument',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='search_document_unique'),
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
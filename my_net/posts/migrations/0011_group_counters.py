@@ -0,0 +1,49 @@
+# Generated by Django 2.2.16 on 2026-10-18 10:29
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    posts = Post.objects.filter(group=models.OuterRef('pk')).order_by()
+    Group.objects.update(
+        post_count=Coalesce(
+            models.Subquery(
+                posts.values('group').annotate(
+                    total=models.Count('id')
+                ).values('total'),
+                output_field=models.IntegerField()
+            ),
+            0
+        ),
+        last_activity=models.Subquery(
+            posts.order_by('-pub_date').values('pub_date')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_comment_threads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='last_activity',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Последняя запись'),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Записей'),
+        ),
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['-post_count', '-id'], name='group_post_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 2.2.16 on 2026-10-18 10:31
+
+import math
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_scores(apps, schema_editor):
+    """Рейтинги по недавним записям и комментариям, эпоха — сейчас."""
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    PostScore = apps.get_model('posts', 'PostScore')
+    TrendingEpoch = apps.get_model('posts', 'TrendingEpoch')
+    now = time.time()
+    TrendingEpoch.objects.create(pk=1, tick=now)
+    followers = dict(AuthorStats.objects.filter(
+        follower_count__gt=0
+    ).values_list('user_id', 'follower_count'))
+    reach = settings.TRENDING_REACH_WEIGHT * math.log1p(
+        max(followers.values(), default=0)
+    )
+    heaviest = max(settings.TRENDING_COMMENT_WEIGHT, reach)
+    if heaviest < settings.TRENDING_MIN_SCORE:
+        return
+    # Старше этого любое слагаемое уже затухло ниже TRENDING_MIN_SCORE
+    since = datetime.fromtimestamp(
+        now - settings.TRENDING_HALF_LIFE * math.log2(
+            heaviest / settings.TRENDING_MIN_SCORE
+        ),
+        timezone.utc
+    )
+
+    def decayed(weight, date):
+        age = max(now - date.timestamp(), 0)
+        return weight * 2 ** (-age / settings.TRENDING_HALF_LIFE)
+
+    scores = defaultdict(float)
+    for post_id, author_id, pub_date in Post.objects.filter(
+        pub_date__gte=since
+    ).values_list('id', 'author_id', 'pub_date').iterator():
+        scores[post_id] += decayed(
+            settings.TRENDING_REACH_WEIGHT * math.log1p(
+                followers.get(author_id, 0)
+            ),
+            pub_date
+        )
+    for post_id, created in Comment.objects.filter(
+        created__gte=since
+    ).values_list('post_id', 'created').iterator():
+        scores[post_id] += decayed(settings.TRENDING_COMMENT_WEIGHT, created)
+    PostScore.objects.bulk_create(
+        (
+            PostScore(post_id=post_id, score=score)
+            for post_id, score in scores.items()
+            if score >= settings.TRENDING_MIN_SCORE
+        ),
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_group_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='posts.Post', verbose_name='Запись')),
+                ('score', models.FloatField(default=0, verbose_name='Рейтинг')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг записи',
+                'verbose_name_plural': 'Рейтинги записей',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='postscore',
+            index=models.Index(fields=['-score'], name='post_score_idx'),
+        ),
+        migrations.CreateModel(
+            name='TrendingEpoch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tick', models.FloatField(verbose_name='Момент затухания (Unix-время)')),
+            ],
+            options={
+                'verbose_name': 'Эпоха рейтингов',
+                'verbose_name_plural': 'Эпоха рейтингов',
+            },
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 11:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_postscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='timeline_pending',
+            field=models.BooleanField(default=False, verbose_name='Ленты ждут раскладки'),
+        ),
+    ]
@@ -1,8 +1,25 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
+# Поля, которые шаблоны лент читают у записи, её автора и группы
+FEED_FIELDS = (
+    'text',
+    'pub_date',
+    'image',
+    'image_manifest',
+    'author',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group',
+    'group__slug',
+    'group__title',
+)
+
 
 class Group(models.Model):
     title = models.CharField(
@@ -18,6 +35,19 @@ class Group(models.Model):
         'Описание группы',
         max_length=400
     )
+    # Денормализованы для каталога групп: сдвигаются сигналами записей,
+    # расхождения чинит recount_author_stats
+    post_count = models.PositiveIntegerField(
+        'Записей',
+        default=0,
+        editable=False
+    )
+    last_activity = models.DateTimeField(
+        'Последняя запись',
+        blank=True,
+        null=True,
+        editable=False
+    )
 
     def __str__(self):
         return self.title
@@ -25,6 +55,19 @@ class Group(models.Model):
     class Meta:
         verbose_name_plural = 'Группы'
         verbose_name = 'Группу'
+        indexes = (
+            # Каталог групп: самые наполненные первыми
+            models.Index(
+                fields=('-post_count', '-id'),
+                name='group_post_count_idx'
+            ),
+        )
+
+
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Записи вместе с автором и группой одним запросом."""
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
 
 
 class Post(models.Model):
@@ -54,16 +97,59 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    # JSON от posts.variants.build: ширины и форматы готовых вариантов
+    # картинки; пусто, пока очередь миниатюр их не построила
+    image_manifest = models.TextField(
+        'Варианты картинки',
+        blank=True,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        # ContentAddressedStorage отдаёт имя файла, который уже лежит
+        # на диске, и блокирует это имя до конца транзакции: иначе
+        # posts.thumbnails.release удалит файл до вставки ссылки
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         verbose_name_plural = 'Публикации'
         verbose_name = 'Публикацию'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='post_date_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='post_author_date_idx'
+            ),
+            models.Index(
+                fields=('group', '-pub_date', '-id'),
+                name='post_group_date_idx'
+            ),
+            # Ссылки на общий файл картинки считаются по этому индексу
+            models.Index(
+                fields=('image',),
+                name='post_image_idx'
+            ),
+        )
+
+
+# Материализованный путь комментария: по сегменту фиксированной
+# ширины на уровень. Корневой сегмент — COMMENT_ROOT - id, чтобы новые
+# ветки шли первыми; ответы внутри ветки — по возрастанию id
+COMMENT_SEGMENT = 10
+COMMENT_ROOT = 10 ** COMMENT_SEGMENT - 1
 
 
 class Comment(models.Model):
@@ -89,15 +175,63 @@ class Comment(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        related_name='replies',
+        blank=True,
+        null=True,
+        verbose_name='Ответ на'
+    )
+    path = models.CharField(
+        'Путь в ветке',
+        max_length=255,
+        blank=True,
+        editable=False
+    )
 
     class Meta:
         ordering = ('-created',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = (
+            models.Index(
+                fields=('post', '-created'),
+                name='comment_post_created_idx'
+            ),
+            # Ветки комментариев записи читаются диапазоном по пути
+            models.Index(
+                fields=('post', 'path'),
+                name='comment_post_path_idx'
+            ),
+            # Список комментариев в админке и его date_hierarchy
+            models.Index(
+                fields=('-created', '-id'),
+                name='comment_created_idx'
+            ),
+        )
 
     def __str__(self):
         return self.text
 
+    @property
+    def depth(self):
+        return max(len(self.path) // COMMENT_SEGMENT - 1, 0)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if not self.path:
+            # Путь включает id, поэтому пишется вторым UPDATE
+            if self.parent_id is None:
+                path = f'{COMMENT_ROOT - self.id:0{COMMENT_SEGMENT}d}'
+            else:
+                path = Comment.objects.values_list(
+                    'path', flat=True
+                ).get(pk=self.parent_id)
+                path += f'{self.id:0{COMMENT_SEGMENT}d}'
+            Comment.objects.filter(pk=self.pk).update(path=path)
+            self.path = path
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -126,3 +260,235 @@ class Follow(models.Model):
                 check=~models.Q(user=models.F('author'))
             ),
         )
+        # Выборки по user покрывает индекс follow_unique (user, author)
+        indexes = (
+            models.Index(
+                fields=('author', 'user'),
+                name='follow_author_user_idx'
+            ),
+        )
+
+
+class TimelineEntry(models.Model):
+    """Материализованная лента подписок: запись на пару (читатель, пост).
+
+    Заполняется при публикации (fan-out-on-write), поэтому лента
+    /follow/ читается одним диапазоном по индексу (user, -pub_date).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Запись'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        ordering = ('-pub_date', '-post_id')
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post',),
+                name='timeline_unique'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='timeline_user_date_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='timeline_user_author_idx'
+            ),
+        )
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики автора.
+
+    Обновляются сигналами через F() при создании и удалении записей и
+    подписок; расхождения чинит команда recount_author_stats.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Автор'
+    )
+    post_count = models.PositiveIntegerField('Записей', default=0)
+    follower_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+    # Опустился до TIMELINE_FANOUT_LIMIT: записи ждут catch_up_timelines
+    timeline_pending = models.BooleanField(
+        'Ленты ждут раскладки', default=False
+    )
+
+    class Meta:
+        verbose_name = 'Статистику автора'
+        verbose_name_plural = 'Статистика авторов'
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class PostScore(models.Model):
+    """Рейтинг записи в ленте «Популярное» (posts.trending).
+
+    Строки есть только у записей, которые набрали рейтинг; затухшие
+    удаляет decay_trending, поэтому таблица остаётся маленькой.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending',
+        verbose_name='Запись'
+    )
+    score = models.FloatField('Рейтинг', default=0)
+
+    class Meta:
+        verbose_name = 'Рейтинг записи'
+        verbose_name_plural = 'Рейтинги записей'
+        indexes = (
+            # Лента — первые TRENDING_SIZE строк этого индекса
+            models.Index(fields=('-score',), name='post_score_idx'),
+        )
+
+    def __str__(self):
+        return str(self.post_id)
+
+
+class TrendingEpoch(models.Model):
+    """Момент, в масштабе которого хранятся рейтинги PostScore.
+
+    Строка одна; её сдвигает decay_trending в одной транзакции с
+    пересчётом рейтингов.
+    """
+    tick = models.FloatField('Момент затухания (Unix-время)')
+
+    class Meta:
+        verbose_name = 'Эпоха рейтингов'
+        verbose_name_plural = 'Эпоха рейтингов'
+
+    def __str__(self):
+        return str(self.tick)
+
+
+class ThumbnailJob(models.Model):
+    """Задание очереди миниатюр: одно на файл картинки.
+
+    Очередь живёт в БД: задания кладут сигналы и warm_thumbnails,
+    выбирают пулы потоков в процессе сайта и команда thumbnail_worker.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    image = models.CharField('Файл', max_length=255, unique=True)
+    status = models.CharField(
+        'Состояние',
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING
+    )
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    created = models.DateTimeField('Создано', auto_now_add=True)
+    error = models.TextField('Ошибка', blank=True)
+
+    class Meta:
+        verbose_name = 'Задание миниатюр'
+        verbose_name_plural = 'Задания миниатюр'
+        indexes = (
+            models.Index(
+                fields=('status', 'id'),
+                name='thumbnail_job_status_idx'
+            ),
+        )
+
+    def __str__(self):
+        return self.image
+
+
+class SearchDocument(models.Model):
+    """Документ переносимого инвертированного индекса поиска.
+
+    Используется, когда у СУБД нет FTS5; сам индекс — SearchPosting.
+    """
+    POST = 'post'
+    COMMENT = 'comment'
+    KINDS = (
+        (POST, 'Запись'),
+        (COMMENT, 'Комментарий'),
+    )
+
+    kind = models.CharField('Тип', max_length=7, choices=KINDS)
+    object_id = models.PositiveIntegerField('Объект')
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Запись'
+    )
+    published = models.DateTimeField('Дата публикации')
+    length = models.PositiveIntegerField('Число слов')
+
+    class Meta:
+        verbose_name = 'Документ поиска'
+        verbose_name_plural = 'Документы поиска'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('kind', 'object_id'),
+                name='search_document_unique'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.kind}:{self.object_id}'
+
+
+class SearchPosting(models.Model):
+    """Вхождение основы слова в документ поиска."""
+    term = models.CharField('Основа', max_length=64)
+    document = models.ForeignKey(
+        SearchDocument,
+        on_delete=models.CASCADE,
+        related_name='postings',
+        verbose_name='Документ'
+    )
+    frequency = models.PositiveIntegerField('Вхождений')
+
+    class Meta:
+        verbose_name = 'Вхождение'
+        verbose_name_plural = 'Вхождения'
+        # Индекс ограничения читается диапазоном по основе
+        constraints = (
+            models.UniqueConstraint(
+                fields=('term', 'document'),
+                name='search_posting_unique'
+            ),
+        )
+
+    def __str__(self):
+        return self.term
@@ -0,0 +1,120 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from . import feed_cache
+
+PAGE_PREFIX = 'page:'
+LOCK_PREFIX = 'page_lock:'
+POLL_INTERVAL = 0.05
+
+
+def page_key(request):
+    """Ключ страницы анонима или None, если её не кэшируем."""
+    if request.method != 'GET':
+        return None
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return None
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return None
+    if match.view_name not in settings.PAGE_CACHE_VIEWS:
+        return None
+    digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return PAGE_PREFIX + digest
+
+
+def _cacheable(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and hasattr(request, 'feed_version')
+        and 'private' not in response.get('Cache-Control', '')
+    )
+
+
+class AnonymousPageCacheMiddleware:
+    """Готовые страницы лент для анонимов в общем кэше.
+
+    Стоит перед сессиями, аутентификацией и CSRF: попадание отдаётся,
+    не доходя до них. Страница хранится вместе с версиями своих лент
+    feed_cache (их view оставляет в ``request.feed_scopes``), поэтому
+    сбрасывается тем же bump, что и фрагменты шаблонов.
+
+    Перестраивает страницу один запрос — тот, кто взял блокировку.
+    Остальные тем временем получают устаревшую копию, если лента
+    изменилась не раньше PAGE_CACHE_MAX_STALE секунд назад, или ждут
+    готовую до PAGE_CACHE_LOCK_WAIT секунд и только потом строят сами.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = page_key(request)
+        if key is None:
+            return self.get_response(request)
+        entry = cache.get(key)
+        version = entry and feed_cache.versions(*entry['scopes'])
+        if entry is not None and version == entry['version']:
+            return self._serve(request, entry, 'hit')
+        lock = LOCK_PREFIX + key[len(PAGE_PREFIX):]
+        if cache.add(lock, 1, settings.PAGE_CACHE_LOCK_TIMEOUT):
+            try:
+                return self._render(request, key)
+            finally:
+                cache.delete(lock)
+        if entry is not None:
+            stale_for = time.time() - feed_cache.modified(version).timestamp()
+            if stale_for <= settings.PAGE_CACHE_MAX_STALE:
+                return self._serve(request, entry, 'stale')
+        entry = self._wait(key)
+        if entry is not None:
+            return self._serve(request, entry, 'hit')
+        return self._render(request, key)
+
+    def _wait(self, key):
+        deadline = time.monotonic() + settings.PAGE_CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            entry = cache.get(key)
+            if (
+                entry is not None
+                and feed_cache.versions(*entry['scopes']) == entry['version']
+            ):
+                return entry
+        return None
+
+    def _render(self, request, key):
+        response = self.get_response(request)
+        if _cacheable(request, response):
+            cache.set(key, {
+                'scopes': request.feed_scopes,
+                'version': request.feed_version,
+                'content': response.content,
+                'headers': list(response.items()),
+            }, settings.FEED_CACHE_TIMEOUT)
+            response['X-Page-Cache'] = 'miss'
+        return response
+
+    def _serve(self, request, entry, state):
+        response = HttpResponse(entry['content'])
+        for header, value in entry['headers']:
+            response[header] = value
+        response['X-Page-Cache'] = state
+        return get_conditional_response(
+            request,
+            etag=response.get('ETag'),
+            last_modified=parse_http_date_safe(
+                response.get('Last-Modified', '')
+            ),
+            response=response
+        )
@@ -0,0 +1,167 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, values):
+    """Упаковывает направление и значения ключа в непрозрачный токен."""
+    payload = json.dumps(
+        [direction, [
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in values
+        ]],
+        separators=(',', ':')
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, fields):
+    """Возвращает (направление, значения) или None для битого токена.
+
+    Значения приводятся к типам полей ключа ``fields``: подделанный
+    токен открывает первую страницу, как и нечитаемый.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+    if (
+        direction not in (NEXT, PREVIOUS)
+        or not isinstance(values, list)
+        or len(values) != len(fields)
+    ):
+        return None
+    try:
+        values = [
+            field.to_python(value) for field, value in zip(fields, values)
+        ]
+    except (ValidationError, TypeError, ValueError):
+        return None
+    if None in values:
+        return None
+    return direction, values
+
+
+def keyset_after(key, values, lookup):
+    """Условие «кортеж ``key`` строго после ``values``».
+
+    (a, b) < (x, y)  <=>  a <= x AND (a < x OR (a = x AND b < y))
+
+    Избыточное ``a <= x`` позволяет СУБД начать чтение индекса сразу
+    с курсора, а не фильтровать его с начала.
+    """
+    condition = Q()
+    for position, field in enumerate(key):
+        step = Q(**{f'{field}__{lookup}': values[position]})
+        for equal_field, value in zip(key, values[:position]):
+            step &= Q(**{equal_field: value})
+        condition |= step
+    bound = Q(**{f'{key[0]}__{lookup}e': values[0]})
+    return bound & condition
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу (keyset) без COUNT(*) и OFFSET.
+
+    Записи упорядочены по убыванию полей ``key``; каждая страница
+    выбирается условием «строго после курсора» и LIMIT, поэтому
+    стоимость любой страницы одинакова. Страница — обычный ``Page``
+    с дополнительными атрибутами ``cursor``, ``next_cursor`` и
+    ``previous_cursor``.
+    """
+
+    cursor_mode = True
+    # False — обход по возрастанию ключа (как у дерева комментариев)
+    descending = True
+
+    def __init__(self, object_list, per_page, key=('pub_date', 'id')):
+        super().__init__(object_list, per_page)
+        self.key = tuple(key)
+
+    def key_fields(self):
+        """Поля модели, по которым разбирается курсор."""
+        meta = self.object_list.model._meta
+        return [meta.get_field(field) for field in self.key]
+
+    def _key_values(self, obj):
+        return [getattr(obj, field) for field in self.key]
+
+    def _window(self, queryset, key, values, direction, stop):
+        """Первые ``stop`` строк после курсора в порядке обхода."""
+        backward = (direction == NEXT) == self.descending
+        prefix = '-' if backward else ''
+        queryset = queryset.order_by(*(prefix + field for field in key))
+        if values is not None:
+            lookup = 'lt' if backward else 'gt'
+            queryset = queryset.filter(keyset_after(key, values, lookup))
+        return queryset[:stop]
+
+    def _fetch(self, values, direction, limit, offset=0):
+        return list(self._window(
+            self.object_list, self.key, values, direction, offset + limit
+        )[offset:])
+
+    def cursor_page(self, cursor=None, page_number=None):
+        """Возвращает страницу для токена ``cursor``.
+
+        ``page_number`` поддерживается для старых ссылок ``?page=N``:
+        такая страница выбирается через OFFSET, но тоже без COUNT(*).
+        """
+        limit = self.per_page + 1
+        decoded = decode_cursor(cursor, self.key_fields()) if cursor else None
+        number = 1
+        if decoded is None:
+            cursor = ''
+            try:
+                number = max(int(page_number), 1)
+            except (TypeError, ValueError):
+                number = 1
+            offset = (number - 1) * self.per_page
+            rows = self._fetch(None, NEXT, limit, offset)
+            has_next = len(rows) > self.per_page
+            has_previous = number > 1
+            rows = rows[:self.per_page]
+        else:
+            direction, values = decoded
+            rows = self._fetch(values, direction, limit)
+            if direction == NEXT:
+                has_next = len(rows) > self.per_page
+                has_previous = True
+                rows = rows[:self.per_page]
+            else:
+                has_previous = len(rows) > self.per_page
+                has_next = True
+                rows = rows[:self.per_page][::-1]
+
+        page = self._get_page(rows, number, self)
+        page.cursor = cursor
+        page.next_cursor = (
+            encode_cursor(NEXT, self._key_values(rows[-1]))
+            if has_next and rows else None
+        )
+        page.previous_cursor = (
+            encode_cursor(PREVIOUS, self._key_values(rows[0]))
+            if has_previous and rows else None
+        )
+        return page
+
+
+class ThreadPaginator(CursorPaginator):
+    """Комментарии записи в порядке веток: по возрастанию пути.
+
+    Страница может начаться в середине ветки — следующая продолжит её
+    с того же места.
+    """
+
+    descending = False
+
+    def __init__(self, object_list, per_page):
+        super().__init__(object_list, per_page, key=('path',))
@@ -0,0 +1,287 @@
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db import models
+from django.db.models import Count, Sum
+
+from .models import Comment, Post, SearchDocument, SearchPosting
+from .pagination import NEXT, CursorPaginator
+from .stemmer import stem
+
+TOKEN = re.compile(r'\w+')
+MAX_TERM_LENGTH = 64
+STOP_WORDS = frozenset((
+    'а', 'без', 'бы', 'в', 'во', 'вот', 'все', 'вы', 'да', 'для', 'до',
+    'его', 'ее', 'её', 'если', 'же', 'за', 'и', 'из', 'или', 'им', 'их',
+    'к', 'как', 'ко', 'ли', 'мне', 'мы', 'на', 'не', 'нет', 'но', 'о',
+    'об', 'он', 'она', 'они', 'оно', 'от', 'по', 'при', 'с', 'со', 'так',
+    'то', 'ты', 'у', 'уже', 'что', 'это', 'я',
+))
+# Параметры BM25 те же, что у FTS5
+K1 = 1.2
+B = 0.75
+FTS_TABLE = 'posts_search_fts'
+
+POST = SearchDocument.POST
+COMMENT = SearchDocument.COMMENT
+
+
+def terms(text):
+    """Основы слов текста без стоп-слов, в порядке появления."""
+    return [
+        stem(token)[:MAX_TERM_LENGTH]
+        for token in TOKEN.findall(text.lower())
+        if token not in STOP_WORDS
+    ]
+
+
+def recency(published):
+    """Логарифм затухания по давности с периодом SEARCH_HALF_LIFE.
+
+    Ранг — ln(BM25) + recency(дата): то же, что BM25, умноженный на
+    2 ** (-возраст / период), но не зависит от текущего времени,
+    поэтому курсор по рангу стабилен между запросами страниц.
+    """
+    return published * math.log(2) / settings.SEARCH_HALF_LIFE
+
+
+class Hit:
+    """Найденный документ: запись или комментарий к ней."""
+
+    def __init__(self, key, score, kind, object_id, post_id):
+        self.key = key
+        self.score = score
+        self.kind = kind
+        self.object_id = object_id
+        self.post_id = post_id
+        self.post = None
+        self.comment = None
+
+
+class Fts5Index:
+    """Индекс в виртуальной таблице FTS5 (SQLite)."""
+
+    @staticmethod
+    def _rowid(kind, object_id):
+        return object_id * 2 + (kind == COMMENT)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def remove(self, kind, object_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [[self._rowid(kind, object_id)] for object_id in object_ids]
+            )
+
+    def index_many(self, documents):
+        rows = [
+            [
+                self._rowid(kind, object_id), ' '.join(terms(text)),
+                post_id, published.timestamp()
+            ]
+            for kind, object_id, post_id, published, text in documents
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [row[:1] for row in rows]
+            )
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, body, post_id, published) '
+                'VALUES (%s, %s, %s, %s)',
+                rows
+            )
+
+    def search(self, query_terms, values, direction, limit, offset):
+        order = 'DESC' if direction == NEXT else 'ASC'
+        condition = ''
+        params = [
+            math.log(2) / settings.SEARCH_HALF_LIFE,
+            ' '.join(f'"{term}"' for term in query_terms),
+        ]
+        if values is not None:
+            sign = '<' if direction == NEXT else '>'
+            condition = (
+                f'WHERE score {sign} %s OR (score = %s AND rowid {sign} %s)'
+            )
+            params += [values[0], values[0], values[1]]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid, score, post_id FROM ('
+                '  SELECT rowid, post_id,'
+                f'   LN(MAX(-bm25({FTS_TABLE}), 1e-9)) + published * %s'
+                '   AS score'
+                f'  FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+                f') {condition} '
+                f'ORDER BY score {order}, rowid {order} LIMIT %s OFFSET %s',
+                params + [limit, offset]
+            )
+            return [
+                Hit(
+                    rowid, score, COMMENT if rowid % 2 else POST,
+                    rowid // 2, post_id
+                )
+                for rowid, score, post_id in cursor.fetchall()
+            ]
+
+
+class InvertedIndex:
+    """Переносимый индекс: SearchDocument и SearchPosting.
+
+    BM25 считается по спискам вхождений искомых основ, которые
+    читаются диапазоном по индексу (term, document).
+    """
+
+    def clear(self):
+        SearchDocument.objects.all().delete()
+
+    def remove(self, kind, object_ids):
+        SearchDocument.objects.filter(
+            kind=kind, object_id__in=list(object_ids)
+        ).delete()
+
+    def index_many(self, documents):
+        with transaction.atomic():
+            for kind, object_id, post_id, published, text in documents:
+                counts = Counter(terms(text))
+                document, _ = SearchDocument.objects.update_or_create(
+                    kind=kind,
+                    object_id=object_id,
+                    defaults={
+                        'post_id': post_id,
+                        'published': published,
+                        'length': sum(counts.values()),
+                    }
+                )
+                document.postings.all().delete()
+                SearchPosting.objects.bulk_create(
+                    SearchPosting(
+                        term=term, document=document, frequency=frequency
+                    )
+                    for term, frequency in counts.items()
+                )
+
+    def search(self, query_terms, values, direction, limit, offset):
+        query_terms = set(query_terms)
+        postings = SearchPosting.objects.filter(term__in=query_terms)
+        frequencies = dict(
+            postings.order_by().values_list('term').annotate(Count('id'))
+        )
+        if len(frequencies) < len(query_terms):
+            # Все слова запроса обязательны, как в MATCH FTS5
+            return []
+        corpus = SearchDocument.objects.aggregate(
+            count=Count('id'), length=Sum('length')
+        )
+        average = corpus['length'] / corpus['count'] or 1
+        idf = {
+            term: max(math.log(
+                (corpus['count'] - frequency + 0.5) / (frequency + 0.5)
+            ), 1e-6)
+            for term, frequency in frequencies.items()
+        }
+        relevance = Counter()
+        matched = Counter()
+        documents = {}
+        for row in postings.values_list(
+            'document_id', 'term', 'frequency', 'document__length',
+            'document__published', 'document__kind', 'document__object_id',
+            'document__post_id'
+        ).iterator():
+            key, term, frequency, length, *document = row
+            relevance[key] += idf[term] * frequency * (K1 + 1) / (
+                frequency + K1 * (1 - B + B * length / average)
+            )
+            matched[key] += 1
+            documents[key] = document
+        hits = []
+        for key, count in matched.items():
+            if count < len(query_terms):
+                continue
+            published, kind, object_id, post_id = documents[key]
+            score = (
+                math.log(max(relevance[key], 1e-9))
+                + recency(published.timestamp())
+            )
+            hits.append(Hit(key, score, kind, object_id, post_id))
+        forward = direction == NEXT
+        if values is not None:
+            bound = tuple(values)
+            hits = [
+                hit for hit in hits
+                if ((hit.score, hit.key) < bound) == forward
+                and (hit.score, hit.key) != bound
+            ]
+        hits.sort(key=lambda hit: (hit.score, hit.key), reverse=forward)
+        return hits[offset:offset + limit]
+
+
+_fts_available = None
+
+
+def backend():
+    global _fts_available
+    choice = settings.SEARCH_BACKEND
+    if choice == 'auto' and connection.vendor == 'sqlite':
+        if _fts_available is None:
+            _fts_available = (
+                FTS_TABLE in connection.introspection.table_names()
+            )
+        choice = 'fts5' if _fts_available else 'inverted'
+    return Fts5Index() if choice == 'fts5' else InvertedIndex()
+
+
+def post_document(post):
+    return POST, post.id, post.id, post.pub_date, post.text
+
+
+def comment_document(comment):
+    return COMMENT, comment.id, comment.post_id, comment.created, comment.text
+
+
+def index(*documents):
+    backend().index_many(documents)
+
+
+def remove(kind, *object_ids):
+    backend().remove(kind, object_ids)
+
+
+def attach(hits):
+    """Подгружает записи и комментарии; пропадает то, чего уже нет."""
+    posts = Post.objects.for_feed().in_bulk({hit.post_id for hit in hits})
+    comments = Comment.objects.select_related('author').in_bulk(
+        {hit.object_id for hit in hits if hit.kind == COMMENT}
+    )
+    found = []
+    for hit in hits:
+        hit.post = posts.get(hit.post_id)
+        if hit.kind == COMMENT:
+            hit.comment = comments.get(hit.object_id)
+            if hit.comment is None:
+                continue
+        if hit.post is not None:
+            found.append(hit)
+    return found
+
+
+class SearchPaginator(CursorPaginator):
+    """Постраничная выдача поиска по курсору (ранг, документ)."""
+
+    def __init__(self, query, per_page):
+        super().__init__([], per_page, key=('score', 'key'))
+        self.terms = terms(query)
+
+    def key_fields(self):
+        return [models.FloatField(), models.IntegerField()]
+
+    def _fetch(self, values, direction, limit, offset=0):
+        if not self.terms:
+            return []
+        return backend().search(self.terms, values, direction, limit, offset)
@@ -0,0 +1,271 @@
+"""Синтетический набор данных для замеров: авторы по Ципфу,
+подписки и комментарии по Парето."""
+import io
+import itertools
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from . import search, stats, transfer
+from .models import (COMMENT_ROOT, COMMENT_SEGMENT, Comment, Follow, Group,
+                     Post, User)
+
+# Размер набора — число записей; остальное считается от него
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+POSTS_PER_USER = 20
+POSTS_PER_GROUP = 1000
+MIN_GROUPS = 5
+GROUP_SHARE = 0.7
+IMAGE_SHARE = 0.1
+IMAGES = 50
+IMAGE_SIZE = (640, 480)
+REPLY_SHARE = 0.3
+MAX_FOLLOWS = 1000
+# Показатели степенных законов: чем меньше, тем длиннее хвост
+ZIPF_EXPONENT = 1.1
+FOLLOWS_ALPHA = 1.2
+COMMENTS_ALPHA = 2.0
+WORDS = (
+    'кот', 'дом', 'утро', 'город', 'новость', 'сегодня', 'друзья', 'лето',
+    'работа', 'море', 'книга', 'фильм', 'погода', 'дорога', 'музыка',
+    'проект', 'идея', 'вечер', 'собака', 'чай', 'поезд', 'сад', 'снег',
+    'отпуск', 'выставка', 'концерт', 'рецепт', 'прогулка', 'фото', 'гора',
+    'пишу', 'читаю', 'смотрю', 'думаю', 'гуляем', 'готовлю', 'еду', 'жду',
+    'очень', 'снова', 'наконец', 'почти', 'долго', 'быстро', 'красиво',
+)
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+def zipf_weights(count):
+    """Накопленные веса рангов 1..count для random.choices."""
+    return list(itertools.accumulate(
+        1 / rank ** ZIPF_EXPONENT for rank in range(1, count + 1)
+    ))
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Seeder:
+    """Наполняет базу набором из ``posts`` записей.
+
+    Все пользователи, группы и картинки держатся в памяти списками id,
+    записи и комментарии создаются и вставляются пачками по
+    ``batch_size``.
+    """
+
+    def __init__(self, posts, batch_size=1000, seed=None, days=365):
+        self.posts = posts
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.days = days
+        self.now = timezone.now()
+        self.counts = dict.fromkeys(
+            ('users', 'groups', 'follows', 'posts', 'comments', 'images'), 0
+        )
+
+    def run(self):
+        users = self.create_users(max(self.posts // POSTS_PER_USER, 2))
+        groups = self.create_groups(
+            max(self.posts // POSTS_PER_GROUP, MIN_GROUPS)
+        )
+        self.create_follows(users)
+        images = self.create_images(min(IMAGES, self.posts))
+        # Записи вставляются bulk_create с заранее назначенными id, а
+        # работу их сигналов потом повторяет finish_import
+        after_id = transfer.last_post_id()
+        self.create_posts(users, groups, images)
+        self.reset_sequences()
+        transfer.finish_import(after_id, self.batch_size)
+        # finish_import пересчитывает авторов, а подписки есть у всех
+        for batch in chunks(users, self.batch_size):
+            stats.recount(batch)
+        return self.counts
+
+    def text(self, low, high):
+        words = self.random.choices(WORDS, k=self.random.randint(low, high))
+        return ' '.join(words).capitalize() + '.'
+
+    def insert(self, model, objects, **options):
+        with transaction.atomic():
+            model.objects.bulk_create(objects, **options)
+
+    def create_users(self, count):
+        start = next_id(User)
+        ids = list(range(start, start + count))
+        for batch in chunks(ids, self.batch_size):
+            users = []
+            for user_id in batch:
+                user = User(
+                    id=user_id,
+                    username=f'seed{user_id}',
+                    first_name=f'Автор {user_id}'
+                )
+                user.set_unusable_password()
+                users.append(user)
+            self.insert(User, users)
+        self.counts['users'] = count
+        # Порядок в списке — ранг популярности
+        self.random.shuffle(ids)
+        return ids
+
+    def create_groups(self, count):
+        start = next_id(Group)
+        ids = list(range(start, start + count))
+        self.insert(Group, [
+            Group(
+                id=group_id,
+                title=f'Группа {group_id}',
+                slug=f'seed-{group_id}',
+                description=self.text(5, 20)
+            )
+            for group_id in ids
+        ])
+        self.counts['groups'] = count
+        return ids
+
+    def create_follows(self, users):
+        weights = zipf_weights(len(users))
+
+        def follows():
+            for user_id in users:
+                count = min(
+                    int(self.random.paretovariate(FOLLOWS_ALPHA)),
+                    MAX_FOLLOWS, len(users) - 1
+                )
+                authors = set(self.random.choices(
+                    users, cum_weights=weights, k=count
+                ))
+                authors.discard(user_id)
+                for author_id in authors:
+                    yield Follow(user_id=user_id, author_id=author_id)
+
+        for batch in chunks(follows(), self.batch_size):
+            self.insert(Follow, batch, ignore_conflicts=True)
+            self.counts['follows'] += len(batch)
+
+    def create_images(self, count):
+        storage = Post._meta.get_field('image').storage
+        names = []
+        for number in range(count):
+            image = Image.new('RGB', IMAGE_SIZE, self.color())
+            draw = ImageDraw.Draw(image)
+            for _ in range(8):
+                x, y = (
+                    self.random.randrange(IMAGE_SIZE[0]),
+                    self.random.randrange(IMAGE_SIZE[1])
+                )
+                draw.ellipse(
+                    (x, y, x + IMAGE_SIZE[0] // 4, y + IMAGE_SIZE[1] // 4),
+                    fill=self.color()
+                )
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=85)
+            names.append(storage.save(
+                f'posts/seed{number}.jpg', ContentFile(buffer.getvalue())
+            ))
+        self.counts['images'] = count
+        return names
+
+    def color(self):
+        return tuple(self.random.randrange(256) for _ in range(3))
+
+    def moment(self):
+        return self.now - timedelta(
+            seconds=self.random.uniform(0, self.days * 86400)
+        )
+
+    def create_posts(self, users, groups, images):
+        user_weights = zipf_weights(len(users))
+        group_weights = zipf_weights(len(groups))
+        start = next_id(Post)
+        for batch in chunks(range(start, start + self.posts), self.batch_size):
+            posts = []
+            for post_id in batch:
+                group_id = None
+                if self.random.random() < GROUP_SHARE:
+                    group_id = self.random.choices(
+                        groups, cum_weights=group_weights
+                    )[0]
+                image = ''
+                if images and self.random.random() < IMAGE_SHARE:
+                    image = self.random.choice(images)
+                posts.append(Post(
+                    id=post_id,
+                    text=self.text(5, 60),
+                    pub_date=self.moment(),
+                    author_id=self.random.choices(
+                        users, cum_weights=user_weights
+                    )[0],
+                    group_id=group_id,
+                    image=image
+                ))
+            transfer.bulk_create_dated(Post, posts, 'pub_date')
+            self.counts['posts'] += len(posts)
+            self.create_comments(posts, users)
+
+    def create_comments(self, posts, users):
+        start = next_id(Comment)
+        comments = []
+        for post in posts:
+            thread = []
+            count = int(self.random.paretovariate(COMMENTS_ALPHA)) - 1
+            for _ in range(count):
+                comment_id = start + len(comments)
+                parent = None
+                if thread and self.random.random() < REPLY_SHARE:
+                    parent = self.random.choice(thread)
+                if parent is not None and (
+                    parent.depth >= settings.COMMENT_MAX_DEPTH
+                ):
+                    parent = None
+                if parent is None:
+                    path = f'{COMMENT_ROOT - comment_id:0{COMMENT_SEGMENT}d}'
+                    after = post.pub_date
+                else:
+                    path = parent.path + f'{comment_id:0{COMMENT_SEGMENT}d}'
+                    after = parent.created
+                comment = Comment(
+                    id=comment_id,
+                    post_id=post.id,
+                    author_id=self.random.choice(users),
+                    text=self.text(3, 30),
+                    created=min(
+                        after + timedelta(
+                            seconds=self.random.uniform(0, 3 * 86400)
+                        ),
+                        self.now
+                    ),
+                    parent_id=parent and parent.id,
+                    path=path
+                )
+                thread.append(comment)
+                comments.append(comment)
+        transfer.bulk_create_dated(Comment, comments, 'created')
+        search.backend().index_many(map(search.comment_document, comments))
+        self.counts['comments'] += len(comments)
+
+    def reset_sequences(self):
+        """Счётчики id после вставки с явными id (PostgreSQL и др.)."""
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Group, Post, Comment]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
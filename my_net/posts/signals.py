@@ -0,0 +1,176 @@
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from . import feed_cache, search, stats, thumbnails, timeline, trending
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_init, sender=Group)
+def remember_slug(sender, instance, **kwargs):
+    instance._loaded_slug = instance.__dict__.get('slug')
+    instance._loaded_title = instance.__dict__.get('title')
+
+
+@receiver(post_save, sender=Group)
+def bump_group(sender, instance, created, raw=False, **kwargs):
+    # Заголовок и описание группы — часть её ленты, а заголовок и slug
+    # ещё и карточек её записей во всех остальных лентах
+    if not created and not raw:
+        scopes = [feed_cache.group(instance.id)]
+        if (
+            instance.__dict__.get('slug') != instance._loaded_slug
+            or instance.__dict__.get('title') != instance._loaded_title
+        ):
+            scopes += feed_cache.group_post_scopes(instance.id)
+        feed_cache.bump(*scopes)
+        feed_cache.forget_group(instance._loaded_slug, instance.slug)
+    instance._loaded_slug = instance.slug
+    instance._loaded_title = instance.__dict__.get('title')
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_posts(sender, instance, **kwargs):
+    # После удаления записи уже отвязаны от группы (SET_NULL)
+    instance._post_scopes = feed_cache.group_post_scopes(instance.id)
+
+
+@receiver(post_delete, sender=Group)
+def forget_group(sender, instance, **kwargs):
+    feed_cache.bump(
+        feed_cache.group(instance.id),
+        *getattr(instance, '_post_scopes', ())
+    )
+    feed_cache.forget_group(instance.slug)
+
+
+@receiver(post_init, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    # Без обращения к отложенному полю: только то, что уже загружено
+    instance._group_loaded = 'group_id' in instance.__dict__
+    instance._loaded_group_id = instance.__dict__.get('group_id')
+    image = instance.__dict__.get('image')
+    instance._loaded_image = getattr(image, 'name', image)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_group_id = instance._loaded_group_id
+    feed_cache.bump(*feed_cache.post_scopes(instance, [old_group_id]))
+    if created:
+        stats.bump(instance.author_id, post_count=1)
+        if instance.group_id is not None:
+            stats.bump_group(instance.group_id, 1, instance.pub_date)
+        timeline.push_post(instance)
+        trending.add_post(instance)
+    else:
+        # Группу, которую не загружали, запись и не меняла
+        if instance._group_loaded and old_group_id != instance.group_id:
+            if old_group_id is not None:
+                stats.bump_group(old_group_id, -1)
+            if instance.group_id is not None:
+                stats.bump_group(instance.group_id, 1, instance.pub_date)
+        timeline.touch_post(instance)
+    instance._group_loaded = True
+    instance._loaded_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Post)
+def queue_thumbnails(sender, instance, raw=False, **kwargs):
+    # Отложенное поле не сохранялось, значит и не менялось
+    if raw or 'image' not in instance.__dict__:
+        return
+    name = instance.image.name or ''
+    old_name = instance._loaded_image or ''
+    if name == old_name:
+        return
+    instance._loaded_image = name
+    # Тот же файл уже загружали: варианты общие, строить нечего
+    manifest = thumbnails.shared_manifest(name, exclude=instance.pk)
+    if instance.image_manifest != manifest:
+        instance.image_manifest = manifest
+        Post.objects.filter(pk=instance.pk).update(image_manifest=manifest)
+    if name and not manifest:
+        thumbnails.schedule([name])
+    if old_name:
+        transaction.on_commit(
+            lambda: thumbnails.release(old_name)
+        )
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed_cache.bump(feed_cache.follower(instance.user_id))
+        stats.bump(instance.author_id, follower_count=1)
+        stats.bump(instance.user_id, following_count=1)
+        timeline.backfill(instance.user, instance.author)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    feed_cache.bump(feed_cache.follower(instance.user_id))
+    stats.bump(instance.author_id, follower_count=-1)
+    stats.bump(instance.user_id, following_count=-1)
+    timeline.trim(instance.user_id, instance.author_id)
+    timeline.mark_cooled(instance.author_id)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    feed_cache.bump(*feed_cache.post_scopes(instance))
+    stats.bump(instance.author_id, post_count=-1)
+    if instance.group_id is not None:
+        stats.bump_group(instance.group_id, -1)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    if 'image' not in instance.__dict__ or not instance.image:
+        return
+    name = instance.image.name
+    transaction.on_commit(lambda: thumbnails.release(name))
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw and 'text' in instance.__dict__:
+        search.index(search.post_document(instance))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comments(sender, instance, raw=False, **kwargs):
+    if not raw:
+        feed_cache.bump(feed_cache.comments(instance.post_id))
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index(search.comment_document(instance))
+
+
+@receiver(post_save, sender=Comment)
+def score_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        trending.add_comments([instance.post_id])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove(search.POST, instance.id)
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    search.remove(search.COMMENT, instance.id)
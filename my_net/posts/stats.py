@@ -0,0 +1,119 @@
+from django.db import transaction
+from django.db.models import (Case, Count, F, IntegerField, OuterRef,
+                              Subquery, Value, When)
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorStats, Follow, Group, Post, User
+
+COUNTERS = ('post_count', 'follower_count', 'following_count')
+
+
+def _total(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('id'))
+            .values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def bump(user_id, **deltas):
+    """Атомарно сдвигает счётчики автора: bump(1, post_count=1)."""
+    AuthorStats.objects.filter(user_id=user_id).update(
+        **{
+            field: Greatest(F(field) + delta, 0)
+            for field, delta in deltas.items()
+        }
+    )
+
+
+def _newest(field):
+    return Subquery(
+        Post.objects.filter(**{field: OuterRef('pk')})
+        .order_by('-pub_date')
+        .values('pub_date')[:1]
+    )
+
+
+def bump_group(group_id, delta, activity=None):
+    """Сдвигает счётчик записей группы и дату последней записи.
+
+    Новая запись (``activity`` — её дата) двигает дату только вперёд;
+    после ухода записи дата берётся заново с края индекса
+    (group, -pub_date).
+    """
+    if activity is None:
+        last_activity = _newest('group')
+    else:
+        last_activity = Case(
+            When(last_activity__gte=activity, then=F('last_activity')),
+            default=Value(activity)
+        )
+    Group.objects.filter(id=group_id).update(
+        post_count=Greatest(F('post_count') + delta, 0),
+        last_activity=last_activity
+    )
+
+
+def recount_groups(group_ids):
+    """Пересчитывает счётчики групп, возвращает число исправленных."""
+    groups = Group.objects.filter(id__in=group_ids).annotate(
+        post_total=_total(Post.objects, 'group'),
+        newest=_newest('group'),
+    ).only('post_count', 'last_activity')
+    changed = []
+    for group in groups:
+        if (group.post_count, group.last_activity) != (
+            group.post_total, group.newest
+        ):
+            group.post_count = group.post_total
+            group.last_activity = group.newest
+            changed.append(group)
+    Group.objects.bulk_update(changed, ('post_count', 'last_activity'))
+    return len(changed)
+
+
+def recount(user_ids):
+    """Пересчитывает счётчики по исходным таблицам.
+
+    Возвращает число строк, значения которых разошлись с реальными.
+    """
+    users = User.objects.filter(id__in=user_ids).annotate(
+        post_total=_total(Post.objects, 'author'),
+        follower_total=_total(Follow.objects, 'author'),
+        following_total=_total(Follow.objects, 'user'),
+    ).values_list('id', 'post_total', 'follower_total', 'following_total')
+    with transaction.atomic():
+        existing = {
+            stats.user_id: stats
+            for stats in AuthorStats.objects.select_for_update().filter(
+                user_id__in=user_ids
+            )
+        }
+        changed, created = [], []
+        for user_id, *totals in users:
+            stats = existing.get(user_id)
+            if stats is None:
+                created.append(AuthorStats(user_id=user_id, **dict(
+                    zip(COUNTERS, totals))))
+            elif [getattr(stats, field) for field in COUNTERS] != totals:
+                for field, total in zip(COUNTERS, totals):
+                    setattr(stats, field, total)
+                changed.append(stats)
+        AuthorStats.objects.bulk_update(changed, COUNTERS)
+        AuthorStats.objects.bulk_create(created, ignore_conflicts=True)
+    return len(changed) + len(created)
+
+
+def stats_for(user):
+    """Счётчики автора; строка создаётся пересчётом, если её ещё нет."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        recount([user.id])
+        return AuthorStats.objects.get(user_id=user.id)
@@ -0,0 +1,127 @@
+"""Стеммер Snowball для русского языка без внешних зависимостей:
+https://snowballstem.org/algorithms/russian/stemmer.html"""
+import re
+from functools import lru_cache
+
+VOWELS = frozenset('аеиоуыэюя')
+
+PERFECTIVE_GERUND = (
+    ('в', 'вши', 'вшись'),
+    ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+)
+ADJECTIVE = (
+    (),
+    ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+     'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+     'ая', 'яя', 'ою', 'ею'),
+)
+PARTICIPLE = (
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),
+    ('ивш', 'ывш', 'ующ'),
+)
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (
+    ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет',
+     'ют', 'ны', 'ть', 'ешь', 'нно'),
+    ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй',
+     'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют',
+     'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'),
+)
+NOUN = (
+    (),
+    ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+     'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+     'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+     'ья', 'я'),
+)
+DERIVATIONAL = ((), ('ост', 'ость'))
+SUPERLATIVE = ((), ('ейше', 'ейш'))
+
+CYRILLIC = re.compile('[а-я]')
+
+
+def _after_vc(word, start):
+    """Позиция после первой пары «гласная, согласная» начиная со start."""
+    for i in range(max(start, 1), len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _regions(word):
+    rv = next(
+        (i + 1 for i, char in enumerate(word) if char in VOWELS),
+        len(word)
+    )
+    r1 = _after_vc(word, 1)
+    r2 = _after_vc(word, r1 + 1)
+    return rv, r1, r2
+
+
+def _strip(word, start, groups):
+    """Отрезает самое длинное окончание из groups внутри word[start:].
+
+    Окончания первой группы должны идти после «а» или «я», которые
+    остаются в основе. Возвращает None, если ничего не подошло.
+    """
+    after_a, plain = groups
+    best = None
+    for suffix in after_a:
+        cut = len(word) - len(suffix)
+        if (
+            word.endswith(suffix)
+            and cut - 1 >= start
+            and word[cut - 1] in 'ая'
+            and (best is None or cut < best)
+        ):
+            best = cut
+    for suffix in plain:
+        cut = len(word) - len(suffix)
+        if (
+            word.endswith(suffix)
+            and cut >= start
+            and (best is None or cut < best)
+        ):
+            best = cut
+    return None if best is None else word[:best]
+
+
+# Словарь текстов невелик, а основа слова не меняется: индексация
+# больших объёмов (seed_posts, import_posts) упирается в стеммер
+@lru_cache(maxsize=65536)
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    if not CYRILLIC.search(word):
+        return word
+    rv, _, r2 = _regions(word)
+
+    # Шаг 1
+    stripped = _strip(word, rv, PERFECTIVE_GERUND)
+    if stripped is None:
+        word = _strip(word, rv, REFLEXIVE) or word
+        stripped = _strip(word, rv, ADJECTIVE)
+        if stripped is not None:
+            stripped = _strip(stripped, rv, PARTICIPLE) or stripped
+        else:
+            stripped = _strip(word, rv, VERB) or _strip(word, rv, NOUN)
+    word = stripped or word
+
+    # Шаг 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3
+    word = _strip(word, r2, DERIVATIONAL) or word
+
+    # Шаг 4
+    if word.endswith('нн') and len(word) - 1 >= rv:
+        return word[:-1]
+    superlative = _strip(word, rv, SUPERLATIVE)
+    if superlative is not None:
+        word = superlative
+        if word.endswith('нн') and len(word) - 1 >= rv:
+            word = word[:-1]
+        return word
+    if word.endswith('ь') and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
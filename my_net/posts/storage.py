@@ -0,0 +1,56 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы именуются по SHA-256 содержимого: ``posts/ab/cd/abcd….jpg``.
+
+    Одинаковые загрузки получают одно имя и один файл на диске, а
+    значит и общие миниатюры. Файл под именем никогда не меняется,
+    поэтому веб-сервер может отдавать его с ``Cache-Control:
+    immutable``. Удаляет файл ``posts.thumbnails.release``, когда на
+    него больше не ссылается ни одна запись: выдача имени и удаление
+    идут под блокировкой ``lock`` этого имени.
+    """
+
+    def lock(self, name):
+        """Блокирует имя файла до конца текущей транзакции.
+
+        В SQLite транзакции core.backends.sqlite3 уже держат блокировку
+        записи (BEGIN IMMEDIATE), в PostgreSQL берётся advisory-lock
+        по хешу имени.
+        """
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT pg_advisory_xact_lock(hashtext(%s))', [name]
+                )
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), digest[:2], digest[2:4],
+            digest + extension
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        # До конца транзакции Post.save, которая сошлётся на файл
+        self.lock(name)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
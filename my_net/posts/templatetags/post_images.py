@@ -0,0 +1,57 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+from sorl.thumbnail.shortcuts import get_thumbnail
+
+from posts import thumbnails, variants
+
+register = template.Library()
+
+FALLBACK_TYPE = 'image/jpeg'
+
+
+def _srcset(candidates):
+    return ', '.join(
+        f'{default_storage.url(name)} {width}w'
+        for width, name in candidates
+    )
+
+
+@register.simple_tag
+def picture(post, css_class='card-img my-2'):
+    """<picture> с вариантами картинки записи по ширинам и форматам.
+
+    Пока очередь миниатюр не построила варианты, выводит прежнюю
+    миниатюру ленты (или заглушку её размера, если нет и её).
+    """
+    if not post.image:
+        return ''
+    manifest = variants.loads(post.image_manifest)
+    if (
+        manifest is None
+        or manifest.get('source') != post.image.name
+        or FALLBACK_TYPE not in manifest.get('sources', {})
+    ):
+        geometry, options = thumbnails.PRESETS[0]
+        image = get_thumbnail(post.image, geometry, **options)
+        return format_html(
+            '<img class="{}" src="{}" width="{}" height="{}" alt="">',
+            css_class, image.url, image.width, image.height
+        )
+    width = manifest['width']
+    sizes = f'(max-width: {width}px) 100vw, {width}px'
+    fallback = manifest['sources'][FALLBACK_TYPE]
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (mime, _srcset(candidates), sizes)
+            for mime, candidates in manifest['sources'].items()
+            if mime != FALLBACK_TYPE
+        )
+    )
+    return format_html(
+        '<picture>{}<img class="{}" src="{}" srcset="{}" sizes="{}" '
+        'width="{}" height="{}" loading="lazy" alt=""></picture>',
+        sources, css_class, default_storage.url(fallback[-1][1]),
+        _srcset(fallback), sizes, width, manifest['height']
+    )
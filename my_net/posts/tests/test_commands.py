@@ -0,0 +1,571 @@
+# posts/tests/test_commands.py
+import csv
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from sorl.thumbnail import default
+
+from .. import thumbnails, variants
+from ..management.commands.explain_hot_queries import Command
+from ..management.commands.import_posts import Command as ImportCommand
+from ..models import (AuthorStats, Comment, Follow, Group, Post, PostScore,
+                      ThumbnailJob, TimelineEntry, User)
+from ..templatetags.post_images import picture
+from .test_views import IMAGE_TEST, LOCAL_CACHES
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class ExplainHotQueriesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='KumKumov')
+        Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def test_hot_queries_use_indexes(self):
+        """Запросы лент не читают таблицы целиком и не сортируют"""
+        out = StringIO()
+        call_command('explain_hot_queries', stdout=out)
+        self.assertIn('Все запросы используют индексы', out.getvalue())
+
+    def test_full_scan_fails(self):
+        """Запрос без индекса роняет команду"""
+        queries = [
+            ('index', Post.objects.filter(text='Тестовый пост').order_by())
+        ]
+        with mock.patch.object(Command, 'hot_queries', return_value=queries):
+            with self.assertRaises(CommandError):
+                call_command('explain_hot_queries', stdout=StringIO())
+
+
+class RecountAuthorStatsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='KumKumov')
+        cls.reader = User.objects.create_user(username='Reader')
+        Post.objects.create(author=cls.user, text='Тестовый пост')
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def test_signals_keep_counters(self):
+        """Сигналы поддерживают счётчики без пересчёта"""
+        stats = AuthorStats.objects.get(user=self.user)
+        self.assertEqual(
+            (stats.post_count, stats.follower_count, stats.following_count),
+            (1, 1, 0)
+        )
+        Post.objects.filter(author=self.user).delete()
+        Follow.objects.all().delete()
+        stats.refresh_from_db()
+        self.assertEqual((stats.post_count, stats.follower_count), (0, 0))
+        self.assertEqual(self.reader.stats.following_count, 0)
+
+    def test_recount_repairs_drift(self):
+        """Команда чинит разошедшиеся и недостающие счётчики"""
+        AuthorStats.objects.filter(user=self.user).update(post_count=42)
+        AuthorStats.objects.filter(user=self.reader).delete()
+        out = StringIO()
+        call_command('recount_author_stats', batch_size=1, stdout=out)
+        self.assertIn('исправлено: 2', out.getvalue())
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.user).post_count, 1)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.reader).following_count, 1)
+
+    def test_recount_repairs_groups(self):
+        """Команда чинит и счётчики групп"""
+        group = Group.objects.create(title='Группа', slug='group')
+        post = Post.objects.create(author=self.user, group=group, text='-')
+        Group.objects.filter(pk=group.pk).update(
+            post_count=0, last_activity=None)
+        out = StringIO()
+        call_command('recount_author_stats', stdout=out)
+        self.assertIn('Проверено групп: 1, исправлено: 1', out.getvalue())
+        group.refresh_from_db()
+        self.assertEqual(
+            (group.post_count, group.last_activity), (1, post.pub_date))
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class DecayTrendingTests(TestCase):
+    def test_decay_in_batches(self):
+        """Затухание идёт UPDATE-ами по диапазонам и чистит затухшее"""
+        user = User.objects.create_user(username='KumKumov')
+        posts = [
+            Post.objects.create(author=user, text=f'{i}') for i in range(5)
+        ]
+        PostScore.objects.bulk_create(
+            PostScore(post=post, score=1) for post in posts)
+        PostScore.objects.filter(post=posts[0]).update(score=0.01)
+        out = StringIO()
+        call_command('decay_trending', batch_size=2, stdout=out)
+        self.assertIn(
+            'Обновлено рейтингов: 5, удалено затухших: 1', out.getvalue())
+        self.assertEqual(PostScore.objects.count(), 4)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, CACHES=LOCAL_CACHES)
+class ThumbnailQueueTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='KumKumov')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                name='small.gif',
+                content=IMAGE_TEST,
+                content_type='image/gif'
+            )
+        )
+
+    def test_saving_post_queues_thumbnails(self):
+        """Сохранение записи ставит картинку в очередь один раз"""
+        job = ThumbnailJob.objects.get()
+        self.assertEqual(job.image, self.post.image.name)
+        self.assertEqual(job.status, ThumbnailJob.PENDING)
+        self.post.text = 'Новый текст'
+        self.post.save()
+        self.assertEqual(ThumbnailJob.objects.count(), 1)
+
+    def test_feed_does_not_render_thumbnails(self):
+        """Лента без готовой миниатюры не вызывает PIL и не отдаёт
+        исходник, а в очередь ставит файл раз, а не на каждый запрос"""
+        ThumbnailJob.objects.all().delete()
+        with mock.patch.object(default.engine, 'get_image') as get_image:
+            response = self.client.get(reverse('posts:index'))
+        get_image.assert_not_called()
+        self.assertNotContains(response, self.post.image.url)
+        self.assertContains(
+            response, 'src="data:image/svg+xml,', count=1)
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertEqual(ThumbnailJob.objects.count(), 1)
+        ThumbnailJob.objects.all().delete()
+        self.client.get(reverse('posts:profile', args=[self.user.username]))
+        self.assertFalse(ThumbnailJob.objects.exists())
+
+    def test_warm_thumbnails_builds_queue(self):
+        """Команда строит миниатюры, и лента начинает их показывать"""
+        ThumbnailJob.objects.all().delete()
+        out = StringIO()
+        call_command('warm_thumbnails', workers=1, stdout=out)
+        self.assertIn('Готово: 1, с ошибкой: 0', out.getvalue())
+        self.assertEqual(
+            ThumbnailJob.objects.get().status, ThumbnailJob.DONE)
+        with mock.patch.object(default.engine, 'get_image') as get_image:
+            response = self.client.get(reverse('posts:index'))
+        get_image.assert_not_called()
+        self.assertNotContains(response, self.post.image.url)
+        self.post.refresh_from_db()
+        manifest = variants.loads(self.post.image_manifest)
+        self.assertEqual(manifest['source'], self.post.image.name)
+        self.assertContains(response, '<picture>')
+        self.assertContains(
+            response, manifest['sources']['image/jpeg'][0][1])
+
+    def test_picture_lists_modern_formats(self):
+        """Тег выводит <source> для каждого формата и srcset по ширинам"""
+        self.post.image_manifest = variants.dumps({
+            'source': self.post.image.name,
+            'width': 640,
+            'height': 226,
+            'sources': {
+                'image/webp': [[320, 'v/320.webp'], [640, 'v/640.webp']],
+                'image/jpeg': [[320, 'v/320.jpg'], [640, 'v/640.jpg']],
+            },
+        })
+        html = picture(self.post)
+        self.assertIn(
+            '<source type="image/webp" srcset="/media/v/320.webp 320w, '
+            '/media/v/640.webp 640w"', html)
+        self.assertIn('src="/media/v/640.jpg"', html)
+
+    def test_new_image_drops_manifest(self):
+        """Смена картинки сбрасывает варианты прежней"""
+        call_command('warm_thumbnails', workers=1, stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertTrue(self.post.image_manifest)
+        self.post.image = SimpleUploadedFile(
+            name='other.gif',
+            content=IMAGE_TEST.replace(b'\xFF\xFF\xFF', b'\x00\xFF\x00'),
+            content_type='image/gif'
+        )
+        self.post.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.image_manifest, '')
+        self.assertTrue(ThumbnailJob.objects.filter(
+            image=self.post.image.name,
+            status=ThumbnailJob.PENDING
+        ).exists())
+
+    def test_broken_image_fails_after_attempts(self):
+        """Битый файл повторяется MAX_ATTEMPTS раз и помечается ошибкой"""
+        ThumbnailJob.objects.filter(image=self.post.image.name).update(
+            image='posts/missing.gif'
+        )
+        out = StringIO()
+        call_command('thumbnail_worker', once=True, stdout=out)
+        job = ThumbnailJob.objects.get()
+        self.assertEqual(job.status, ThumbnailJob.FAILED)
+        self.assertEqual(job.attempts, thumbnails.MAX_ATTEMPTS)
+
+    def test_job_is_claimed_once(self):
+        """Взятое в работу задание не достанется второму исполнителю"""
+        self.assertEqual(len(thumbnails.claim(10)), 1)
+        self.assertEqual(thumbnails.claim(10), [])
+
+
+# Коммиты здесь настоящие: пул миниатюр процесса не запускаем,
+# очередь разбирают сами тесты
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    CACHES=LOCAL_CACHES,
+    THUMBNAIL_WORKERS=0
+)
+class ContentAddressedImagesTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='KumKumov')
+        self.storage = Post._meta.get_field('image').storage
+
+    def create_post(self, name='small.gif', content=IMAGE_TEST):
+        return Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(name=name, content=content)
+        )
+
+    def test_identical_uploads_share_file(self):
+        """Одинаковые картинки хранятся одним файлом с общими вариантами"""
+        first = self.create_post('first.gif')
+        call_command('warm_thumbnails', workers=1, stdout=StringIO())
+        second = self.create_post('second.gif')
+        self.assertEqual(first.image.name, second.image.name)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertTrue(second.image_manifest)
+        self.assertEqual(first.image_manifest, second.image_manifest)
+        self.assertEqual(ThumbnailJob.objects.count(), 1)
+
+    def test_file_removed_with_last_reference(self):
+        """Файл и его варианты удаляются вместе с последней записью"""
+        first = self.create_post()
+        second = self.create_post()
+        call_command('warm_thumbnails', workers=1, stdout=StringIO())
+        first.refresh_from_db()
+        name = first.image.name
+        variant = variants.loads(first.image_manifest)[
+            'sources']['image/jpeg'][0][1]
+        first.delete()
+        self.assertTrue(self.storage.exists(name))
+        second.delete()
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(self.storage.exists(variant))
+        self.assertFalse(ThumbnailJob.objects.exists())
+
+    def test_reuse_and_release_lock_name(self):
+        """Общий файл берут и удаляют под блокировкой его имени"""
+        locks = []
+        lock = self.storage.lock
+
+        def record(name):
+            locks.append((name, connection.in_atomic_block))
+            lock(name)
+
+        with mock.patch.object(self.storage, 'lock', record):
+            first = self.create_post()
+            second = self.create_post()
+            name = first.image.name
+            first.delete()
+            second.delete()
+        # Две выдачи имени и две проверки при удалении
+        self.assertEqual([lock[0] for lock in locks].count(name), 4)
+        self.assertTrue(all(atomic for _, atomic in locks))
+        self.assertFalse(self.storage.exists(name))
+
+    def test_dedup_moves_legacy_files(self):
+        """Команда переносит старые файлы под имена по содержимому"""
+        for name in ('posts/old1.gif', 'posts/old2.gif'):
+            FileSystemStorage().save(name, ContentFile(IMAGE_TEST))
+        post = self.create_post()
+        Post.objects.filter(pk=post.pk).update(image='posts/old1.gif')
+        other = self.create_post()
+        Post.objects.filter(pk=other.pk).update(image='posts/old2.gif')
+        out = StringIO()
+        call_command('dedup_post_images', stdout=out)
+        self.assertIn('Перенесено файлов: 2', out.getvalue())
+        self.assertEqual(
+            set(Post.objects.values_list('image', flat=True)),
+            {post.image.name}
+        )
+        self.assertFalse(self.storage.exists('posts/old1.gif'))
+        self.assertFalse(self.storage.exists('posts/old2.gif'))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, CACHES=LOCAL_CACHES)
+class TransferPostsTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.author = User.objects.create_user(username='KumKumov')
+        self.reader = User.objects.create_user(username='Reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.group = Group.objects.create(
+            title='Коты', slug='cats', description='Про котов')
+        self.with_image = Post.objects.create(
+            author=self.author,
+            group=self.group,
+            text='Кот спит на подоконнике',
+            image=SimpleUploadedFile(name='small.gif', content=IMAGE_TEST)
+        )
+        self.plain = Post.objects.create(
+            author=self.author, text='Собака гуляет во дворе')
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def rows(self):
+        return list(Post.objects.order_by('id').values_list(
+            'text', 'pub_date', 'author__username', 'group__slug', 'image'))
+
+    def write(self, name, content):
+        with open(self.path(name), 'w', encoding='utf-8') as file:
+            file.write(content)
+        return self.path(name)
+
+    def test_round_trip_with_images(self):
+        """Выгрузка и загрузка сохраняют записи, даты и картинки"""
+        for name, archive in (('posts.ndjson', 'images.tar'),
+                              ('posts.csv.gz', 'images.tar.gz')):
+            with self.subTest(name=name):
+                exported = self.rows()
+                call_command(
+                    'export_posts', self.path(name),
+                    images=self.path(archive), stderr=StringIO())
+                Post.objects.all().delete()
+                out = StringIO()
+                call_command(
+                    'import_posts', self.path(name),
+                    images=self.path(archive), batch_size=1,
+                    stdout=out, stderr=StringIO())
+                self.assertIn('Загружено записей: 2, пропущено: 0',
+                              out.getvalue())
+                self.assertEqual(self.rows(), exported)
+                image = Post.objects.exclude(image='').get().image
+                self.assertTrue(image.storage.exists(image.name))
+                self.assertTrue(ThumbnailJob.objects.filter(
+                    image=image.name, status=ThumbnailJob.PENDING
+                ).exists())
+
+    def test_import_replays_post_signals(self):
+        """После загрузки обновлены счётчики, поиск и ленты"""
+        call_command('export_posts', self.path('posts.ndjson'),
+                     stderr=StringIO())
+        Post.objects.all().delete()
+        ThumbnailJob.objects.all().delete()
+        self.client.get(reverse('posts:index'))
+        call_command('import_posts', self.path('posts.ndjson'),
+                     stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).post_count, 2)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 2)
+        response = self.client.get(reverse('posts:search'), {'q': 'коты'})
+        self.assertEqual(len(response.context['page_obj']), 1)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Собака гуляет во дворе')
+
+    def test_unknown_author_and_group(self):
+        """Неизвестных авторов и группы пропускает или создаёт по флагу"""
+        path = self.write('posts.csv', (
+            'text,pub_date,author,group,image\n'
+            'Первый,2020-01-02T03:04:05+00:00,Newcomer,,\n'
+            'Второй,,KumKumov,dogs,\n'
+            'Третий,вчера,KumKumov,,\n'
+        ))
+        err = StringIO()
+        call_command('import_posts', path, stdout=StringIO(), stderr=err)
+        self.assertIn('Строка 2: нет автора Newcomer', err.getvalue())
+        self.assertIn('Строка 3: нет группы dogs', err.getvalue())
+        self.assertIn('Строка 4: Неверная дата', err.getvalue())
+        self.assertEqual(Post.objects.count(), 2)
+        out = StringIO()
+        call_command('import_posts', path, create_missing=True,
+                     stdout=out, stderr=StringIO())
+        self.assertIn('Загружено записей: 2, пропущено: 1', out.getvalue())
+        post = Post.objects.get(text='Первый')
+        self.assertEqual(post.author.username, 'Newcomer')
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertFalse(post.author.has_usable_password())
+        self.assertEqual(
+            Post.objects.get(text='Второй').group.slug, 'dogs')
+
+    def test_malformed_lines(self):
+        """Битые строки NDJSON пропускаются с номером, импорт идёт дальше"""
+        Post.objects.all().delete()
+        path = self.write('posts.ndjson', (
+            '{"text": "Первый", "author": "KumKumov"}\n'
+            '{"text": "Обрыв\n'
+            '{"text": 42, "author": "KumKumov"}\n'
+            '{"text": "Второй", "author": "KumKumov"}\n'
+        ))
+        out, err = StringIO(), StringIO()
+        call_command(
+            'import_posts', path, batch_size=1, stdout=out, stderr=err)
+        self.assertIn('Загружено записей: 2, пропущено: 2', out.getvalue())
+        self.assertIn('Строка 2: неверный JSON', err.getvalue())
+        self.assertIn('Строка 3: text должно быть строкой', err.getvalue())
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).post_count, 2)
+
+    def test_malformed_csv_rows(self):
+        """Строка CSV, которую не разобрать, пропускается с номером"""
+        Post.objects.all().delete()
+        self.addCleanup(csv.field_size_limit, csv.field_size_limit(100))
+        path = self.write('posts.csv', (
+            'text,author\n'
+            f'{"Длинная" * 20},KumKumov\n'
+            'Первый,KumKumov\n'
+        ))
+        out, err = StringIO(), StringIO()
+        call_command('import_posts', path, stdout=out, stderr=err)
+        self.assertIn('Загружено записей: 1, пропущено: 1', out.getvalue())
+        self.assertIn('Строка 2: неверная строка CSV', err.getvalue())
+
+    def test_failed_import_finishes_written(self):
+        """Записанные до ошибки пачки доходят до лент и счётчиков"""
+        Post.objects.all().delete()
+        path = self.write('posts.ndjson', (
+            '{"text": "Первый", "author": "KumKumov"}\n'
+            '{"text": "Второй", "author": "KumKumov"}\n'
+        ))
+        flush = ImportCommand.flush
+
+        def fail_second(command, pending):
+            if Post.objects.exists():
+                raise RuntimeError('обрыв соединения')
+            flush(command, pending)
+
+        with mock.patch.object(ImportCommand, 'flush', fail_second):
+            with self.assertRaises(RuntimeError):
+                call_command('import_posts', path, batch_size=1,
+                             stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).post_count, 1)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 1)
+
+    def test_export_to_stdout(self):
+        """Без пути записи идут в stdout по одной на строку"""
+        out = StringIO()
+        call_command('export_posts', stdout=out, stderr=StringIO())
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(
+            [record['text'] for record in records],
+            [self.with_image.text, self.plain.text]
+        )
+        self.assertEqual(records[0]['group'], 'cats')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, CACHES=LOCAL_CACHES)
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cache.clear()
+        call_command(
+            'seed_posts', posts=60, batch_size=7, seed=1, stdout=StringIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def benchmark(self, *args, **options):
+        call_command(
+            'benchmark_views', *args, requests=2, warmup=0, host='testserver',
+            stdout=StringIO(), **options)
+
+    def test_seed_builds_consistent_dataset(self):
+        """Набор связный: счётчики, ветки комментариев и ленты на месте"""
+        self.assertEqual(Post.objects.count(), 60)
+        # Даты из генератора, а не момент вставки
+        day_ago = timezone.now() - timedelta(days=1)
+        self.assertTrue(Post.objects.filter(pub_date__lt=day_ago).exists())
+        self.assertTrue(
+            Comment.objects.filter(created__lt=day_ago).exists())
+        self.assertEqual(Group.objects.count(), 5)
+        self.assertEqual(
+            sum(AuthorStats.objects.values_list('post_count', flat=True)),
+            60)
+        for reply in Comment.objects.exclude(parent=None):
+            self.assertTrue(reply.path.startswith(reply.parent.path))
+            self.assertGreaterEqual(reply.created, reply.parent.created)
+        for follow in Follow.objects.all():
+            self.assertEqual(
+                TimelineEntry.objects.filter(
+                    user=follow.user_id, author=follow.author_id).count(),
+                follow.author.posts.count())
+
+    def test_results_and_baseline(self):
+        """Результат сохраняется в JSON, рост числа запросов — регрессия"""
+        output = os.path.join(self.directory, 'result.json')
+        self.benchmark(output=output)
+        with open(output, encoding='utf-8') as file:
+            result = json.load(file)
+        self.assertEqual(result['dataset']['posts'], Post.objects.count())
+        index = result['results']['client:index']
+        self.assertEqual(index['statuses'], {'200': 2})
+        self.assertEqual(
+            set(index['latency_ms']), {'p50', 'p90', 'p99', 'mean'})
+        self.assertGreater(index['memory_kib'], 0)
+        self.assertEqual(
+            set(result['results']['client:post_create']['statuses']),
+            {'302'})
+        for row in result['results'].values():
+            row['queries'] -= 1
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(result, file)
+        with self.assertRaisesMessage(CommandError, 'client:index: запросов'):
+            self.benchmark(views=['index'], baseline=output)
@@ -1,4 +1,6 @@
 # posts/tests/tests_form.py
+import io
+import os
 import shutil
 import tempfile
 
@@ -6,12 +8,15 @@ from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
 from ..forms import PostForm
 from ..models import Post, Group, User, Comment
+from ..uploads import TEMP_DIR
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 CREATE_POST = '/create/'
+HASHED_GIF = r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.gif$'
 IMAGE_TEST = (
     b'\x47\x49\x46\x38\x39\x61\x02\x00'
     b'\x01\x00\x80\x00\x00\x00\x00\x00'
@@ -75,14 +80,128 @@ class PostCreateFormTests(TestCase):
         )
         self.assertRedirects(response, self.profile_url)
         self.assertEqual(Post.objects.count(), posts_count + 1)
+        # Картинка хранится под SHA-256 содержимого
         self.assertTrue(
             Post.objects.filter(
                 text='Тестовый текст',
-                image='posts/small.gif'
+                image__regex=HASHED_GIF
             ).exists()
         )
 
 
+def make_image(fmt, size, exif=None, **options):
+    buffer = io.BytesIO()
+    if exif:
+        options['exif'] = exif
+    Image.new('RGB', size, 'red').save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def make_animation(frames):
+    buffer = io.BytesIO()
+    images = [Image.new('P', (4, 4), color) for color in range(frames)]
+    images[0].save(buffer, 'GIF', save_all=True,
+                   append_images=images[1:], duration=100, loop=0)
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='KumKumov')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def post_image(self, name, content):
+        return self.authorized_client.post(CREATE_POST, data={
+            'text': 'Запись с картинкой',
+            'image': SimpleUploadedFile(name=name, content=content),
+        })
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIDE=100)
+    def test_exif_stripped_and_downscaled(self):
+        """EXIF удаляется, длинная сторона уменьшается до предела"""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        response = self.post_image(
+            'photo.jpg', make_image('JPEG', (300, 200), exif.tobytes()))
+        self.assertEqual(response.status_code, 302)
+        post = Post.objects.get(text='Запись с картинкой')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (100, 67))
+            self.assertNotIn('exif', image.info)
+
+    def test_plain_image_kept(self):
+        """Картинка без метаданных хранится байт в байт"""
+        content = make_image('PNG', (30, 20))
+        self.post_image('plain.png', content)
+        post = Post.objects.get(text='Запись с картинкой')
+        with open(post.image.path, 'rb') as file:
+            self.assertEqual(file.read(), content)
+        self.assertEqual(
+            os.listdir(os.path.join(TEMP_MEDIA_ROOT, TEMP_DIR)), [])
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIDE=2)
+    def test_animation_kept(self):
+        """Анимация не теряет кадров и не уменьшается"""
+        self.post_image('anim.gif', make_animation(3))
+        post = Post.objects.get(text='Запись с картинкой')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.n_frames, 3)
+            self.assertEqual(image.size, (4, 4))
+
+    def test_icc_profile_kept(self):
+        """При удалении EXIF цветовой профиль остаётся"""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        self.post_image('photo.jpg', make_image(
+            'JPEG', (30, 20), exif.tobytes(), icc_profile=b'profile' * 10))
+        post = Post.objects.get(text='Запись с картинкой')
+        with Image.open(post.image.path) as image:
+            self.assertNotIn('exif', image.info)
+            self.assertEqual(image.info['icc_profile'], b'profile' * 10)
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=100)
+    def test_too_many_pixels_rejected(self):
+        """Размеры из заголовка больше предела — ошибка формы"""
+        response = self.post_image('big.png', make_image('PNG', (50, 50)))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('50×50', str(response.context['form'].errors['image']))
+        self.assertFalse(Post.objects.exists())
+
+    def test_not_an_image_rejected(self):
+        """Файл, который Pillow не разбирает, не сохраняется"""
+        response = self.post_image('fake.png', b'not an image' * 100)
+        self.assertTrue(response.context['form'].errors['image'])
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=100)
+    def test_too_many_bytes_rejected(self):
+        """Файл больше предела отклоняется, не дочитываясь в декодер"""
+        response = self.post_image('big.jpg', make_image('JPEG', (64, 64)))
+        self.assertIn('Файл слишком большой',
+                      str(response.context['form'].errors['image']))
+
+    @override_settings(
+        IMAGE_UPLOAD_MAX_BYTES=100,
+        DATA_UPLOAD_MAX_MEMORY_SIZE=100
+    )
+    def test_oversized_request_not_read(self):
+        """Заведомо большой запрос отклоняется по Content-Length"""
+        response = self.post_image('big.jpg', make_image('JPEG', (64, 64)))
+        self.assertIn('Запрос слишком большой',
+                      str(response.context['form'].errors['image']))
+
+
 class PostEditFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -1,20 +1,39 @@
 # posts/tests/test_views.py
+import base64
+import json
+import math
+import re
 import shutil
 import tempfile
 import time
+from io import StringIO
+from datetime import timedelta
+from unittest import mock
 
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django import forms
 from django.conf import settings
+from django.utils import timezone
+from django.utils.http import parse_http_date
 
-from ..models import Post, Group, User, Follow
+from .. import comment_buffer, page_cache, trending
+from ..models import (AuthorStats, Post, Group, User, Follow, TimelineEntry,
+                      Comment, PostScore, TrendingEpoch)
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 HOME = reverse('posts:index')
 CREATE_POST = '/create/'
+# Тесты числа запросов считают только ORM: кеш держим в памяти процесса
+LOCAL_CACHES = {
+    **settings.CACHES,
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
 IMAGE_TEST = (
     b'\x47\x49\x46\x38\x39\x61\x02\x00'
     b'\x01\x00\x80\x00\x00\x00\x00\x00'
@@ -155,18 +174,18 @@ class PostPagesTests(TestCase):
                 self.assertIsInstance(form_field, expected)
 
     def test_cache_index(self):
-        """Тест для проверки кеширования главной страницы index."""
-        cached_object = Post.objects.order_by('id')
-        cached_object = cached_object.last()
-        response_before_delete = self.client.get(reverse('posts:index'))
-        Post.objects.filter(pk=cached_object.pk).delete()
-        response_after_deleted = self.client.get(reverse('posts:index'))
-        content_deleted = response_after_deleted.content
-        self.assertEqual(response_before_delete.content, content_deleted)
-        cache.clear()
+        """Главная страница кешируется до первого изменения записей."""
+        response_before = self.client.get(reverse('posts:index'))
+        # update() не шлёт сигналов: фрагмент остаётся в кеше
+        Post.objects.update(text='Текст изменён в обход сигналов')
         response_cached = self.client.get(reverse('posts:index'))
-        content_cached = response_cached.content
-        self.assertNotEqual(content_deleted, content_cached)
+        self.assertEqual(response_before.content, response_cached.content)
+        Post.objects.order_by('id').last().delete()
+        response_after_delete = self.client.get(reverse('posts:index'))
+        self.assertNotEqual(
+            response_cached.content, response_after_delete.content)
+        self.assertContains(
+            response_after_delete, 'Текст изменён в обход сигналов')
 
 
 class PaginatorViewsTest(TestCase):
@@ -226,6 +245,72 @@ class PaginatorViewsTest(TestCase):
         self.assertEqual(len(response.context['page_obj']), 5)
 
 
+@override_settings(CACHES=LOCAL_CACHES)
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='KumKumov')
+        for i in range(15):
+            Post.objects.create(
+                author=cls.user,
+                text=f'Тестовый пост {i + 1}',
+            )
+        # Одинаковая дата у всех постов: порядок держится на id
+        Post.objects.update(pub_date=timezone.now())
+
+    def test_cursor_walks_feed_without_count(self):
+        """Курсоры обходят ленту без COUNT(*) и без пропусков"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(HOME)
+        self.assertFalse(
+            [q for q in queries if 'COUNT(' in q['sql'].upper()]
+        )
+        first_page = response.context['page_obj']
+        self.assertEqual(len(first_page), 10)
+        self.assertIsNone(first_page.previous_cursor)
+
+        response = self.client.get(
+            HOME, {'cursor': first_page.next_cursor})
+        second_page = response.context['page_obj']
+        self.assertEqual(len(second_page), 5)
+        self.assertIsNone(second_page.next_cursor)
+        texts = [post.text for post in first_page]
+        texts += [post.text for post in second_page]
+        self.assertEqual(
+            texts, [f'Тестовый пост {i}' for i in range(15, 0, -1)])
+
+        response = self.client.get(
+            HOME, {'cursor': second_page.previous_cursor})
+        self.assertEqual(
+            list(response.context['page_obj']), list(first_page))
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый курсор открывает первую страницу"""
+        response = self.client.get(HOME, {'cursor': 'не-курсор'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.context['page_obj'][0].text, 'Тестовый пост 15')
+
+    def test_forged_cursor_returns_first_page(self):
+        """Курсор с чужими типами значений открывает первую страницу"""
+        tokens = (
+            ['n', ['abc', 1]],
+            ['n', [[1], 1]],
+            ['p', ['2020-01-01T00:00:00', {'a': 1}]],
+            ['n', [None, 1]],
+        )
+        for token in tokens:
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(token).encode()).decode()
+            for url in (HOME, reverse('posts:api_index')):
+                with self.subTest(token=token, url=url):
+                    response = self.client.get(url, {'cursor': cursor})
+                    self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['results'][0]['text'], 'Тестовый пост 15')
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostIsVisibleOnTruePages(TestCase):
     @classmethod
@@ -351,3 +436,955 @@ class FollowTests(TestCase):
         self.assertEqual(Follow.objects.count(), count_of_followes + 1)
         # Проверили, что подписка активна
         self.assertTrue(self.user_follower, self.user_author)
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='TestReader')
+        cls.author = User.objects.create_user(username='TestAuthor')
+        cls.star = User.objects.create_user(username='TestStar')
+        cls.old_post = Post.objects.create(
+            author=cls.author,
+            text='Пост до подписки'
+        )
+        cls.follow_url = reverse('posts:follow_index')
+
+    def setUp(self):
+        self.client_reader = Client()
+        self.client_reader.force_login(self.reader)
+
+    def feed_texts(self):
+        response = self.client_reader.get(self.follow_url)
+        return [post.text for post in response.context['page_obj']]
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        """Подписка наполняет ленту, отписка её очищает"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.feed_texts(), ['Пост до подписки'])
+        Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(
+            self.feed_texts(), ['Новый пост', 'Пост до подписки'])
+        Follow.objects.get(user=self.reader, author=self.author).delete()
+        self.assertEqual(self.feed_texts(), [])
+
+    def test_follow_page_cache_is_per_user(self):
+        """Кешированная лента подписок не достаётся другому читателю"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.feed_texts(), ['Пост до подписки'])
+        other_client = Client()
+        other_client.force_login(self.star)
+        response = other_client.get(self.follow_url)
+        self.assertNotContains(response, 'Пост до подписки')
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_hot_author_is_read_on_the_fly(self):
+        """Посты «горячего» автора не раскладываются, но видны в ленте"""
+        Follow.objects.create(user=self.reader, author=self.star)
+        Post.objects.create(author=self.star, text='Пост звезды')
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=self.star).exists())
+        self.assertEqual(self.feed_texts(), ['Пост звезды'])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_cooled_author_posts_materialized(self):
+        """Записи времён «горячего» автора остаются в ленте и после"""
+        Follow.objects.create(user=self.reader, author=self.star)
+        Follow.objects.create(user=self.author, author=self.star)
+        for number in range(3):
+            Post.objects.create(author=self.star, text=f'Пост {number}')
+        Follow.objects.get(user=self.author, author=self.star).delete()
+        # Отписка только ставит автора в очередь, лента читает его на лету
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=self.star).exists())
+        texts = ['Пост 2', 'Пост 1', 'Пост 0']
+        self.assertEqual(self.feed_texts(), texts)
+        call_command('catch_up_timelines', batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            TimelineEntry.objects.filter(author=self.star).count(), 3)
+        self.assertFalse(
+            AuthorStats.objects.get(user=self.star).timeline_pending)
+        self.assertEqual(self.feed_texts(), texts)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class FeedQueryCountTests(TestCase):
+    """Число запросов страницы не зависит от числа записей на ней."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='TestReader')
+        cls.author = User.objects.create_user(
+            username='TestAuthor', first_name='Лев', last_name='Толстой')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_group',
+            description='Тестовое описание группы'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(settings.POSTS_PER_PAGE):
+            author = User.objects.create_user(username=f'author_{i}')
+            group = Group.objects.create(
+                title=f'Группа {i}', slug=f'group_{i}', description='-')
+            Follow.objects.create(user=cls.reader, author=author)
+            Post.objects.create(author=author, group=group, text=f'{i}')
+            Post.objects.create(
+                author=cls.author, group=cls.group, text=f'{i}')
+        cls.post = Post.objects.filter(author=cls.author).first()
+        for i in range(3):
+            Comment.objects.create(
+                post=cls.post,
+                author=User.objects.create_user(username=f'critic_{i}'),
+                text=f'Комментарий {i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client_reader = Client()
+        self.client_reader.force_login(self.reader)
+
+    def test_feed_views_query_count(self):
+        """Ленты читают записи, авторов и группы одним запросом"""
+        pages = {
+            HOME: 1,
+            reverse('posts:group', kwargs={'slug': self.group.slug}): 2,
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}): 2,
+            reverse('posts:post_detail',
+                    kwargs={'post_id': self.post.pk}): 3,
+        }
+        for url, queries in pages.items():
+            with self.subTest(url=url):
+                cache.clear()
+                with self.assertNumQueries(queries):
+                    self.client.get(url)
+
+    def test_follow_index_query_count(self):
+        """Лента подписок: сессия, пользователь, «горячие» авторы, лента"""
+        with self.assertNumQueries(4):
+            response = self.client_reader.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            len(response.context['page_obj']), settings.POSTS_PER_PAGE)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class GroupDirectoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='KumKumov')
+        self.cats = Group.objects.create(
+            title='Коты', slug='cats', description='Про котов')
+        self.dogs = Group.objects.create(
+            title='Собаки', slug='dogs', description='Про собак')
+        self.posts = [
+            Post.objects.create(author=self.user, group=self.cats, text=f'{i}')
+            for i in range(3)
+        ]
+
+    def counters(self, group):
+        group.refresh_from_db()
+        return group.post_count, group.last_activity
+
+    def test_counters_follow_posts(self):
+        """Счётчик и дата последней записи сдвигаются сигналами"""
+        first, second, last = self.posts
+        self.assertEqual(self.counters(self.cats), (3, last.pub_date))
+        self.assertEqual(self.counters(self.dogs), (0, None))
+        last.group = self.dogs
+        last.save()
+        self.assertEqual(self.counters(self.cats), (2, second.pub_date))
+        self.assertEqual(self.counters(self.dogs), (1, last.pub_date))
+        # Правка без загрузки группы её не трогает
+        post = Post.objects.only('text').get(pk=first.pk)
+        post.text = 'Правка'
+        post.save()
+        second.delete()
+        self.assertEqual(self.counters(self.cats), (1, first.pub_date))
+
+    def test_directory(self):
+        """Каталог: группы по числу записей, со счётчиком и датой"""
+        response = self.client.get(reverse('posts:groups'))
+        groups = list(response.context['page_obj'])
+        self.assertEqual(groups, [self.cats, self.dogs])
+        self.assertContains(response, 'Записей: 3')
+        self.assertContains(response, 'записей пока нет')
+        self.assertContains(
+            response, reverse('posts:group', kwargs={'slug': 'cats'}))
+
+    def test_group_page_cached_lookup(self):
+        """Лента группы не читает группу из базы, пока её не правили"""
+        url = reverse('posts:group', kwargs={'slug': 'cats'})
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        Post.objects.create(author=self.user, group=self.cats, text='Ещё')
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['page_obj']), 4)
+        self.cats.slug = 'kittens'
+        self.cats.save()
+        self.assertEqual(self.client.get(url).status_code, 404)
+        response = self.client.get(
+            reverse('posts:group', kwargs={'slug': 'kittens'}))
+        self.assertEqual(response.context['group'].slug, 'kittens')
+
+    def test_renamed_group_refreshes_feeds(self):
+        """Карточки записей во всех лентах видят новый slug и удаление"""
+        reader = User.objects.create_user(username='Reader')
+        Follow.objects.create(user=reader, author=self.user)
+        self.client.force_login(reader)
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:follow_index'),
+            reverse('posts:profile', args=[self.user.username]),
+        )
+        old = reverse('posts:group', kwargs={'slug': 'cats'})
+        for url in urls:
+            self.assertContains(self.client.get(url), old)
+        self.cats.slug = 'kittens'
+        self.cats.save()
+        new = reverse('posts:group', kwargs={'slug': 'kittens'})
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertNotContains(response, old)
+                self.assertContains(response, new)
+        self.cats.delete()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNotContains(self.client.get(url), new)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class TrendingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        TrendingEpoch.objects.update(tick=time.time())
+        self.user = User.objects.create_user(username='KumKumov')
+        self.quiet, self.hot, self.warm = (
+            Post.objects.create(author=self.user, text=text)
+            for text in ('Тихая', 'Горячая', 'Тёплая')
+        )
+
+    def discuss(self, post, count):
+        for i in range(count):
+            Comment.objects.create(post=post, author=self.user, text=f'{i}')
+
+    def scores(self):
+        return dict(PostScore.objects.values_list('post_id', 'score'))
+
+    def test_comments_rank_posts(self):
+        """Больше свежих комментариев — выше в ленте; без них записи нет"""
+        self.discuss(self.warm, 1)
+        self.discuss(self.hot, 2)
+        self.assertEqual(list(trending.feed()), [self.hot, self.warm])
+        response = self.client.get(reverse('posts:trending'))
+        self.assertEqual(
+            re.findall(r'Горячая|Тёплая|Тихая', response.content.decode()),
+            ['Горячая', 'Тёплая'])
+
+    def test_reach_seeds_score(self):
+        """Запись автора с подписчиками стартует с рейтингом охвата"""
+        for i in range(3):
+            Follow.objects.create(
+                user=User.objects.create_user(username=f'reader_{i}'),
+                author=self.user)
+        post = Post.objects.create(author=self.user, text='С охватом')
+        self.assertAlmostEqual(
+            self.scores()[post.pk], math.log1p(3), places=3)
+
+    @override_settings(TRENDING_MIN_SCORE=0.6)
+    def test_decay(self):
+        """Старый комментарий весит вдвое меньше через период полураспада"""
+        self.discuss(self.warm, 1)
+        TrendingEpoch.objects.update(
+            tick=time.time() - settings.TRENDING_HALF_LIFE)
+        # Эпоха хранится в базе и переживает сброс кэша
+        cache.clear()
+        self.discuss(self.hot, 1)
+        scores = self.scores()
+        self.assertAlmostEqual(scores[self.hot.pk], 2, places=3)
+        self.assertAlmostEqual(scores[self.warm.pk], 1, places=3)
+        self.assertEqual(trending.decay(batch_size=1), (2, 1))
+        self.assertEqual(list(self.scores()), [self.hot.pk])
+        self.assertAlmostEqual(self.scores()[self.hot.pk], 1, places=3)
+
+    def test_stale_epoch_renormalized(self):
+        """Без decay_trending масштаб не растёт бесконечно"""
+        self.discuss(self.warm, 1)
+        TrendingEpoch.objects.update(
+            tick=time.time() - 2000 * settings.TRENDING_HALF_LIFE)
+        self.discuss(self.hot, 1)
+        self.assertAlmostEqual(
+            TrendingEpoch.objects.get().tick, time.time(), delta=60)
+        scores = self.scores()
+        self.assertEqual(list(scores), [self.hot.pk])
+        self.assertAlmostEqual(scores[self.hot.pk], 1, places=3)
+
+    @override_settings(COMMENT_BUFFER=True)
+    def test_buffered_comments(self):
+        """Комментарии из буфера тоже поднимают запись"""
+        self.addCleanup(comment_buffer._buffer.clear)
+        self.client.force_login(self.user)
+        for i in range(2):
+            self.client.post(
+                reverse('posts:add_comment',
+                        kwargs={'post_id': self.quiet.pk}),
+                {'text': f'{i}'})
+        comment_buffer.flush_all()
+        self.assertAlmostEqual(self.scores()[self.quiet.pk], 2, places=3)
+
+
+@override_settings(CACHES=LOCAL_CACHES, SEARCH_BACKEND='auto')
+class SearchViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='KumKumov')
+        self.cats = Post.objects.create(
+            author=self.user, text='Мои коты спят на подоконнике')
+        self.dogs = Post.objects.create(
+            author=self.user, text='Собака гуляет во дворе')
+        self.comment = Comment.objects.create(
+            post=self.dogs, author=self.user, text='А кошки не гуляют')
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse('posts:search'), {'q': query, **params})
+
+    def found(self, response):
+        return [
+            (hit.kind, hit.object_id)
+            for hit in response.context['page_obj']
+        ]
+
+    def test_russian_word_forms(self):
+        """Запрос находит другие формы слова в записях и комментариях"""
+        self.assertEqual(
+            self.found(self.search('кот')), [('post', self.cats.pk)])
+        response = self.search('гулять')
+        self.assertCountEqual(self.found(response), [
+            ('post', self.dogs.pk), ('comment', self.comment.pk)])
+        self.assertContains(response, 'А кошки не гуляют')
+
+    def test_index_follows_edits(self):
+        """Правка и удаление сразу видны в поиске"""
+        self.cats.text = 'Мои попугаи спят'
+        self.cats.save()
+        self.assertEqual(self.found(self.search('кот')), [])
+        self.assertEqual(
+            self.found(self.search('попугай')), [('post', self.cats.pk)])
+        self.comment.delete()
+        self.assertEqual(
+            self.found(self.search('гуляют')), [('post', self.dogs.pk)])
+
+    def test_recent_posts_rank_higher(self):
+        """При равной релевантности выше более свежая запись"""
+        old = Post.objects.create(author=self.user, text='Новость дня')
+        Post.objects.filter(pk=old.pk).update(
+            pub_date=timezone.now() - timezone.timedelta(days=365))
+        old.refresh_from_db()
+        old.save()
+        new = Post.objects.create(author=self.user, text='Новость дня')
+        self.assertEqual(self.found(self.search('новости')), [
+            ('post', new.pk), ('post', old.pk)])
+
+    @override_settings(POSTS_PER_PAGE=2)
+    def test_keyset_pages(self):
+        """Курсор проходит всю выдачу без повторов и обратно"""
+        for i in range(5):
+            Post.objects.create(author=self.user, text=f'Погода {i}')
+        seen = []
+        response = self.search('погода')
+        pages = [response]
+        while True:
+            seen += self.found(response)
+            cursor = response.context['page_obj'].next_cursor
+            if cursor is None:
+                break
+            self.assertContains(response, 'q=%D0%BF')
+            response = self.search('погода', cursor=cursor)
+            pages.append(response)
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+        previous = pages[-1].context['page_obj'].previous_cursor
+        self.assertEqual(
+            self.found(self.search('погода', cursor=previous)),
+            self.found(pages[-2]))
+
+    def test_empty_query(self):
+        """Пустой запрос и одни стоп-слова ничего не ищут"""
+        for query in ('', 'и на в'):
+            with self.subTest(query=query):
+                self.assertEqual(self.found(self.search(query)), [])
+
+
+@override_settings(SEARCH_BACKEND='inverted')
+class InvertedIndexSearchViewTests(SearchViewTests):
+    """Те же проверки для переносимого индекса без FTS5"""
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class AdminChangelistTests(TestCase):
+    """Списки записей и комментариев в админке на больших таблицах"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='-')
+        self.client.force_login(self.admin)
+        self.group = Group.objects.create(
+            title='Тестовая группа', slug='test_group', description='-')
+        self.add_rows(3)
+
+    def add_rows(self, count):
+        for i in range(count):
+            author = User.objects.create_user(
+                username=f'author_{time.time_ns()}')
+            group = Group.objects.create(
+                title=f'Группа {i}', slug=f'group_{time.time_ns()}',
+                description='-')
+            post = Post.objects.create(author=author, group=group, text=f'{i}')
+            Comment.objects.create(post=post, author=author, text=f'{i}')
+
+    def queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in context.captured_queries]
+
+    def test_query_count_does_not_grow_with_rows(self):
+        """Авторы, группы и выбор группы не читаются построчно"""
+        for name in ('post', 'comment'):
+            with self.subTest(model=name):
+                url = reverse(f'admin:posts_{name}_changelist')
+                before = len(self.queries(url))
+                self.add_rows(4)
+                self.assertEqual(len(self.queries(url)), before)
+
+    def test_no_full_count(self):
+        """COUNT ограничен пределом, а второго COUNT по таблице нет"""
+        url = reverse('admin:posts_post_changelist')
+        counts = [
+            sql for sql in self.queries(url)
+            if 'COUNT(' in sql and 'posts_post' in sql
+        ]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('LIMIT', counts[0])
+
+    @override_settings(ADMIN_COUNT_LIMIT=2)
+    def test_planner_estimate_above_limit(self):
+        """За пределом число строк — оценка планировщика"""
+        url = reverse('admin:posts_post_changelist')
+        with mock.patch('posts.admin.planner_estimate', return_value=5000):
+            response = self.client.get(url)
+        self.assertEqual(response.context['cl'].result_count, 5000)
+
+    def test_date_hierarchy(self):
+        """Навигация по датам строится по границам, фильтр — диапазоном"""
+        today = timezone.localdate()
+        url = reverse('admin:posts_post_changelist')
+        response = self.client.get(url, {
+            'pub_date__year': today.year,
+            'pub_date__month': today.month,
+        })
+        self.assertContains(response, f'pub_date__day={today.day}')
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get(url, {'pub_date__year': today.year - 1})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def test_list_editable_group(self):
+        """Группа меняется прямо из списка"""
+        post = Post.objects.first()
+        response = self.client.post(
+            reverse('admin:posts_post_changelist'), {
+                'form-TOTAL_FORMS': 1,
+                'form-INITIAL_FORMS': 1,
+                'form-0-id': post.pk,
+                'form-0-group': self.group.pk,
+                '_save': 'Сохранить',
+            })
+        self.assertEqual(response.status_code, 302)
+        post.refresh_from_db()
+        self.assertEqual(post.group, self.group)
+
+
+@override_settings(CACHES=LOCAL_CACHES, COMMENTS_PER_PAGE=3)
+class CommentThreadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='KumKumov')
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(author=self.user, text='Тест')
+        self.detail = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.add = reverse(
+            'posts:add_comment', kwargs={'post_id': self.post.pk})
+        self.more = reverse(
+            'posts:post_comments', kwargs={'post_id': self.post.pk})
+
+    def comment(self, text, parent=None):
+        self.client.post(self.add, {
+            'text': text, 'parent': parent.pk if parent else ''})
+        return Comment.objects.get(text=text)
+
+    def texts(self, comments):
+        return [comment.text for comment in comments]
+
+    def test_threads_order(self):
+        """Новые ветки сверху, ответы под родителем по порядку"""
+        first = self.comment('первый')
+        second = self.comment('второй')
+        reply = self.comment('ответ', first)
+        self.comment('ответ на ответ', reply)
+        self.comment('ещё ответ', first)
+        self.assertEqual(reply.parent, first)
+        comments = Comment.objects.filter(post=self.post).order_by('path')
+        self.assertEqual(self.texts(comments), [
+            'второй', 'первый', 'ответ', 'ответ на ответ', 'ещё ответ'])
+        self.assertEqual(
+            [comment.depth for comment in comments], [0, 0, 1, 2, 1])
+        self.assertEqual(second.depth, 0)
+
+    @override_settings(COMMENT_MAX_DEPTH=1)
+    def test_max_depth(self):
+        """Ответ глубже предела встаёт рядом с родителем"""
+        root = self.comment('корень')
+        reply = self.comment('ответ', root)
+        deep = self.comment('глубже', reply)
+        self.assertEqual(deep.parent, root)
+        self.assertEqual(deep.depth, 1)
+
+    def test_parent_from_other_post(self):
+        """Чужой комментарий не становится родителем"""
+        other = Post.objects.create(author=self.user, text='Другая')
+        foreign = Comment.objects.create(
+            post=other, author=self.user, text='чужой')
+        self.assertIsNone(self.comment('новый', foreign).parent)
+
+    def test_pages_and_json_fragment(self):
+        """Страница комментариев и догрузка JSON-фрагментами"""
+        for i in range(7):
+            Comment.objects.create(
+                post=self.post, author=self.user, text=f'комментарий {i}')
+        with self.assertNumQueries(5):
+            response = self.client.get(self.detail)
+        seen = self.texts(response.context['comments'])
+        url = response.context['more_comments_url']
+        self.assertEqual(len(seen), 3)
+        while url:
+            data = self.client.get(url).json()
+            seen += re.findall(r'комментарий \d', data['html'])
+            url = data['next']
+        self.assertEqual(
+            seen, [f'комментарий {i}' for i in reversed(range(7))])
+
+    def test_missing_post(self):
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 10 ** 6}))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(COMMENT_BUFFER=True)
+class BufferedCommentTests(TestCase):
+    def setUp(self):
+        self.addCleanup(comment_buffer._buffer.clear)
+        self.user = User.objects.create_user(username='KumKumov')
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(author=self.user, text='Тест')
+        self.detail = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.add = reverse(
+            'posts:add_comment', kwargs={'post_id': self.post.pk})
+
+    def comment(self, text, parent=None):
+        return self.client.post(self.add, {
+            'text': text, 'parent': parent.pk if parent else ''})
+
+    def test_author_sees_pending_comment(self):
+        """Свой комментарий виден сразу, в базе — после flush"""
+        self.assertRedirects(self.comment('в буфере'), self.detail)
+        self.assertFalse(Comment.objects.exists())
+        response = self.client.get(self.detail)
+        self.assertContains(response, 'в буфере')
+        self.assertContains(response, 'Отправляется')
+        self.assertNotContains(
+            Client().get(self.detail), 'в буфере')
+        comment_buffer.flush_all()
+        response = self.client.get(self.detail)
+        self.assertNotContains(response, 'Отправляется')
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            ['в буфере'])
+        self.assertEqual(
+            self.client.session[comment_buffer.SESSION_KEY], [])
+
+    def test_order_and_threads(self):
+        """Порядок приёма сохраняется в id, датах и ветках"""
+        root = Comment.objects.create(
+            post=self.post, author=self.user, text='корень')
+        for text in ('первый', 'второй'):
+            self.comment(text)
+        self.comment('ответ', root)
+        comment_buffer.flush_all()
+        written = Comment.objects.exclude(pk=root.pk).order_by('id')
+        self.assertEqual(
+            [comment.text for comment in written],
+            ['первый', 'второй', 'ответ'])
+        self.assertEqual(
+            [comment.created for comment in written],
+            sorted(comment.created for comment in written))
+        threads = Comment.objects.filter(post=self.post).order_by('path')
+        self.assertEqual(
+            [(comment.text, comment.depth) for comment in threads],
+            [('второй', 0), ('первый', 0), ('корень', 0), ('ответ', 1)])
+        found = self.client.get(reverse('posts:search'), {'q': 'ответ'})
+        self.assertEqual(
+            [(hit.kind, hit.object_id) for hit in found.context['page_obj']],
+            [('comment', written.last().pk)])
+
+    def test_keeps_acceptance_date(self):
+        """Дата комментария — момент приёма, а не записи"""
+        self.comment('в буфере')
+        accepted = comment_buffer._buffer[0].created
+        comment_buffer.flush_all()
+        self.assertEqual(Comment.objects.get().created, accepted)
+        other = Comment.objects.create(
+            post=self.post, author=self.user, text='сразу')
+        self.assertGreater(other.created, accepted)
+
+    def test_ids_from_database(self):
+        """id удалённого комментария не достаётся новому"""
+        deleted = Comment.objects.create(
+            post=self.post, author=self.user, text='удалённый').pk
+        Comment.objects.filter(pk=deleted).delete()
+        self.comment('новый')
+        comment_buffer.flush_all()
+        comment = Comment.objects.get()
+        self.assertGreater(comment.pk, deleted)
+        self.assertEqual(comment.depth, 0)
+
+    @override_settings(COMMENT_BUFFER_BATCH=3)
+    def test_micro_batches(self):
+        """Пачка пишется постоянным числом запросов"""
+        for i in range(8):
+            self.comment(f'комментарий {i}')
+        # Первая пачка ещё и заводит служебные ключи кэша
+        comment_buffer.flush()
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(comment_buffer.flush(), 3)
+        self.assertEqual(Comment.objects.count(), 6)
+        queries = len(context.captured_queries)
+        for i in range(8, 9):
+            self.comment(f'комментарий {i}')
+        with self.assertNumQueries(queries):
+            comment_buffer.flush()
+        self.assertEqual(Comment.objects.count(), 9)
+
+    def test_failed_write_keeps_buffer(self):
+        """Неудачная запись возвращает пачку в буфер"""
+        self.comment('первый')
+        self.comment('второй')
+        with mock.patch.object(
+            comment_buffer, 'write', side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                comment_buffer.flush()
+        comment_buffer.flush_all()
+        self.assertEqual(
+            list(Comment.objects.order_by('id').values_list(
+                'text', flat=True)),
+            ['первый', 'второй'])
+
+    def test_deleted_post(self):
+        """Комментарии к удалённой записи пропадают, как каскадом"""
+        self.comment('к удалённой')
+        Post.objects.filter(pk=self.post.pk).delete()
+        comment_buffer.flush_all()
+        self.assertFalse(Comment.objects.exists())
+
+    def test_deleted_author(self):
+        """Комментарии удалённого автора не держат остальные"""
+        reader = User.objects.create_user(username='Reader')
+        post = Post.objects.create(author=reader, text='Чужая')
+        self.add = reverse('posts:add_comment', kwargs={'post_id': post.pk})
+        self.comment('от удалённого')
+        self.client.force_login(reader)
+        self.comment('от читателя')
+        self.user.delete()
+        comment_buffer.flush_all()
+        self.assertFalse(comment_buffer._buffer)
+        self.assertEqual(
+            list(Comment.objects.values_list('text', flat=True)),
+            ['от читателя'])
+
+    def test_failing_batch_dropped(self):
+        """Пачка, которая не пишется, уходит в лог после нескольких попыток"""
+        self.comment('не пишется')
+        with mock.patch.object(
+            comment_buffer, 'write', side_effect=RuntimeError
+        ), self.assertLogs('posts.comment_buffer', 'ERROR') as logs:
+            for _ in range(settings.COMMENT_BUFFER_ATTEMPTS):
+                with self.assertRaises(RuntimeError):
+                    comment_buffer.flush()
+        self.assertFalse(comment_buffer._buffer)
+        self.assertIn('не пишется', logs.output[0])
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='KumKumov', first_name='Лев', last_name='Толстой')
+        self.group = Group.objects.create(
+            title='Тестовая группа', slug='test_group', description='-')
+        for i in range(settings.POSTS_PER_PAGE + 2):
+            self.post = Post.objects.create(
+                author=self.user, group=self.group, text=f'Запись {i}')
+        self.urls = (
+            reverse('posts:api_index'),
+            reverse('posts:api_group', kwargs={'slug': self.group.slug}),
+            reverse('posts:api_profile',
+                    kwargs={'username': self.user.username}),
+            reverse('posts:api_post_detail',
+                    kwargs={'post_id': self.post.pk}),
+        )
+
+    def test_feed_json(self):
+        """Лента — JSON со страницей записей и курсором"""
+        data = self.client.get(self.urls[0]).json()
+        self.assertEqual(len(data['results']), settings.POSTS_PER_PAGE)
+        first = data['results'][0]
+        self.assertEqual(first['id'], self.post.pk)
+        self.assertEqual(first['author']['full_name'], 'Лев Толстой')
+        self.assertEqual(first['group']['slug'], self.group.slug)
+        self.assertIsNone(first['image'])
+        data = self.client.get(
+            self.urls[0], {'cursor': data['next']}).json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertIsNone(data['next'])
+
+    def test_not_modified(self):
+        """Неизменная лента — 304 без чтения записей"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('no-cache', response['Cache-Control'])
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(any(
+                    'posts_post"."text' in query['sql']
+                    for query in context.captured_queries))
+
+    def test_last_modified_not_moved_back(self):
+        """Удаление свежей записи не откатывает Last-Modified"""
+        self.post.delete()
+        Post.objects.update(pub_date=timezone.now() - timedelta(days=365))
+        for url in self.urls[:3]:
+            with self.subTest(url=url):
+                modified = parse_http_date(
+                    self.client.get(url)['Last-Modified'])
+                self.assertGreater(modified, time.time() - 60)
+
+    def test_changes_invalidate_etag(self):
+        """Новая запись и новый комментарий меняют ETag"""
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий')
+        Post.objects.create(author=self.user, group=self.group, text='Ещё')
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_follow_feed(self):
+        """Лента подписок — только для вошедших и только приватно"""
+        url = reverse('posts:api_follow_index')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.user)
+        self.client.force_login(reader)
+        response = self.client.get(url)
+        self.assertEqual(
+            len(response.json()['results']), settings.POSTS_PER_PAGE)
+        self.assertIn('private', response['Cache-Control'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_post_detail_comments(self):
+        reply_to = Comment.objects.create(
+            post=self.post, author=self.user, text='Вопрос')
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Ответ', parent=reply_to)
+        data = self.client.get(self.urls[3]).json()
+        self.assertEqual(data['post']['id'], self.post.pk)
+        self.assertEqual(
+            [(c['text'], c['depth']) for c in data['comments']['results']],
+            [('Вопрос', 0), ('Ответ', 1)])
+
+    def test_missing_objects(self):
+        for url in (
+            reverse('posts:api_group', kwargs={'slug': 'nope'}),
+            reverse('posts:api_profile', kwargs={'username': 'nope'}),
+            reverse('posts:api_post_detail', kwargs={'post_id': 10 ** 6}),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ConditionalFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='KumKumov')
+        self.reader = User.objects.create_user(username='TestReader')
+        self.group = Group.objects.create(
+            title='Тестовая группа', slug='test_group', description='-')
+        Post.objects.create(
+            author=self.author, group=self.group, text='Тестовый пост')
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.urls = (
+            HOME,
+            reverse('posts:group', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+        )
+
+    def test_not_modified_before_feed_query(self):
+        """Неизменная лента — 304 без запросов к записям"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('Last-Modified', response)
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(any(
+                    'posts_post' in query['sql']
+                    for query in context.captured_queries))
+
+    def test_cache_control(self):
+        """Анонимную страницу может хранить прокси, чужую — нет"""
+        anonymous = self.client.get(HOME)
+        self.assertIn('public', anonymous['Cache-Control'])
+        self.assertIn('s-maxage=60', anonymous['Cache-Control'])
+        self.assertIn('Cookie', anonymous['Vary'])
+        reader = self.reader_client.get(HOME)
+        self.assertIn('private', reader['Cache-Control'])
+        self.assertNotEqual(anonymous['ETag'], reader['ETag'])
+        response = self.reader_client.get(
+            HOME, HTTP_IF_NONE_MATCH=anonymous['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_changes_invalidate_etag(self):
+        """Новая запись и подписка меняют ETag"""
+        etags = [self.reader_client.get(url)['ETag'] for url in self.urls]
+        Post.objects.create(
+            author=self.author, group=self.group, text='Ещё пост')
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.reader_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+        etag = self.reader_client.get(self.urls[2])['ETag']
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.reader_client.get(
+            self.urls[2], HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Отписаться')
+
+    def test_missing_feed(self):
+        for url in (
+            reverse('posts:group', kwargs={'slug': 'nope'}),
+            reverse('posts:profile', kwargs={'username': 'nope'}),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='KumKumov')
+        self.group = Group.objects.create(
+            title='Тестовая группа', slug='test_group', description='-')
+        Post.objects.create(
+            author=self.author, group=self.group, text='Тестовый пост')
+        self.urls = (
+            HOME,
+            reverse('posts:group', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+        )
+
+    def test_hit_skips_view(self):
+        """Повторный запрос анонима отдаётся из кэша без запросов к БД"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                self.assertEqual(first['X-Page-Cache'], 'miss')
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertEqual(response['X-Page-Cache'], 'hit')
+                self.assertEqual(response.content, first.content)
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=first['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_scope_change_rerenders(self):
+        """Новая запись сбрасывает страницы своих лент"""
+        for url in self.urls:
+            self.client.get(url)
+        Post.objects.create(
+            author=self.author, group=self.group, text='Свежая запись')
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response['X-Page-Cache'], 'miss')
+                self.assertContains(response, 'Свежая запись')
+
+    def test_logged_in_bypass(self):
+        self.client.force_login(self.author)
+        self.client.get(HOME)
+        response = self.client.get(HOME)
+        self.assertNotIn('X-Page-Cache', response)
+
+    def lock(self, url):
+        key = page_cache.page_key(
+            RequestFactory().get(url))[len(page_cache.PAGE_PREFIX):]
+        cache.set(page_cache.LOCK_PREFIX + key, 1)
+
+    def test_stale_while_revalidate(self):
+        """Пока страницу строит другой запрос, отдаётся старая копия"""
+        self.client.get(HOME)
+        Post.objects.create(author=self.author, text='Свежая запись')
+        self.lock(HOME)
+        response = self.client.get(HOME)
+        self.assertEqual(response['X-Page-Cache'], 'stale')
+        self.assertNotContains(response, 'Свежая запись')
+        with override_settings(PAGE_CACHE_MAX_STALE=-1,
+                               PAGE_CACHE_LOCK_WAIT=0):
+            response = self.client.get(HOME)
+        self.assertContains(response, 'Свежая запись')
+
+    def test_cold_page_waits_for_single_render(self):
+        """На холодной странице ждём тот запрос, что её строит"""
+        rendered = self.client.get(HOME).content
+        key = page_cache.page_key(RequestFactory().get(HOME))
+        entry = cache.get(key)
+        cache.delete(key)
+        self.lock(HOME)
+
+        def finish_render(seconds):
+            cache.set(key, entry)
+
+        with mock.patch('posts.page_cache.time.sleep', finish_render):
+            with self.assertNumQueries(0):
+                response = self.client.get(HOME)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertEqual(response.content, rendered)
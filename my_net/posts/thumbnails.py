@@ -0,0 +1,278 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import connection, transaction
+from django.db.models import F
+from sorl.thumbnail import default
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import feed_cache, variants
+from .models import Post, ThumbnailJob
+
+logger = logging.getLogger(__name__)
+
+# Миниатюры, которые рисуют шаблоны лент и страницы записи
+PRESETS = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+MAX_ATTEMPTS = 3
+# Промах миниатюры в запросе ставит файл в очередь не чаще раза
+# в столько секунд
+REQUEUE_TIMEOUT = 60 * 60
+QUEUED_PREFIX = 'thumbnail_queued:'
+PLACEHOLDER = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}">'
+    '<rect width="{0}" height="{1}" fill="#e9ecef"/></svg>'
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def enqueue(names):
+    """Ставит файлы в очередь; уже поставленные пропускаются."""
+    ThumbnailJob.objects.bulk_create(
+        (ThumbnailJob(image=name) for name in names if name),
+        batch_size=settings.THUMBNAIL_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def claim(limit, names=None):
+    """Забирает до ``limit`` заданий из очереди.
+
+    Задание переходит в работу условным UPDATE по старому состоянию,
+    поэтому одно и то же задание не достанется двум исполнителям.
+    """
+    pending = ThumbnailJob.objects.filter(status=ThumbnailJob.PENDING)
+    if names is not None:
+        pending = pending.filter(image__in=names)
+    candidates = pending.order_by('id').values_list('id', 'image')[:limit]
+    claimed = []
+    for job_id, name in candidates:
+        taken = ThumbnailJob.objects.filter(
+            id=job_id, status=ThumbnailJob.PENDING
+        ).update(status=ThumbnailJob.RUNNING, attempts=F('attempts') + 1)
+        if taken:
+            claimed.append((job_id, name))
+    return claimed
+
+
+def generate(name):
+    """Рисует все миниатюры и варианты файла, возвращает манифест.
+
+    В запросе это больше не происходит.
+    """
+    backend = ThumbnailBackend()
+    for geometry, options in PRESETS:
+        thumbnail = backend.get_thumbnail(name, geometry, **options)
+        # sorl глотает ошибки чтения исходника и не пишет миниатюру
+        # в хранилище ключей: такое задание надо повторить
+        if not default.kvstore.get(thumbnail):
+            raise IOError(f'Миниатюра {geometry} для {name} не создана')
+    return variants.build(name)
+
+
+def _try_generate(name):
+    """(манифест, None) или (None, ошибка)."""
+    try:
+        return generate(name), None
+    except Exception as error:
+        logger.exception('Не удалось построить миниатюру %s', name)
+        return None, error
+
+
+def _try_generate_in_thread(name):
+    try:
+        return _try_generate(name)
+    finally:
+        # У каждого потока пула своё соединение с БД (хранилище sorl)
+        connection.close()
+
+
+def _finish(results):
+    done = []
+    for (job_id, name), (manifest, error) in results:
+        if error is None:
+            done.append(name)
+            Post.objects.filter(image=name).update(
+                image_manifest=variants.dumps(manifest)
+            )
+            continue
+        jobs = ThumbnailJob.objects.filter(id=job_id)
+        jobs.filter(attempts__lt=MAX_ATTEMPTS).update(
+            status=ThumbnailJob.PENDING, error=str(error)
+        )
+        jobs.filter(attempts__gte=MAX_ATTEMPTS).update(
+            status=ThumbnailJob.FAILED, error=str(error)
+        )
+    ThumbnailJob.objects.filter(image__in=done).update(
+        status=ThumbnailJob.DONE, error=''
+    )
+    # Фрагменты лент могли закэшироваться с исходной картинкой
+    posts = Post.objects.filter(image__in=done).only('author', 'group')
+    scopes = {
+        scope
+        for post in posts.iterator()
+        for scope in feed_cache.post_scopes(post)
+    }
+    if scopes:
+        feed_cache.bump(*scopes)
+    return len(done)
+
+
+def run_jobs(workers=1, limit=None, names=None):
+    """Выполняет задания очереди пулом из ``workers`` потоков.
+
+    Возвращает (готово, с ошибкой).
+    """
+    limit = limit or settings.THUMBNAIL_BATCH_SIZE
+    jobs = claim(limit, names)
+    if not jobs:
+        return 0, 0
+    files = [name for _, name in jobs]
+    if workers > 1:
+        with ThreadPoolExecutor(workers) as executor:
+            results = list(executor.map(_try_generate_in_thread, files))
+    else:
+        results = [_try_generate(name) for name in files]
+    done = _finish(zip(jobs, results))
+    return done, len(jobs) - done
+
+
+def _run_in_background(names):
+    try:
+        run_jobs(names=names)
+    except Exception:
+        logger.exception('Очередь миниатюр: задания останутся воркеру')
+    finally:
+        connection.close()
+
+
+def schedule(names):
+    """Ставит файлы в очередь и после коммита отдаёт их пулу процесса.
+
+    Если процесс упадёт раньше, задания дождутся thumbnail_worker.
+    """
+    names = [name for name in names if name]
+    if not names:
+        return
+    enqueue(names)
+    if not settings.THUMBNAIL_WORKERS:
+        return
+
+    def submit():
+        global _pool
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    settings.THUMBNAIL_WORKERS,
+                    thread_name_prefix='thumbnails'
+                )
+        _pool.submit(_run_in_background, names)
+
+    transaction.on_commit(submit)
+
+
+def shared_manifest(name, exclude=None):
+    """Манифест уже построенных вариантов того же файла, если есть."""
+    return Post.objects.filter(image=name).exclude(
+        pk=exclude
+    ).exclude(image_manifest='').values_list(
+        'image_manifest', flat=True
+    ).first() or ''
+
+
+def release(name):
+    """Удаляет файл картинки со всеми производными, если он ничей.
+
+    Одинаковые загрузки делят один файл (ContentAddressedStorage),
+    поэтому файл живёт, пока на него ссылается хоть одна запись.
+    """
+    if not name:
+        return False
+    storage = Post._meta.get_field('image').storage
+    with transaction.atomic():
+        # Под блокировкой имени Post.save не сошлётся на файл, пока
+        # ссылки проверяются и файл удаляется
+        storage.lock(name)
+        if Post.objects.filter(image=name).exists():
+            return False
+        ThumbnailJob.objects.filter(image=name).delete()
+        try:
+            variants.remove(name)
+            # Исходник вместе с миниатюрами sorl и их ключами
+            delete_thumbnails(ImageFile(name, storage))
+        except SuspiciousFileOperation:
+            # Имя вне MEDIA_ROOT (записи, созданные в обход формы):
+            # такой файл нам не принадлежит
+            logger.warning('Картинка %s вне хранилища, не удаляем', name)
+            return False
+    return True
+
+
+def recover_stale():
+    """Возвращает в очередь задания, брошенные упавшим исполнителем."""
+    return ThumbnailJob.objects.filter(
+        status=ThumbnailJob.RUNNING
+    ).update(status=ThumbnailJob.PENDING)
+
+
+class Placeholder:
+    """Заглушка миниатюры, которой ещё нет: серый SVG её размера.
+
+    Картинка встроена в адрес, поэтому браузер не скачивает ни её,
+    ни исходник.
+    """
+
+    def __init__(self, geometry_string):
+        width, _, height = geometry_string.partition('x')
+        self.width = int(width or height)
+        self.height = int(height or width)
+        self.url = 'data:image/svg+xml,' + quote(
+            PLACEHOLDER.format(self.width, self.height)
+        )
+
+
+def enqueue_missing(name):
+    """enqueue() для промаха в запросе: раз в REQUEUE_TIMEOUT на файл."""
+    key = QUEUED_PREFIX + hashlib.md5(name.encode()).hexdigest()
+    if cache.add(key, 1, REQUEUE_TIMEOUT):
+        enqueue([name])
+
+
+class QueuedThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который не рисует миниатюры во время запроса.
+
+    Готовая миниатюра берётся из хранилища ключей sorl; если её ещё
+    нет, файл ставится в очередь, а шаблон получает Placeholder.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        cached = default.kvstore.get(ImageFile(name, default.storage))
+        if cached:
+            return cached
+        enqueue_missing(source.name)
+        return Placeholder(geometry_string)
@@ -0,0 +1,210 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .models import AuthorStats, FEED_FIELDS, Follow, Post, TimelineEntry
+from .pagination import CursorPaginator, NEXT
+
+
+def hot_condition(prefix=''):
+    """Условие на AuthorStats «автор читается через fan-out-on-read».
+
+    Автор, опустившийся до лимита, остаётся «горячим», пока
+    catch_up_timelines не разложит его записи по лентам.
+    """
+    return (
+        Q(**{f'{prefix}follower_count__gt': settings.TIMELINE_FANOUT_LIMIT})
+        | Q(**{f'{prefix}timeline_pending': True})
+    )
+
+
+def is_hot(author):
+    """Автор, чьи новые записи не раскладываются по лентам."""
+    return AuthorStats.objects.filter(
+        hot_condition(), user=author
+    ).exists()
+
+
+def hot_authors(user):
+    """id «горячих» авторов, на которых подписан ``user``."""
+    return Follow.objects.filter(
+        hot_condition('author__stats__'), user=user
+    ).values('author')
+
+
+def push_post(post):
+    """Раскладывает новую запись по лентам подписчиков автора."""
+    if is_hot(post.author):
+        return
+    followers = Follow.objects.filter(
+        author=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                post=post,
+                author_id=post.author_id,
+                pub_date=post.pub_date
+            )
+            for user_id in followers.iterator()
+        ),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def touch_post(post):
+    """Переносит отредактированную запись на новую дату во всех лентах."""
+    TimelineEntry.objects.filter(post=post).update(pub_date=post.pub_date)
+
+
+def backfill(user, author):
+    """Добавляет в ленту ``user`` уже опубликованные записи ``author``."""
+    # Автор в очереди catch_up_timelines читается на лету, но новому
+    # подписчику его записи раскладываются сразу, как обычно
+    if AuthorStats.objects.filter(
+        user=author, follower_count__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).exists():
+        return
+    posts = Post.objects.filter(author=author).values_list('id', 'pub_date')
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user=user,
+                post_id=post_id,
+                author=author,
+                pub_date=pub_date
+            )
+            for post_id, pub_date in posts.iterator()
+        ),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def mark_cooled(author):
+    """Ставит в очередь автора, опустившегося до TIMELINE_FANOUT_LIMIT.
+
+    Записи, опубликованные сверх лимита, читались на лету и в ленты
+    не попали; их раскладывает catch_up_timelines вне запроса.
+    """
+    AuthorStats.objects.filter(
+        user=author, follower_count=settings.TIMELINE_FANOUT_LIMIT
+    ).update(timeline_pending=True)
+
+
+def _materialize(author, posts, batch_size):
+    if not posts:
+        return 0
+    followers = list(Follow.objects.filter(
+        author=author
+    ).values_list('user_id', flat=True))
+    # Подписчиков берём столько, чтобы вставка была около batch_size строк
+    step = max(batch_size // max(len(posts), 1), 1)
+    written = 0
+    for start in range(0, len(followers), step):
+        written += len(TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    user_id=user_id,
+                    post_id=post_id,
+                    author_id=author,
+                    pub_date=pub_date
+                )
+                for user_id in followers[start:start + step]
+                for post_id, pub_date in posts
+            ],
+            ignore_conflicts=True
+        ))
+    return written
+
+
+def catch_up(author, batch_size=None):
+    """Раскладывает записи автора из очереди mark_cooled по лентам.
+
+    Записи идут от новых к старым пачками по ``batch_size``; пока
+    очередь не разобрана, автор читается на лету. Возвращает число
+    разложенных строк (вместе с уже бывшими в лентах).
+    """
+    batch_size = batch_size or settings.TIMELINE_BATCH_SIZE
+    posts = Post.objects.filter(author=author).values_list('id', 'pub_date')
+    newest = posts.order_by('-id').values_list(
+        'id', flat=True
+    ).first() or 0
+    written = 0
+    last_id = newest + 1
+    while True:
+        batch = list(
+            posts.filter(id__lt=last_id).order_by('-id')[:batch_size]
+        )
+        if not batch:
+            break
+        written += _materialize(author, batch, batch_size)
+        last_id = batch[-1][0]
+    with transaction.atomic():
+        AuthorStats.objects.filter(user=author).update(
+            timeline_pending=False
+        )
+        # Вышедшие за время разбора: push_post их пропустил
+        written += _materialize(
+            author, list(posts.filter(id__gt=newest)), batch_size
+        )
+    return written
+
+
+def trim(user, author):
+    """Убирает записи ``author`` из ленты ``user`` после отписки."""
+    TimelineEntry.objects.filter(user=user, author=author).delete()
+
+
+class TimelinePaginator(CursorPaginator):
+    """Лента подписок: материализованная часть плюс «горячие» авторы.
+
+    Записи обычных авторов читаются из ``TimelineEntry`` диапазоном по
+    индексу, записи авторов с огромным числом подписчиков — напрямую из
+    ``Post`` (fan-out-on-read). Оба окна выбираются по одному курсору и
+    сливаются по ключу (pub_date, id).
+    """
+
+    def __init__(self, user, per_page):
+        super().__init__(
+            TimelineEntry.objects.filter(user=user), per_page
+        )
+        self.hot_authors = hot_authors(user)
+
+    @cached_property
+    def hot_author_ids(self):
+        return list(self.hot_authors.values_list('author', flat=True))
+
+    def hot_feeds(self):
+        # Отдельное окно на каждого автора: IN по нескольким авторам
+        # не даёт читать индекс (author, -pub_date) в нужном порядке
+        return [
+            Post.objects.for_feed().filter(author_id=author_id)
+            for author_id in self.hot_author_ids
+        ]
+
+    def _fetch(self, values, direction, limit, offset=0):
+        stop = offset + limit
+        entries = self._window(
+            self.object_list.select_related(
+                'post__author', 'post__group'
+            ).only(
+                'pub_date', 'post',
+                *(f'post__{field}' for field in FEED_FIELDS)
+            ),
+            ('pub_date', 'post_id'), values, direction, stop
+        )
+        rows = {entry.post_id: entry.post for entry in entries}
+        for posts in self.hot_feeds():
+            for post in self._window(
+                posts, self.key, values, direction, stop
+            ):
+                rows.setdefault(post.id, post)
+        return sorted(
+            rows.values(),
+            key=self._key_values,
+            reverse=direction == NEXT
+        )[offset:stop]
@@ -0,0 +1,317 @@
+"""Перенос записей между сайтами в NDJSON или CSV с картинками
+в каталоге или tar-архиве: import_posts и export_posts."""
+import csv
+import gzip
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils._os import safe_join
+from django.utils.dateparse import parse_datetime
+
+from . import feed_cache, search, stats, thumbnails
+from .models import AuthorStats, Follow, Post, TimelineEntry
+
+FIELDS = ('text', 'pub_date', 'author', 'group', 'image')
+FORMATS = ('ndjson', 'csv')
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz')
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.endswith('.csv') else 'ndjson'
+
+
+@contextmanager
+def open_stream(path, mode, default):
+    """Файл (в том числе .gz) или ``default`` для пути ``-``."""
+    if path == '-':
+        yield default
+        return
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, mode + 't', encoding='utf-8', newline='') as stream:
+        yield stream
+
+
+def read_records(stream, fmt, skip):
+    """Записи из потока по одной: (номер строки, словарь).
+
+    Строку, которая не разбирается, получает ``skip(номер, ошибка)``,
+    и чтение идёт дальше.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as error:
+                # Номер строки ридер сдвигает только после разбора
+                skip(reader.line_num + 1, f'неверная строка CSV: {error}')
+                continue
+            yield reader.line_num, row
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            skip(number, f'неверный JSON: {error}')
+            continue
+        yield number, record
+
+
+class RecordWriter:
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.csv = None
+        if fmt == 'csv':
+            self.csv = csv.DictWriter(
+                stream, FIELDS, lineterminator='\n'
+            )
+            self.csv.writeheader()
+
+    def write(self, record):
+        if self.csv is not None:
+            self.csv.writerow(record)
+        else:
+            self.stream.write(
+                json.dumps(record, ensure_ascii=False) + '\n'
+            )
+
+
+def parse_pub_date(value):
+    if not value:
+        return timezone.now()
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f'Неверная дата: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def bulk_create_dated(model, objects, *fields):
+    """bulk_create с датами ``fields`` из объектов, а не от auto_now_add.
+
+    Поле модели не переключается: при вставке auto_now_add ставит
+    текущее время, а даты объектов пишутся вторым UPDATE по id, как
+    в comment_buffer.write.
+    """
+    objects = list(objects)
+    dates = [[getattr(obj, field) for field in fields] for obj in objects]
+    with transaction.atomic():
+        after = None
+        if not connection.features.can_return_ids_from_bulk_insert and any(
+            obj.pk is None for obj in objects
+        ):
+            # Транзакция держит блокировку записи (BEGIN IMMEDIATE):
+            # строки после последнего id — наши, в порядке вставки
+            after = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        model.objects.bulk_create(objects)
+        if after is not None:
+            ids = model.objects.filter(pk__gt=after).order_by(
+                'pk'
+            ).values_list('pk', flat=True)
+            for obj, pk in zip(objects, ids):
+                obj.pk = pk
+        for obj, values in zip(objects, dates):
+            for field, value in zip(fields, values):
+                setattr(obj, field, value)
+        model.objects.bulk_update(objects, fields)
+    return objects
+
+
+class ImageSource:
+    """Картинки для импорта из каталога или tar-архива.
+
+    Архив читается одним проходом при открытии: файлы сразу ложатся
+    в хранилище записей (ContentAddressedStorage), в памяти остаётся
+    только соответствие имён. Из каталога файл сохраняется при первой
+    ссылке на него.
+    """
+
+    def __init__(self, path):
+        self.storage = Post._meta.get_field('image').storage
+        self.directory = None
+        self.saved = {}
+        if os.path.isdir(path):
+            self.directory = path
+            return
+        with tarfile.open(path, 'r|*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                # Хранилище хэширует файл и перематывает его, а член
+                # потокового архива читается только вперёд
+                with tempfile.SpooledTemporaryFile() as file:
+                    shutil.copyfileobj(archive.extractfile(member), file)
+                    self.saved[member.name] = self._save(member.name, file)
+
+    def _save(self, name, file):
+        return self.storage.save(
+            'posts/' + os.path.basename(name), File(file, name)
+        )
+
+    def get(self, name):
+        """Имя в хранилище для ``name`` из записи или None."""
+        if name in self.saved or self.directory is None:
+            return self.saved.get(name)
+        try:
+            path = safe_join(self.directory, name)
+        except ValueError:
+            return None
+        if not os.path.isfile(path):
+            self.saved[name] = None
+            return None
+        with open(path, 'rb') as file:
+            self.saved[name] = self._save(name, file)
+        return self.saved[name]
+
+
+class ImageSink:
+    """Картинки экспорта: копии файлов хранилища в каталог или tar."""
+
+    def __init__(self, path):
+        self.storage = Post._meta.get_field('image').storage
+        self.directory = None
+        self.archive = None
+        self.written = set()
+        if path.endswith(TAR_SUFFIXES):
+            mode = 'w' if path.endswith('.tar') else 'w:gz'
+            self.archive = tarfile.open(path, mode)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.directory = path
+
+    def add(self, name):
+        if not name or name in self.written:
+            return
+        self.written.add(name)
+        if not self.storage.exists(name):
+            return
+        with self.storage.open(name) as file:
+            if self.archive is not None:
+                info = tarfile.TarInfo(name)
+                info.size = self.storage.size(name)
+                self.archive.addfile(info, file)
+                return
+            path = safe_join(self.directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as target:
+                for chunk in file.chunks():
+                    target.write(chunk)
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+
+def export_records(chunk_size):
+    """Записи в порядке id; таблица читается курсором по частям."""
+    posts = Post.objects.order_by('id').values_list(
+        'text', 'pub_date', 'author__username', 'group__slug', 'image'
+    )
+    for text, pub_date, author, group, image in posts.iterator(
+        chunk_size=chunk_size
+    ):
+        yield {
+            'text': text,
+            'pub_date': pub_date.isoformat(),
+            'author': author,
+            'group': group or '',
+            'image': image or '',
+        }
+
+
+def last_post_id():
+    return Post.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+def _fan_out(posts):
+    """Раскладывает импортированные записи по лентам подписчиков.
+
+    Возвращает id читателей, чьи ленты изменились.
+    """
+    author_ids = {post.author_id for post in posts}
+    hot = set(AuthorStats.objects.filter(
+        user_id__in=author_ids,
+        follower_count__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).values_list('user_id', flat=True))
+    followers = {}
+    for author_id, user_id in Follow.objects.filter(
+        author_id__in=author_ids - hot
+    ).values_list('author_id', 'user_id').iterator():
+        followers.setdefault(author_id, []).append(user_id)
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post.id,
+                author_id=post.author_id,
+                pub_date=post.pub_date
+            )
+            for post in posts
+            for user_id in followers.get(post.author_id, ())
+        ),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    return {user_id for users in followers.values() for user_id in users}
+
+
+def finish_import(after_id, batch_size):
+    """То, что при bulk_create не сделали сигналы записей.
+
+    Новые записи — все с id больше ``after_id``: они читаются пачками
+    по id, попадают в поиск, ленты подписок и очередь миниатюр, затем
+    пересчитываются счётчики авторов и групп и сбрасываются версии лент.
+    """
+    authors, groups, readers = set(), set(), set()
+    images = set()
+    last_id = after_id
+    total = 0
+    while True:
+        batch = list(
+            Post.objects.filter(id__gt=last_id).order_by('id').only(
+                'text', 'pub_date', 'author', 'group', 'image',
+                'image_manifest'
+            )[:batch_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+        total += len(batch)
+        search.backend().index_many(map(search.post_document, batch))
+        readers |= _fan_out(batch)
+        for post in batch:
+            authors.add(post.author_id)
+            if post.group_id is not None:
+                groups.add(post.group_id)
+            if post.image and not post.image_manifest:
+                images.add(post.image.name)
+    thumbnails.enqueue(sorted(images))
+    author_list = sorted(authors)
+    for start in range(0, len(author_list), batch_size):
+        stats.recount(author_list[start:start + batch_size])
+    group_list = sorted(groups)
+    for start in range(0, len(group_list), batch_size):
+        stats.recount_groups(group_list[start:start + batch_size])
+    feed_cache.bump(
+        feed_cache.GLOBAL,
+        *map(feed_cache.group, groups),
+        *map(feed_cache.author, authors),
+        *map(feed_cache.follower, readers)
+    )
+    return total
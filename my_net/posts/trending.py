@@ -0,0 +1,130 @@
+"""Лента «Популярное»: записи по рейтингу охвата автора и комментариев,
+который затухает вдвое за TRENDING_HALF_LIFE секунд."""
+import math
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import AuthorStats, Post, PostScore, TrendingEpoch
+
+EPOCH_ID = 1
+# Столько периодов полураспада без decay_trending рейтинги выдерживают
+# в масштабе эпохи; дальше её сдвигает сама запись
+MAX_EXPONENT = 32
+
+
+def _epoch():
+    """Строка эпохи, заблокированная до конца транзакции."""
+    epoch, _ = TrendingEpoch.objects.select_for_update().get_or_create(
+        pk=EPOCH_ID, defaults={'tick': time.time()}
+    )
+    return epoch
+
+
+def _exponent(tick, now):
+    return max(now - tick, 0) / settings.TRENDING_HALF_LIFE
+
+
+def _tick(now):
+    """Момент эпохи без блокировки; при давней эпохе сдвигает её."""
+    tick = TrendingEpoch.objects.filter(pk=EPOCH_ID).values_list(
+        'tick', flat=True
+    ).first()
+    if tick is not None and _exponent(tick, now) <= MAX_EXPONENT:
+        return tick
+    with transaction.atomic():
+        # Проверка под блокировкой: сдвиг делает только первый
+        epoch = _epoch()
+        if _exponent(epoch.tick, now) > MAX_EXPONENT:
+            decay()
+            epoch.refresh_from_db()
+        return epoch.tick
+
+
+def add(weights):
+    """Прибавляет веса ``{post_id: вес}`` к рейтингам записей.
+
+    Недостающие строки создаются нулевыми, затем записи с одинаковым
+    весом сдвигаются одним UPDATE. Эпоху запись не блокирует: её
+    сдвигает только decay() в своей транзакции.
+    """
+    weights = {
+        post_id: weight for post_id, weight in weights.items() if weight > 0
+    }
+    if not weights:
+        return
+    groups = defaultdict(list)
+    for post_id, weight in weights.items():
+        groups[weight].append(post_id)
+    now = time.time()
+    # Рейтинги хранятся в масштабе момента эпохи: новое слагаемое
+    # заранее умножается на рост с тех пор, decay() сдвигает эпоху
+    scale = 2 ** _exponent(_tick(now), now)
+    with transaction.atomic():
+        PostScore.objects.bulk_create(
+            (PostScore(post_id=post_id) for post_id in weights),
+            ignore_conflicts=True
+        )
+        for weight, post_ids in groups.items():
+            PostScore.objects.filter(post_id__in=post_ids).update(
+                score=F('score') + weight * scale
+            )
+
+
+def add_comments(post_ids):
+    """Комментарии к записям: id записи по разу на комментарий."""
+    add({
+        post_id: count * settings.TRENDING_COMMENT_WEIGHT
+        for post_id, count in Counter(post_ids).items()
+    })
+
+
+def add_post(post):
+    """Новая запись: стартовый рейтинг по охвату автора."""
+    followers = AuthorStats.objects.filter(
+        user_id=post.author_id
+    ).values_list('follower_count', flat=True).first() or 0
+    add({post.id: settings.TRENDING_REACH_WEIGHT * math.log1p(followers)})
+
+
+def decay(batch_size=None):
+    """Затухание всей таблицы; возвращает (обновлено, удалено).
+
+    Строки обновляются по диапазонам id пачками по ``batch_size``
+    в одной транзакции со сдвигом эпохи.
+    """
+    batch_size = batch_size or settings.TRENDING_BATCH_SIZE
+    scores = PostScore.objects.order_by('post_id')
+    updated = 0
+    last_id = 0
+    with transaction.atomic():
+        epoch = _epoch()
+        now = time.time()
+        factor = 2 ** -_exponent(epoch.tick, now)
+        while True:
+            bound = list(scores.filter(post_id__gt=last_id).values_list(
+                'post_id', flat=True
+            )[batch_size - 1:batch_size])
+            batch = scores.filter(post_id__gt=last_id)
+            if bound:
+                batch = batch.filter(post_id__lte=bound[0])
+            updated += batch.update(score=F('score') * factor)
+            if not bound:
+                break
+            last_id = bound[0]
+        removed, _ = PostScore.objects.filter(
+            score__lt=settings.TRENDING_MIN_SCORE
+        ).delete()
+        epoch.tick = now
+        epoch.save(update_fields=['tick'])
+    return updated, removed
+
+
+def feed():
+    """Первые TRENDING_SIZE записей по рейтингу."""
+    return Post.objects.for_feed().filter(
+        trending__isnull=False
+    ).order_by('-trending__score')[:settings.TRENDING_SIZE]
@@ -0,0 +1,230 @@
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import (
+    TemporaryUploadedFile, UploadedFile
+)
+from django.core.files.uploadhandler import (
+    FileUploadHandler, StopFutureHandlers
+)
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+from PIL import Image, ImageOps, ImageSequence
+
+# Форматы, в которых картинка хранится как есть; остальные — PNG
+KEPT_FORMATS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'GIF': '.gif',
+    'WEBP': '.webp',
+}
+# Служебные поля заголовка, с которыми исходник не пересохраняется;
+# остальные (EXIF, XMP, комментарии, текст PNG) удаляются пересохранением
+TECHNICAL_INFO = {
+    'adobe', 'adobe_transform', 'background', 'dpi', 'duration',
+    'extension', 'gamma', 'icc_profile', 'interlace', 'jfif',
+    'jfif_density', 'jfif_unit', 'jfif_version', 'loop', 'progression',
+    'progressive', 'srgb', 'transparency', 'version',
+}
+# Что переносится в пересохранённую картинку
+KEPT_INFO = ('icc_profile', 'transparency')
+# Временные файлы лежат рядом с MEDIA_ROOT: хранилище переносит их на
+# место переименованием, а не копией
+TEMP_DIR = '.uploads'
+BAD_IMAGE = 'Загрузите правильное изображение'
+
+
+class RejectedImage(UploadedFile):
+    """Картинка, отклонённая при загрузке; поле формы покажет ``error``."""
+
+    def __init__(self, name, error):
+        # Имя нужно, иначе пустой файл считается «не загружен»
+        super().__init__(io.BytesIO(), name or 'image', size=0)
+        self.error = error
+
+
+class ImageUpload(TemporaryUploadedFile):
+    """Загруженная картинка во временном файле под MEDIA_ROOT."""
+
+    def __init__(self, name):
+        directory = os.path.join(settings.MEDIA_ROOT, TEMP_DIR)
+        os.makedirs(directory, exist_ok=True)
+        file = tempfile.NamedTemporaryFile(
+            suffix='.upload' + os.path.splitext(name)[1], dir=directory
+        )
+        UploadedFile.__init__(self, file, name, None, 0, None)
+
+
+def _limit_error(width, height):
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        return (
+            f'Картинка {width}×{height} слишком большая: не больше '
+            f'{settings.IMAGE_UPLOAD_MAX_PIXELS} пикселей'
+        )
+    return None
+
+
+def _file_name(name, fmt):
+    root, extension = os.path.splitext(name)
+    if extension.lower() not in (KEPT_FORMATS[fmt], '.jpeg'):
+        return root + KEPT_FORMATS[fmt]
+    return name
+
+
+def _animated(image):
+    return getattr(image, 'is_animated', False)
+
+
+def _needs_saving(image):
+    if image.format not in KEPT_FORMATS:
+        return True
+    if not set(image.info) <= TECHNICAL_INFO:
+        return True
+    # Анимацию не уменьшаем: пришлось бы пересобирать все кадры
+    side = settings.IMAGE_UPLOAD_MAX_SIDE
+    return not _animated(image) and max(image.size) > side
+
+
+def _save(image, file_name):
+    """Пересохраняет без метаданных: повёрнутой по EXIF и уменьшенной."""
+    fmt = image.format if image.format in KEPT_FORMATS else 'PNG'
+    options = {key: image.info[key] for key in KEPT_INFO if key in image.info}
+    if _animated(image) and fmt != 'JPEG':
+        frames = [frame.copy() for frame in ImageSequence.Iterator(image)]
+        image = frames[0]
+        options.update(
+            save_all=True,
+            append_images=frames[1:],
+            duration=[frame.info.get('duration', 0) for frame in frames],
+            loop=image.info.get('loop', 0),
+            # Иначе GIF возьмёт комментарий из первого кадра
+            comment=b''
+        )
+    else:
+        image = ImageOps.exif_transpose(image)
+        side = settings.IMAGE_UPLOAD_MAX_SIDE
+        if max(image.size) > side:
+            image.thumbnail((side, side), Image.LANCZOS)
+        if fmt == 'JPEG':
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            options.update(
+                quality=settings.IMAGE_UPLOAD_QUALITY,
+                optimize=True,
+                progressive=True
+            )
+    image.info = {}
+    upload = ImageUpload(_file_name(file_name, fmt))
+    image.save(upload.file, fmt, **options)
+    upload.size = upload.tell()
+    upload.content_type = Image.MIME[fmt]
+    upload.seek(0)
+    return upload
+
+
+def _finish(upload, file_name):
+    """Исходник, если он годится как есть, иначе пересохранённая копия."""
+    with Image.open(upload.temporary_file_path()) as image:
+        if _needs_saving(image):
+            saved = _save(image, file_name)
+            upload.close()
+            return saved
+        upload.name = _file_name(file_name, image.format)
+        upload.content_type = Image.MIME[image.format]
+    upload.seek(0)
+    return upload
+
+
+class BoundedImageUploadHandler(FileUploadHandler):
+    """Потоковая загрузка картинок записей с ранней проверкой.
+
+    Файл из поля IMAGE_UPLOAD_FIELD пишется во временный файл под
+    MEDIA_ROOT; формат и размеры проверяются по заголовку, как только
+    он прочитан, без декодирования пикселей. Файл больше
+    IMAGE_UPLOAD_MAX_BYTES дальше не пишется, а тело запроса, заведомо
+    превышающее предел, не читается вовсе.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        limit = (
+            settings.IMAGE_UPLOAD_MAX_BYTES
+            + settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        )
+        if content_length is None or content_length <= limit:
+            return None
+        error = (
+            'Запрос слишком большой: картинка должна быть не больше '
+            f'{settings.IMAGE_UPLOAD_MAX_BYTES // 2 ** 20} МБ'
+        )
+        files = MultiValueDict({
+            settings.IMAGE_UPLOAD_FIELD: [RejectedImage(None, error)]
+        })
+        return QueryDict(mutable=True), files
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.activated = field_name == settings.IMAGE_UPLOAD_FIELD
+        if not self.activated:
+            return
+        self.upload = ImageUpload(self.file_name)
+        self.error = None
+        self.header_checked = False
+        raise StopFutureHandlers()
+
+    def _reject(self, error):
+        self.error = error
+        self.upload.close()
+        self.upload = None
+
+    def _check_header(self, received):
+        self.upload.flush()
+        try:
+            with Image.open(self.upload.temporary_file_path()) as image:
+                size = image.size
+        except Image.DecompressionBombError:
+            self._reject(BAD_IMAGE)
+            return
+        except Exception:
+            # Заголовок ещё не дочитан — ждём следующего куска
+            if received > settings.IMAGE_UPLOAD_HEADER_BYTES:
+                self._reject(BAD_IMAGE)
+            return
+        self.header_checked = True
+        error = _limit_error(*size)
+        if error:
+            self._reject(error)
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.activated:
+            return raw_data
+        if self.upload is None:
+            # Остаток отклонённого файла пропускаем
+            return None
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self._reject(
+                'Файл слишком большой: не больше '
+                f'{settings.IMAGE_UPLOAD_MAX_BYTES // 2 ** 20} МБ'
+            )
+            return None
+        self.upload.write(raw_data)
+        if not self.header_checked:
+            self._check_header(start + len(raw_data))
+        return None
+
+    def file_complete(self, file_size):
+        if not self.activated:
+            return None
+        if self.upload is None:
+            return RejectedImage(self.file_name, self.error)
+        upload, self.upload = self.upload, None
+        upload.size = file_size
+        try:
+            if not self.header_checked:
+                raise ValueError('нет заголовка')
+            return _finish(upload, self.file_name)
+        except Exception:
+            upload.close()
+            return RejectedImage(self.file_name, BAD_IMAGE)
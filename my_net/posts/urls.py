@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 app_name = 'posts'
 
@@ -10,6 +10,16 @@ urlpatterns = [
         views.index,
         name='index'
     ),
+    path(
+        'trending/',
+        views.trending_posts,
+        name='trending'
+    ),
+    path(
+        'groups/',
+        views.group_index,
+        name='groups'
+    ),
     path(
         'group/<slug:slug>/',
         views.group_posts,
@@ -25,6 +35,11 @@ urlpatterns = [
         views.add_comment,
         name='add_comment'
     ),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path(
         'posts/<int:post_id>/',
         views.post_detail,
@@ -40,11 +55,41 @@ urlpatterns = [
         views.post_edit,
         name='post_edit'
     ),
+    path(
+        'search/',
+        views.search_posts,
+        name='search'
+    ),
     path(
         'follow/',
         views.follow_index,
         name='follow_index'
     ),
+    path(
+        'api/posts/',
+        api.index,
+        name='api_index'
+    ),
+    path(
+        'api/group/<slug:slug>/',
+        api.group_posts,
+        name='api_group'
+    ),
+    path(
+        'api/profile/<str:username>/',
+        api.profile,
+        name='api_profile'
+    ),
+    path(
+        'api/posts/<int:post_id>/',
+        api.post_detail,
+        name='api_post_detail'
+    ),
+    path(
+        'api/follow/',
+        api.follow_index,
+        name='api_follow_index'
+    ),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
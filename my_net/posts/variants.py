@@ -0,0 +1,110 @@
+import hashlib
+import io
+import json
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# (формат Pillow, MIME-тип, расширение) от самого компактного к JPEG,
+# который понимают все браузеры и который идёт в <img src>
+FORMATS = (
+    ('AVIF', 'image/avif', 'avif'),
+    ('WEBP', 'image/webp', 'webp'),
+    ('JPEG', 'image/jpeg', 'jpg'),
+)
+
+
+def available_formats():
+    """Форматы, которые умеет сохранять установленный Pillow."""
+    Image.init()
+    return [fmt for fmt in FORMATS if fmt[0] in Image.SAVE]
+
+
+def _directory(source):
+    digest = hashlib.sha1(source.encode()).hexdigest()
+    return f'variants/{digest[:2]}/{digest}'
+
+
+def variant_name(source, width, extension):
+    return f'{_directory(source)}/{width}.{extension}'
+
+
+def _open(source):
+    with default_storage.open(source) as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def _save(image, name, fmt):
+    # Имена детерминированы: готовый файл не пересохраняем, иначе
+    # хранилище добавит к имени суффикс
+    if default_storage.exists(name):
+        return
+    buffer = io.BytesIO()
+    image.save(
+        buffer, fmt,
+        quality=settings.IMAGE_VARIANT_QUALITY.get(fmt, 80),
+        optimize=fmt == 'JPEG',
+        progressive=fmt == 'JPEG'
+    )
+    default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def build(source):
+    """Строит варианты картинки и возвращает манифест.
+
+    Картинка декодируется один раз и обрезается по центру под
+    пропорции ленты в каждой ширине из IMAGE_VARIANT_WIDTHS, не шире
+    исходника (кроме самой узкой), в каждом доступном формате.
+    """
+    image = _open(source)
+    ratio_width, ratio_height = settings.IMAGE_VARIANT_RATIO
+    widths = sorted(settings.IMAGE_VARIANT_WIDTHS)
+    widths = [widths[0]] + [
+        width for width in widths[1:] if width <= image.width
+    ]
+    formats = available_formats()
+    sources = {mime: [] for _, mime, _ in formats}
+    for width in widths:
+        height = round(width * ratio_height / ratio_width)
+        resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        for fmt, mime, extension in formats:
+            name = variant_name(source, width, extension)
+            _save(resized, name, fmt)
+            sources[mime].append([width, name])
+    return {
+        'source': source,
+        'width': widths[-1],
+        'height': round(widths[-1] * ratio_height / ratio_width),
+        'sources': sources,
+    }
+
+
+def remove(source):
+    """Удаляет все варианты картинки ``source``."""
+    directory = _directory(source)
+    if not default_storage.exists(directory):
+        return
+    for name in default_storage.listdir(directory)[1]:
+        default_storage.delete(f'{directory}/{name}')
+
+
+def dumps(manifest):
+    return json.dumps(manifest, separators=(',', ':'))
+
+
+def loads(value):
+    """Манифест из поля записи; пустой или битый — None."""
+    if not value:
+        return None
+    try:
+        manifest = json.loads(value)
+    except ValueError:
+        return None
+    return manifest if isinstance(manifest, dict) else None
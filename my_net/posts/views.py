@@ -1,83 +1,232 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from django.urls import reverse_lazy
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.utils import timezone
-from django.views.generic.edit import CreateView
+from django.utils.http import urlencode
 
+from core import replicas
+
+from . import comment_buffer, feed_cache, search, trending
+from .conditional import conditional, make_etag, viewer_cache_control
 from .forms import PostForm, CommentForm
-from .mixins import AuthenticatedMixin
 from .models import Post, Group, Comment, Follow, User
+from .pagination import CursorPaginator, ThreadPaginator
+from .stats import stats_for
+from .timeline import TimelinePaginator
 
 
-def paginator_for_all_funcs(request, post_list):
-    paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+def paginator_for_all_funcs(request, post_list,
+                            paginator_class=CursorPaginator):
+    paginator = paginator_class(post_list, settings.POSTS_PER_PAGE)
+    page_obj = paginator.cursor_page(
+        request.GET.get('cursor'),
+        request.GET.get('page')
+    )
     return page_obj
 
 
+def _feed_metadata(request, *scopes):
+    """ETag и Last-Modified ленты без чтения её записей.
+
+    ETag собирается из версий лент feed_cache, вошедшего пользователя
+    (шапка и кнопки у него свои) и адреса страницы с курсором; дата —
+    время последнего сброса этих версий.
+    """
+    version = feed_cache.versions(*scopes)
+    # По ним AnonymousPageCacheMiddleware проверяет свежесть страницы
+    request.feed_scopes = scopes
+    request.feed_version = version
+    replicas.read_fresh(feed_cache.modified(version))
+    viewer = request.user.id if request.user.is_authenticated else ''
+    etag = make_etag(
+        settings.HTTP_CACHE_VERSION, viewer, version, request.get_full_path()
+    )
+    return etag, feed_cache.modified(version)
+
+
+def _lookup(request, queryset, **filters):
+    # Объект страницы читают и ETag, и сама view: один запрос на обоих
+    if not hasattr(request, '_feed_object'):
+        request._feed_object = queryset.filter(**filters).first()
+    if request._feed_object is None:
+        raise Http404
+    return request._feed_object
+
+
+def index_metadata(request):
+    return _feed_metadata(request, feed_cache.GLOBAL)
+
+
+@viewer_cache_control
+@conditional(index_metadata)
 def index(request):
     template = 'posts/index.html'
-    post_list = Post.objects.all()
+    post_list = Post.objects.for_feed()
     context = {
         'page_obj': paginator_for_all_funcs(request, post_list),
+        **feed_cache.context(feed_cache.GLOBAL),
     }
     return render(request, template, context)
 
 
+def _group(request, slug):
+    if not hasattr(request, '_feed_object'):
+        request._feed_object = feed_cache.group_by_slug(slug)
+    if request._feed_object is None:
+        raise Http404
+    return request._feed_object
+
+
+def group_metadata(request, slug):
+    group = _group(request, slug)
+    return _feed_metadata(request, feed_cache.group(group.id))
+
+
+@viewer_cache_control
+@conditional(group_metadata)
 def group_posts(request, slug):
     template = 'posts/group_list.html'
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.groups.all()
+    group = _group(request, slug)
+    # Страница — отрезок индекса (group, -pub_date, -id), без JOIN
+    # с группой: она уже есть из кэша
+    post_list = Post.objects.filter(group_id=group.id).for_feed()
     context = {
         'group': group,
         'page_obj': paginator_for_all_funcs(request, post_list),
+        **feed_cache.context(feed_cache.group(group.id)),
+    }
+    return render(request, template, context)
+
+
+def trending_posts(request):
+    """«Популярное»: готовый топ из таблицы рейтингов.
+
+    Рейтинги меняются с каждым комментарием, поэтому страница
+    кэшируется на TRENDING_CACHE_TIMEOUT секунд, а не по версиям лент.
+    """
+    template = 'posts/trending.html'
+    context = {
+        'posts': trending.feed(),
+        'trending_cache_timeout': settings.TRENDING_CACHE_TIMEOUT,
+    }
+    return render(request, template, context)
+
+
+def group_index(request):
+    """Каталог групп: самые наполненные первыми."""
+    template = 'posts/group_index.html'
+    groups = Group.objects.only(
+        *feed_cache.GROUP_FIELDS, 'post_count', 'last_activity'
+    ).order_by('-post_count', '-id')
+    paginator = CursorPaginator(
+        groups, settings.GROUPS_PER_PAGE, key=('post_count', 'id')
+    )
+    context = {
+        'page_obj': paginator.cursor_page(
+            request.GET.get('cursor'), request.GET.get('page')
+        ),
     }
     return render(request, template, context)
 
 
+def profile_metadata(request, username):
+    author = _lookup(
+        request, User.objects.select_related('stats'), username=username
+    )
+    scopes = [feed_cache.author(author.id)]
+    if request.user.is_authenticated:
+        # Кнопка «Подписаться/Отписаться» меняется вместе с подписками
+        scopes.append(feed_cache.follower(request.user.id))
+    return _feed_metadata(request, *scopes)
+
+
+@viewer_cache_control
+@conditional(profile_metadata)
 def profile(request, username):
     template = 'posts/profile.html'
-    user = get_object_or_404(User, username=username)
-    post_list = (user.posts.select_related('author').
-                 select_related('group').all())
+    user = _lookup(
+        request, User.objects.select_related('stats'), username=username
+    )
+    post_list = user.posts.for_feed()
     context = {
         'author': user,
         'page_obj': paginator_for_all_funcs(request, post_list),
-        'post_list': post_list
+        'post_count': stats_for(user).post_count,
+        **feed_cache.context(feed_cache.author(user.id)),
     }
     if request.user.is_authenticated:
-        authors = Follow.objects.filter(
-            user=request.user
-        ).values_list('author_id', flat=True)
-        if user.id in authors:
-            following = True
-        else:
-            following = False
+        following = Follow.objects.filter(
+            user=request.user,
+            author=user
+        ).exists()
         context.update({'following': following})
     return render(request, template, context)
 
 
+def comment_page(request, post_id):
+    comments = Comment.objects.filter(
+        post_id=post_id
+    ).select_related('author')
+    paginator = ThreadPaginator(comments, settings.COMMENTS_PER_PAGE)
+    return paginator.cursor_page(request.GET.get('cursor'))
+
+
+def more_comments_url(post_id, page):
+    if not page.next_cursor:
+        return None
+    url = reverse('posts:post_comments', kwargs={'post_id': post_id})
+    return f'{url}?{urlencode({"cursor": page.next_cursor})}'
+
+
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = Post.objects.get(id=post_id)
-    authors_posts = Post.objects.filter(author=post.author)
-    post_count = authors_posts.count()
+    post = get_object_or_404(Post.objects.for_feed(), id=post_id)
+    post_count = stats_for(post.author).post_count
     form = CommentForm()
-    comments = Comment.objects.filter(post_id=post_id)
+    comments = comment_page(request, post_id)
     context = {
         'post': post,
-        'authors_posts': authors_posts,
         'post_count': post_count,
         'form': form,
         'comments': comments,
+        'more_comments_url': more_comments_url(post_id, comments),
     }
+    if request.user.is_authenticated:
+        context['pending_comments'] = comment_buffer.pending(request, post)
     return render(request, template, context)
 
 
+def post_comments(request, post_id):
+    """Следующая страница комментариев: HTML-фрагмент в JSON."""
+    post = get_object_or_404(Post.objects.only('id'), id=post_id)
+    comments = comment_page(request, post_id)
+    html = render_to_string(
+        'includes/comment_list.html',
+        {'post': post, 'comments': comments},
+        request=request
+    )
+    return JsonResponse({
+        'html': html,
+        'next': more_comments_url(post_id, comments),
+    })
+
+
+def reply_parent(post, parent_id):
+    """Комментарий, на который отвечают, или None для новой ветки."""
+    if not parent_id.isdigit():
+        return None
+    parent = Comment.objects.filter(
+        post=post, id=parent_id
+    ).only('id', 'parent', 'path').first()
+    if parent is not None and parent.depth >= settings.COMMENT_MAX_DEPTH:
+        # Глубже не вкладываем: ответ встаёт рядом с parent
+        return parent.parent
+    return parent
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -86,25 +235,19 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        comment.parent = reply_parent(post, request.POST.get('parent', ''))
+        if settings.COMMENT_BUFFER:
+            comment_buffer.submit(request, comment)
+        else:
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
-# @login_required
-class PostCreate(CreateView, AuthenticatedMixin):
-    form_class = PostForm
-    template_name = 'posts/create_post.html'
-    success_url = reverse_lazy('index')
-
-
 @login_required
 def post_create(request):
     template = 'posts/create_post.html'
     if request.method == 'POST':
-        form = PostForm(
-            request.POST or None,
-            files=request.FILES or None
-        )
+        form = PostForm(request.POST, files=request.FILES)
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
@@ -127,8 +270,8 @@ def post_edit(request, post_id):
     if post.author == request.user:
         if request.method == 'POST':
             form = PostForm(
-                request.POST or None,
-                files=request.FILES or None,
+                request.POST,
+                files=request.FILES,
                 instance=post
             )
             if form.is_valid():
@@ -152,12 +295,30 @@ def post_edit(request, post_id):
 @login_required
 def follow_index(request):
     template = 'posts/follow.html'
-    follower_user = request.user
-    user_following_authors = Follow.objects.filter(
-        user=follower_user).values('author')
-    post_list = Post.objects.filter(author__in=user_following_authors)
+    page_obj = paginator_for_all_funcs(
+        request, request.user, TimelinePaginator
+    )
     context = {
-        'page_obj': paginator_for_all_funcs(request, post_list),
+        'page_obj': page_obj,
+        **feed_cache.context(
+            feed_cache.follower(request.user.id),
+            *map(feed_cache.author, page_obj.paginator.hot_author_ids)
+        ),
+    }
+    return render(request, template, context)
+
+
+def search_posts(request):
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    page_obj = paginator_for_all_funcs(
+        request, query, search.SearchPaginator
+    )
+    page_obj.object_list = search.attach(page_obj.object_list)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}),
     }
     return render(request, template, context)
 
@@ -0,0 +1,20 @@
+// Догружает комментарии записи страницами из posts:post_comments
+document.addEventListener('click', function (event) {
+  var button = event.target.closest('[data-more-comments]');
+  if (!button) {
+    return;
+  }
+  event.preventDefault();
+  fetch(button.dataset.moreComments, {credentials: 'same-origin'})
+    .then(function (response) { return response.json(); })
+    .then(function (data) {
+      document.getElementById('comments')
+        .insertAdjacentHTML('beforeend', data.html);
+      if (data.next) {
+        button.dataset.moreComments = data.next;
+        button.href = '?' + data.next.split('?')[1];
+      } else {
+        button.remove();
+      }
+    });
+});